@@ -0,0 +1,140 @@
+"""
+Inverted-file (IVF) approximate nearest-neighbour index, numpy only.
+
+Rows are clustered around coarse spherical k-means centroids. A query is
+compared to the centroids first and only the rows of the `nprobe` closest
+lists are scored exactly. Raising `nprobe` trades latency for recall; with
+`nprobe == n_lists` the search is exact.
+
+Files written next to the embeddings in the index directory:
+
+    ivf_centroids.npy  - float32 [n_lists x dims]
+    ivf_offsets.npy    - int64 [n_lists + 1], list boundaries into ivf_ids.npy
+    ivf_ids.npy        - int64 row ids grouped by list (ascending inside a list)
+"""
+
+import os
+import logging
+import numpy as np
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+IVF_CENTROIDS_FILE = "ivf_centroids.npy"
+IVF_OFFSETS_FILE = "ivf_offsets.npy"
+IVF_IDS_FILE = "ivf_ids.npy"
+
+# Below this many rows brute force is already fast, no ANN index is built
+EXACT_SEARCH_THRESHOLD = 20000
+DEFAULT_NPROBE = int(os.environ.get("PERSONA_INDEX_NPROBE", "8"))
+
+KMEANS_ITERATIONS = 20
+KMEANS_POINTS_PER_LIST = 64  # training sample size per centroid
+ASSIGN_CHUNK_ROWS = 65536
+
+
+def default_n_lists(rows: int) -> int:
+    """The usual sqrt heuristic: ~4*sqrt(N) lists of ~sqrt(N)/4 rows each."""
+    return max(1, int(4 * np.sqrt(rows)))
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def assign_lists(embeddings: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Nearest centroid (by dot product) for every row, in chunks to bound memory."""
+    labels = np.empty(len(embeddings), dtype=np.int64)
+    for start in range(0, len(embeddings), ASSIGN_CHUNK_ROWS):
+        chunk = np.asarray(embeddings[start:start + ASSIGN_CHUNK_ROWS], dtype=np.float32)
+        labels[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return labels
+
+
+def train_kmeans(
+    embeddings: np.ndarray,
+    n_lists: int,
+    iterations: int = KMEANS_ITERATIONS,
+    seed: int = 0,
+) -> np.ndarray:
+    """Spherical k-means on a random sample of the rows. Returns unit-norm centroids."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(embeddings), n_lists * KMEANS_POINTS_PER_LIST)
+    sample_rows = np.sort(rng.choice(len(embeddings), size=sample_size, replace=False))
+    sample = _normalize(np.asarray(embeddings[sample_rows], dtype=np.float32))
+
+    centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        labels = np.argmax(sample @ centroids.T, axis=1)
+
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        counts = np.bincount(labels, minlength=n_lists)
+
+        # Re-seed empty lists from random sample points
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()), replace=False)]
+
+        centroids = _normalize(sums)
+
+    return centroids.astype(np.float32)
+
+
+def build_ivf(
+    embeddings: np.ndarray,
+    n_lists: Optional[int] = None,
+    seed: int = 0,
+) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+    """
+    Trains centroids and assigns every row.
+    Returns the arrays to save (by file name) and the manifest entry.
+    """
+    n_lists = min(n_lists or default_n_lists(len(embeddings)), len(embeddings))
+    logger.info(f"Building IVF index: {len(embeddings)} rows -> {n_lists} lists...")
+
+    centroids = train_kmeans(embeddings, n_lists, seed=seed)
+    labels = assign_lists(embeddings, centroids)
+
+    order = np.argsort(labels, kind="stable")
+    offsets = np.zeros(n_lists + 1, dtype=np.int64)
+    np.cumsum(np.bincount(labels, minlength=n_lists), out=offsets[1:])
+
+    sizes = np.diff(offsets)
+    logger.info(f"IVF lists: min={sizes.min()} median={int(np.median(sizes))} max={sizes.max()} rows")
+
+    files = {
+        IVF_CENTROIDS_FILE: centroids,
+        IVF_OFFSETS_FILE: offsets,
+        IVF_IDS_FILE: order.astype(np.int64),
+    }
+    return files, {"type": "ivf", "n_lists": int(n_lists)}
+
+
+class IVFIndex:
+    """Read side of the IVF files. Ids are memory-mapped, centroids are tiny."""
+
+    def __init__(self, index_dir: str):
+        self.centroids = np.load(os.path.join(index_dir, IVF_CENTROIDS_FILE))
+        self.offsets = np.load(os.path.join(index_dir, IVF_OFFSETS_FILE))
+        self.ids = np.load(os.path.join(index_dir, IVF_IDS_FILE), mmap_mode="r")
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    def candidates(self, query: np.ndarray, nprobe: int = DEFAULT_NPROBE) -> np.ndarray:
+        """Sorted row ids of the `nprobe` lists whose centroids are closest to the query."""
+        nprobe = max(1, min(nprobe, self.n_lists))
+        centroid_scores = self.centroids @ query
+        probes = np.argpartition(centroid_scores, -nprobe)[-nprobe:]
+        rows = np.concatenate([self.ids[self.offsets[p]:self.offsets[p + 1]] for p in probes])
+        # Ascending ids turn the gather from the mmap into a forward scan
+        rows.sort()
+        return rows
+
+    def close(self):
+        """Drops the mapping of the id lists."""
+        self.ids = None
@@ -4,7 +4,7 @@ Replaces Streamlit with SSE-based real-time streaming
 """
 import asyncio
 import json
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Dict, Optional
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, HTTPException
@@ -14,6 +14,10 @@ from pydantic import BaseModel
 
 from main import app as graph_app
 from models import BusinessIdea
+import index_registry
+from config import MODEL_PROFILES, ROLE_PROFILES, configure_proxy
+import llm_cache
+import llm_scheduler
 
 
 class ValidationRequest(BaseModel):
@@ -25,12 +29,18 @@ class ValidationRequest(BaseModel):
     enable_simulation: bool = True
     enable_critic: bool = True
     use_fast_model: bool = False
+    # Role -> profile, e.g. {"critic": "fast"}; roles left out follow use_fast_model
+    model_profiles: Optional[Dict[str, str]] = None
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager for startup/shutdown."""
     print("🚀 AI Unicorn Validator API starting...")
+    # Proxy env vars must be in place before the first provider call (LLM clients are built lazily)
+    configure_proxy()
+    # Open the persona index once; recruiter runs share it from the registry
+    await asyncio.to_thread(index_registry.preload)
     yield
     print("👋 API shutting down...")
 
@@ -52,6 +62,24 @@ app.add_middleware(
 )
 
 
+# Nodes whose LLM output is forwarded token by token as "<node>.delta" events.
+# Simulation interviews run in parallel and would interleave, so they only send results.
+DELTA_NODES = ("generator", "researcher", "analyst", "critic")
+
+
+def delta_text(chunk) -> str:
+    """Text of a streamed message chunk: content blocks plus partial tool-call JSON (structured output)."""
+    content = chunk.content
+    if isinstance(content, list):
+        content = "".join(
+            block if isinstance(block, str) else block.get("text", "")
+            for block in content
+            if isinstance(block, str) or block.get("type") == "text"
+        )
+    args = "".join(tc.get("args") or "" for tc in getattr(chunk, "tool_call_chunks", None) or [])
+    return (content or "") + args
+
+
 def serialize_event(event_type: str, data: dict) -> str:
     """Format event for SSE."""
     json_data = json.dumps(data, ensure_ascii=False, default=str)
@@ -74,6 +102,7 @@ async def stream_validation(request: ValidationRequest) -> AsyncGenerator[str, N
         "enable_simulation": request.enable_simulation,
         "enable_critic": request.enable_critic,
         "use_fast_model": request.use_fast_model,
+        "model_profiles": request.model_profiles,
         "num_personas": request.num_personas,
         "interview_iterations": request.interview_iterations,
         "current_interview_cycle": 0
@@ -84,10 +113,23 @@ async def stream_validation(request: ValidationRequest) -> AsyncGenerator[str, N
     try:
         event_count = 0
         
-        for event in graph_app.stream(
+        # astream runs the async nodes on this event loop, so other requests keep being served.
+        # "messages" adds the LLM tokens as they arrive, "updates" the node results as before.
+        async for mode, payload in graph_app.astream(
             initial_state, 
-            config={"recursion_limit": request.max_iterations * 2 + 10}
+            config={"recursion_limit": request.max_iterations * 2 + 10},
+            stream_mode=["updates", "messages"]
         ):
+            if mode == "messages":
+                chunk, metadata = payload
+                node = metadata.get("langgraph_node")
+                text = delta_text(chunk) if node in DELTA_NODES else ""
+                if text:
+                    # message_id changes when a node retries, so clients can start over
+                    yield serialize_event(f"{node}.delta", {"message_id": chunk.id, "text": text})
+                continue
+            
+            event = payload
             event_count += 1
             event_keys = list(event.keys())
             node_name = event_keys[0] if event_keys else "unknown"
@@ -199,6 +241,11 @@ async def validate_idea(request: ValidationRequest):
     """
     Start idea validation and stream events via SSE.
     """
+    for role, profile in (request.model_profiles or {}).items():
+        if role not in ROLE_PROFILES:
+            raise HTTPException(status_code=400, detail=f"Unknown role '{role}'. Known: {', '.join(ROLE_PROFILES)}")
+        if profile not in MODEL_PROFILES:
+            raise HTTPException(status_code=400, detail=f"Unknown model profile '{profile}'. Known: {', '.join(MODEL_PROFILES)}")
     return StreamingResponse(
         stream_validation(request),
         media_type="text/event-stream",
@@ -216,6 +263,27 @@ async def health_check():
     return {"status": "ok", "service": "AI Unicorn Validator API"}
 
 
+@app.get("/api/models")
+async def list_models():
+    """Model profiles a request can pick per role (model_profiles), and the default per role."""
+    return {
+        "profiles": {name: {"provider": p["provider"], "model": p["model"]} for name, p in MODEL_PROFILES.items()},
+        "roles": ROLE_PROFILES,
+    }
+
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """LLM response cache hit/miss counters (per node) since startup."""
+    return llm_cache.get_cache().stats()
+
+
+@app.get("/api/scheduler/stats")
+async def scheduler_stats():
+    """LLM call queue waits per priority lane, and slots / rate limits per model and provider."""
+    return llm_scheduler.get_scheduler().stats()
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -1,107 +1,384 @@
 """
-Build Vector Index for Personas using Google Gemini Embeddings.
+Build Vector Index for Personas.
+Embeddings come from Google Gemini or, with --backend hashing, from the local
+hashed n-gram provider (no network access needed, see embeddings.py).
+
+Records are streamed from the input (JSONL, a directory of JSONL shards or a
+legacy JSON array, see record_stream.py) and written to the index batch by
+batch, so memory stays flat no matter how many personas are indexed.
+
+Builds are incremental: every persona text is content-hashed, vectors of
+unchanged texts are taken from the existing index, and each embedded batch is
+checkpointed to `<output>.build/` as it completes. A rerun (after a crash or
+with a grown corpus) only embeds what is not in either place.
+
+Every build is written to a new version directory under the output root and
+published by atomically switching its CURRENT pointer (see index_versions.py),
+so a running API never reads a half-written index.
+
+API embedding requests run concurrently, paced by a requests/tokens-per-minute
+limiter (see rate_limiter.py) that backs off when the provider answers 429.
 """
 
 import os
 import json
 import time
+import shutil
 import logging
 import numpy as np
 import google.generativeai as genai
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 from dotenv import load_dotenv
 
+from persona_index import IndexWriter, read_manifest, text_hash
+from sharded_index import ShardedIndexWriter, open_index
+from index_versions import new_version_dir, publish, resolve_index_dir
+from embeddings import create_provider, DEFAULT_BACKEND
+from rate_limiter import RateLimiter, estimate_tokens, is_rate_limit_error
+from record_stream import read_records, batched, run_ordered
+import embedding_cache
+
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 BATCH_SIZE = 100
-EMBEDDING_MODEL = "models/text-embedding-004" # Or "models/embedding-001"
+# API quota and parallelism for embedding requests (one request = one batch)
+EMBEDDING_CONCURRENCY = int(os.environ.get("EMBEDDING_CONCURRENCY", "8"))
+EMBEDDING_RPM = float(os.environ.get("EMBEDDING_RPM", "1500"))
+EMBEDDING_TPM = float(os.environ.get("EMBEDDING_TPM", "0")) or None
+MAX_RETRIES = 6
+PROGRESS_INTERVAL_SECONDS = 10.0
+CHECKPOINT_SUFFIX = ".build"
+CHECKPOINT_META_FILE = "build.json"
+
+
+def persona_text(entry: Dict[str, Any]) -> str:
+    """The text embedded and stored for one dataset record."""
+    return f"Persona: {entry.get('input persona', '')}\nSynthesized Text: {entry.get('synthesized text', '')}"
 
-def build_index(input_file: str, output_file: str, api_key: str, limit: int = None):
+
+def iter_texts(input_file: str, limit: Optional[int] = None) -> Iterator[str]:
+    return (persona_text(entry) for entry in read_records(input_file, limit))
+
+
+def _signature(provider) -> Dict[str, Any]:
+    """What must match for a stored vector to be reusable."""
+    return {
+        "embedding_backend": provider.backend,
+        "embedding_model": provider.model,
+        "embedding_params": provider.params(),
+    }
+
+
+class _ReusableVectors:
     """
-    Generates embeddings for personas and saves them.
+    Vectors from earlier builds, looked up by text hash. Sources (the previous
+    index, checkpoint chunks) stay memory-mapped; only their sorted hashes are
+    held in memory.
     """
-    genai.configure(api_key=api_key)
-    
-    logger.info(f"Loading {input_file}...")
-    with open(input_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+
+    def __init__(self):
+        self._sources: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        self.rows = 0
+
+    def add(self, hashes: np.ndarray, matrix: np.ndarray):
+        order = np.argsort(hashes, kind="stable")
+        self._sources.append((hashes[order], order, matrix))
+        self.rows += len(hashes)
+
+    def lookup(self, hashes: List[bytes]) -> List[Optional[np.ndarray]]:
+        found: List[Optional[np.ndarray]] = [None] * len(hashes)
+        wanted = np.array(hashes, dtype="S32")
+        for sorted_hashes, order, matrix in self._sources:
+            positions = np.searchsorted(sorted_hashes, wanted)
+            positions[positions == len(sorted_hashes)] = 0
+            hits = (sorted_hashes[positions] == wanted) if len(sorted_hashes) else np.zeros(len(wanted), bool)
+            for i in np.flatnonzero(hits):
+                if found[i] is None:
+                    found[i] = matrix[order[positions[i]]]
+        return found
+
+
+def _load_index_vectors(output_dir: str, signature: Dict[str, Any], store: _ReusableVectors):
+    """Adds the live index, if it was built with the same provider."""
+    try:
+        manifest = read_manifest(resolve_index_dir(output_dir))
+    except (FileNotFoundError, ValueError):
+        return
+    stored = {
+        "embedding_backend": manifest.get("embedding_backend", "gemini"),
+        "embedding_model": manifest.get("embedding_model"),
+        "embedding_params": manifest.get("embedding_params") or {},
+    }
+    if stored != signature:
+        logger.info(f"Existing index in {output_dir} used another embedding setup, not reusing its vectors.")
+        return
+
+    # The mapping stays valid while the new index replaces the files (rename, not overwrite)
+    index = open_index(output_dir)
+    try:
+        for part in getattr(index, "shards", [index]):
+            store.add(part.text_hashes(), part.embeddings)
+        logger.info(f"Existing index: {len(index)} reusable vectors.")
+    finally:
+        index.close()
+
+
+def _load_checkpoints(checkpoint_dir: str, signature: Dict[str, Any], store: _ReusableVectors):
+    """Adds the batches finished by an earlier, interrupted run."""
+    meta_path = os.path.join(checkpoint_dir, CHECKPOINT_META_FILE)
+    if not os.path.exists(meta_path):
+        return
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        if json.load(f) != signature:
+            logger.warning(f"Checkpoints in {checkpoint_dir} used another embedding setup, discarding them.")
+            shutil.rmtree(checkpoint_dir)
+            return
+
+    before = store.rows
+    for name in sorted(os.listdir(checkpoint_dir)):
+        # The hashes file is written last, it marks a complete chunk
+        if name.endswith(".hashes.npy"):
+            chunk = os.path.join(checkpoint_dir, name[:-len(".hashes.npy")])
+            store.add(np.load(chunk + ".hashes.npy"), np.load(chunk + ".npy", mmap_mode="r"))
+    logger.info(f"Resuming: {store.rows - before} vectors found in checkpoints.")
+
+
+def _save_checkpoint(checkpoint_dir: str, name: str, hashes: List[bytes], embeddings: np.ndarray):
+    path = os.path.join(checkpoint_dir, name)
+    for suffix, data in ((".npy", embeddings), (".hashes.npy", np.array(hashes, dtype="S32"))):
+        with open(path + suffix + ".tmp", 'wb') as f:
+            np.save(f, data)
+        os.replace(path + suffix + ".tmp", path + suffix)
+
+
+class _Progress:
+    """Periodic rows/sec (and ETA, when the total is known) log lines for the embedding loop."""
+
+    def __init__(self, total_rows: Optional[int] = None):
+        self.total_rows = total_rows
+        self.done_rows = 0
+        self.embedded_rows = 0
+        self.started = time.monotonic()
+        self._last_report = self.started
+
+    def update(self, rows: int, embedded: int):
+        self.done_rows += rows
+        self.embedded_rows += embedded
+        now = time.monotonic()
+        if now - self._last_report >= PROGRESS_INTERVAL_SECONDS or self.done_rows == self.total_rows:
+            self._last_report = now
+            self.report()
+
+    def report(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        rate = self.done_rows / elapsed
+        line = f"Indexed {self.done_rows}"
+        if self.total_rows:
+            eta = (self.total_rows - self.done_rows) / rate if rate else 0.0
+            line += f"/{self.total_rows} ({self.done_rows / self.total_rows:.0%})"
+        line += f" | {rate:.0f} rows/s | {self.embedded_rows / elapsed:.0f} embedded/s"
+        if self.total_rows:
+            line += f" | ETA {int(eta // 60)}m{int(eta % 60):02d}s"
+        logger.info(line)
+
+
+def _embed_batch(provider, texts: List[str], limiter: Optional[RateLimiter]) -> np.ndarray:
+    """One embedding request, paced by the limiter and retried on 429s."""
+    for attempt in range(MAX_RETRIES + 1):
+        if limiter is not None:
+            limiter.acquire(sum(estimate_tokens(t) for t in texts))
+        try:
+            embeddings = np.asarray(provider.embed_documents(texts), dtype=np.float32)
+        except Exception as e:
+            if limiter is None or not is_rate_limit_error(e) or attempt == MAX_RETRIES:
+                raise
+            limiter.on_rate_limited()
+            continue
+        if limiter is not None:
+            limiter.on_success()
+        return embeddings
+
+
+def build_index(
+    input_file: str,
+    output_dir: str,
+    api_key: str = None,
+    limit: int = None,
+    ann: str = "auto",
+    quantization: str = None,
+    backend: str = DEFAULT_BACKEND,
+    lexical: bool = True,
+    metadata: bool = True,
+    columns: bool = True,
+    shards: int = 1,
+    concurrency: int = EMBEDDING_CONCURRENCY,
+    requests_per_minute: float = EMBEDDING_RPM,
+    tokens_per_minute: Optional[float] = EMBEDDING_TPM,
+):
+    """
+    Generates embeddings for personas and saves them as a binary index directory
+    (see persona_index.py for the layout).
+    `input_file` is any dataset path understood by record_stream.read_records.
+    `ann` controls the IVF approximate index: "auto" (only for large corpora), "ivf" or "none".
+    `quantization` ("int8" or "pq") also writes compressed codes the recruiter scores first.
+    `backend` picks the embedding provider; it is recorded in the index manifest.
+    `lexical` also builds BM25 postings for hybrid search.
+    `metadata` extracts age/profession/location/hobby columns for filtered search.
+    `columns` keeps every field of the source records in the columnar store.
+    `shards` > 1 splits the index into that many shards searched in parallel
+    (see sharded_index.py).
+    Vectors of texts already embedded by a previous build or an interrupted run
+    are reused (providers fitted on the whole corpus re-embed everything).
+    API backends embed `concurrency` batches in parallel, paced to
+    `requests_per_minute` / `tokens_per_minute` with backoff on 429 responses.
+    """
+    provider = create_provider(backend)
+    if provider.requires_api_key:
+        if not api_key:
+            raise ValueError(f"The '{backend}' embedding backend needs GOOGLE_API_KEY.")
+        genai.configure(api_key=api_key)
     
     if limit:
-        data = data[:limit]
         logger.info(f"Limiting to first {limit} personas for testing.")
-        
-    logger.info(f"Loaded {len(data)} personas. Generating embeddings...")
     
-    embeddings = []
-    texts = []
+    if not provider.stateless:
+        # Corpus statistics for local backends: one extra streaming pass over the input
+        logger.info(f"Fitting {provider.model} on {input_file}...")
+        provider.fit(iter_texts(input_file, limit))
     
-    # Prepare texts
-    for entry in data:
-        # Combine fields for embedding
-        text = f"Persona: {entry.get('input persona', '')}\nSynthesized Text: {entry.get('synthesized text', '')}"
-        texts.append(text)
+    signature = _signature(provider)
+    checkpoint_dir = output_dir.rstrip("/\\") + CHECKPOINT_SUFFIX
     
-    # Batch processing
-    total_batches = (len(texts) + BATCH_SIZE - 1) // BATCH_SIZE
+    reusable = _ReusableVectors()
+    if provider.stateless:
+        _load_index_vectors(output_dir, signature, reusable)
+        _load_checkpoints(checkpoint_dir, signature, reusable)
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        with open(os.path.join(checkpoint_dir, CHECKPOINT_META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(signature, f)
     
-    for i in range(0, len(texts), BATCH_SIZE):
-        batch_texts = texts[i:i + BATCH_SIZE]
-        try:
-            # Embed batch
-            # task_type="retrieval_document" optimizes for search
-            result = genai.embed_content(
-                model=EMBEDDING_MODEL,
-                content=batch_texts,
-                task_type="retrieval_document",
-                title="Persona Profile" # Optional title for document
-            )
-            
-            # Result is usually a dict with 'embedding' key which is a list of lists
-            batch_embeddings = result['embedding']
-            embeddings.extend(batch_embeddings)
-            
-            logger.info(f"Processed batch {i//BATCH_SIZE + 1}/{total_batches}")
-            
-            # Rate limiting sleep
-            time.sleep(0.5)
-            
-        except Exception as e:
-            logger.error(f"Error in batch {i}: {e}")
-            # Try to recover or skip? For now, we raise to ensure integrity
-            raise
-
-    # Save results
-    logger.info("Saving index...")
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute, name=provider.model) if provider.requires_api_key else None
+    # Local backends are CPU-bound Python, threads would only contend for the GIL
+    workers = concurrency if provider.requires_api_key else 1
+    run_id = time.strftime("%Y%m%d%H%M%S")
     
-    # We save both the original data (or at least the text) and the embeddings
-    # To save space, we might just save the index and reference the original file, 
-    # but saving a consolidated file is easier for the recruiter.
+    def _embed_job(job: Tuple[int, List[str], List[Dict[str, Any]]]) -> Tuple[np.ndarray, int]:
+        """Vectors for one batch of texts: reused where possible, embedded otherwise."""
+        batch_no, texts, _ = job
+        hashes = [text_hash(t) for t in texts]
+        vectors = reusable.lookup(hashes)
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            embedded = _embed_batch(provider, [texts[i] for i in missing], limiter)
+            if provider.stateless:
+                _save_checkpoint(checkpoint_dir, f"chunk-{run_id}-{batch_no:06d}",
+                                 [hashes[i] for i in missing], embedded)
+            for i, vector in zip(missing, embedded):
+                vectors[i] = vector
+        return np.stack(vectors).astype(np.float32, copy=False), len(missing)
     
-    output_data = {
-        "embeddings": embeddings,
-        "texts": texts,
-        "original_data": data # Optional: keep full metadata
-    }
+    writer_options = dict(
+        embedding_model=provider.model,
+        embedding_backend=provider.backend,
+        embedding_params=provider.params(),
+        extra_files=provider.state_files(),
+        ann=ann,
+        quantization=quantization,
+        lexical=lexical,
+        metadata=metadata,
+        columns=columns,
+    )
+    # The live version keeps serving until the new one is published
+    version_dir = new_version_dir(output_dir)
+    if shards > 1:
+        writer = ShardedIndexWriter(version_dir, shards, **writer_options)
+    else:
+        writer = IndexWriter(version_dir, **writer_options)
+    progress = _Progress(limit)
     
-    # Using numpy for efficient saving/loading of embeddings could be better, 
-    # but JSON is requested/portable.
-    # Actually, saving 20k vectors (768 dims) in JSON is huge.
-    # 20000 * 768 * 10 chars ~ 150MB.
-    # It's acceptable.
+    def _on_batch(job: Tuple[int, List[str], List[Dict[str, Any]]], result: Tuple[np.ndarray, int]):
+        _, texts, records = job
+        embeddings, embedded = result
+        writer.append(embeddings, texts, records)
+        progress.update(len(texts), embedded)
     
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(output_data, f)
-        
-    logger.info(f"Index saved to {output_file}")
+    logger.info(f"Streaming personas from {input_file}...")
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            run_ordered(
+                (
+                    (batch_no, [persona_text(entry) for entry in records], records)
+                    for batch_no, records in enumerate(batched(read_records(input_file, limit), BATCH_SIZE))
+                ),
+                _embed_job,
+                _on_batch,
+                pool,
+                max_pending=workers * 2,
+            )
+    except Exception as e:
+        writer.abort()
+        shutil.rmtree(version_dir, ignore_errors=True)
+        logger.error(f"Index build failed: {e}")
+        if provider.stateless:
+            logger.error(f"Finished batches are checkpointed in {checkpoint_dir}, rerun to resume.")
+        raise
+    
+    progress.report()
+    logger.info(f"{progress.done_rows} personas: {progress.done_rows - progress.embedded_rows} reused, "
+                f"{progress.embedded_rows} embedded.")
+    if limiter is not None and limiter.rate_limited:
+        logger.info(f"Hit the rate limit {limiter.rate_limited} times (rate settled at {limiter.fraction:.0%}).")
+    if provider.requires_api_key:
+        embedding_cache.get_cache().log_stats()
+
+    # Save results
+    # The float32 matrix and the text blob are memory-mapped by the recruiter,
+    # so only the manifest is parsed on load.
+    logger.info("Finishing index...")
+    try:
+        writer.finish()
+    except Exception:
+        shutil.rmtree(version_dir, ignore_errors=True)
+        raise
+    publish(output_dir, os.path.basename(version_dir))
+    logger.info(f"Index saved to {version_dir}")
+    # Everything is in the index now, the next run reuses it from there
+    shutil.rmtree(checkpoint_dir, ignore_errors=True)
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the persona vector index.")
+    parser.add_argument("--input", default="personas.json", help="JSONL file, directory of JSONL shards or JSON array")
+    parser.add_argument("--output", default="personas_index")
+    # Partial index for testing; rebuilds are incremental, so full builds are the default
+    parser.add_argument("--limit", type=int, default=0, help="Only index the first N personas (0: all)")
+    parser.add_argument("--ann", choices=["auto", "ivf", "none"], default="auto",
+                        help="Approximate nearest-neighbour index (auto: IVF for large corpora)")
+    parser.add_argument("--quantization", choices=["none", "int8", "pq"], default="none",
+                        help="Compressed codes scored before exact re-ranking (int8: 4x, pq: 16x smaller)")
+    parser.add_argument("--backend", choices=["gemini", "hashing"], default=DEFAULT_BACKEND,
+                        help="Embedding provider (hashing: local, offline)")
+    parser.add_argument("--no-bm25", action="store_true", help="Skip the BM25 postings (vector-only search)")
+    parser.add_argument("--no-metadata", action="store_true", help="Skip the attribute columns (no filtered search)")
+    parser.add_argument("--no-columns", action="store_true", help="Do not keep the source record fields")
+    parser.add_argument("--shards", type=int, default=1, help="Split the index into N shards searched in parallel")
+    parser.add_argument("--concurrency", type=int, default=EMBEDDING_CONCURRENCY, help="Embedding requests in flight")
+    parser.add_argument("--rpm", type=float, default=EMBEDDING_RPM, help="Embedding requests per minute")
+    parser.add_argument("--tpm", type=float, default=EMBEDDING_TPM, help="Embedding tokens per minute (default: unlimited)")
+    args = parser.parse_args()
+
     api_key = os.environ.get("GOOGLE_API_KEY")
-    if not api_key:
+    if args.backend == "gemini" and not api_key:
         logger.error("GOOGLE_API_KEY not found.")
         exit(1)
         
-    # Build partial index for testing (remove limit=1000 for full build)
-    build_index("personas.json", "personas_index.json", api_key, limit=1000)
+    build_index(args.input, args.output, api_key, limit=args.limit or None, ann=args.ann,
+                quantization=None if args.quantization == "none" else args.quantization,
+                backend=args.backend, lexical=not args.no_bm25, metadata=not args.no_metadata,
+                columns=not args.no_columns, shards=args.shards,
+                concurrency=args.concurrency, requests_per_minute=args.rpm, tokens_per_minute=args.tpm)
@@ -43,3 +43,21 @@ try:
     print(f"Vector length: {len(result['embedding'])}")
 except Exception as e:
     print(f"❌ Failed: {e}")
+
+print("\n--- TEST 3: Embedding Cache ---")
+try:
+    import embedding_cache
+    cache = embedding_cache.get_cache()
+    for attempt in range(2):
+        start = time.time()
+        result = embedding_cache.embed_content(
+            model="models/text-embedding-004",
+            content="Test query",
+            task_type="retrieval_query"
+        )
+        print(f"Attempt {attempt + 1}: {time.time() - start:.3f}s")
+    stats = cache.stats()
+    print(f"✅ Cache at {cache.disk.path}: hit rate {stats['hit_rate']:.0%} "
+          f"(memory {stats['memory_hits']}, disk {stats['disk_hits']}, misses {stats['misses']})")
+except Exception as e:
+    print(f"❌ Failed: {e}")
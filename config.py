@@ -1,78 +1,154 @@
 import os
-from langchain_google_genai import ChatGoogleGenerativeAI, HarmCategory, HarmBlockThreshold
-from langchain_openai import ChatOpenAI
+import json
+import threading
+from typing import Any, Dict, Optional
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Chat clients are built on first use (see get_llm), so importing this module
+# stays cheap: no LangChain / OpenAI / Google SDK import, no proxy setup.
+
 # === PROXY CONFIGURATION ===
 PROXY_URL = os.getenv("PROXY_URL")
-http_client = None
-
-if PROXY_URL:
-    print(f"🌍 Using Proxy: {PROXY_URL}")
-    # 1. Global Proxy for Libraries that respect env vars (Google Generative AI, requests)
-    os.environ["HTTP_PROXY"] = PROXY_URL
-    os.environ["HTTPS_PROXY"] = PROXY_URL
-    os.environ["http_proxy"] = PROXY_URL
-    os.environ["https_proxy"] = PROXY_URL
-    
-    # 2. HTTPX Client for OpenAI/LangChain
-    import httpx
-    http_client = httpx.Client(proxy=PROXY_URL)
+_proxy_clients = None
+_proxy_lock = threading.Lock()
+
+
+def configure_proxy():
+    """
+    Routes provider traffic through PROXY_URL (if set). Returns the (sync, async)
+    httpx clients for OpenAI, or (None, None) without a proxy. Runs once.
+    """
+    global _proxy_clients
+    with _proxy_lock:
+        if _proxy_clients is not None:
+            return _proxy_clients
+        if not PROXY_URL:
+            _proxy_clients = (None, None)
+            return _proxy_clients
+
+        print(f"🌍 Using Proxy: {PROXY_URL}")
+        # 1. Global Proxy for Libraries that respect env vars (Google Generative AI, requests)
+        os.environ["HTTP_PROXY"] = PROXY_URL
+        os.environ["HTTPS_PROXY"] = PROXY_URL
+        os.environ["http_proxy"] = PROXY_URL
+        os.environ["https_proxy"] = PROXY_URL
+
+        # 2. HTTPX Clients for OpenAI/LangChain (ainvoke goes through its own client)
+        import httpx
+        _proxy_clients = (httpx.Client(proxy=PROXY_URL), httpx.AsyncClient(proxy=PROXY_URL))
+        return _proxy_clients
+
 
 # === CONFIGURATION ===
 MOCK_SIMULATION = os.getenv("MOCK_SIMULATION", "false").lower() == "true"  # Set to true to skip real LLM calls in simulation
 
-# === LLM CLIENTS ===
-# Настройка отключения фильтров
-safety_settings = {
-    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+# === MODEL PROFILES ===
+# A profile names a provider, a model and its settings. Runs pick profiles per
+# role through `model_profiles` in the request; LLM_PROFILES (JSON) adds or
+# overrides profiles, e.g. '{"critic": {"model": "gpt-5-mini"}}'.
+MODEL_PROFILES: Dict[str, Dict[str, Any]] = {
+    # GENERATOR: Gemini 3 Pro
+    # Features: Native Grounding (Search built-in), 2M+ Token Context
+    "generator": {
+        "provider": "google", "model": "gemini-3-pro-preview", "temperature": 1,
+        "disable_safety_filters": True, "convert_system_message_to_human": True,
+    },
+    # CRITIC: ChatGPT 5.1 (Reasoning Heavy)
+    # Features: Deep Reasoning (System 2), Simulation capabilities
+    # Keep it cold and logical, enable deep thinking
+    "critic": {"provider": "openai", "model": "gpt-5.1", "temperature": 0.1, "reasoning_effort": "high"},
+    # ROUTER: Gemini 2.5 Flash (Speed & Cost)
+    # Checks if we should exit the loop to save money
+    "router": {"provider": "google", "model": "gemini-2.5-flash", "temperature": 0},
+    # FAST MODEL: GPT-4o-mini (For Debug Mode / Fast Iterations)
+    "fast": {"provider": "openai", "model": "gpt-4o-mini", "temperature": 0.7},
+}
+for _name, _overrides in json.loads(os.getenv("LLM_PROFILES", "{}")).items():
+    MODEL_PROFILES[_name] = {**MODEL_PROFILES.get(_name, {}), **_overrides}
+
+# Profile each node role uses by default, and with use_fast_model
+ROLE_PROFILES = {
+    "generator": "generator",
+    "critic": "critic",
+    "researcher": "generator",
+    "recruiter": "generator",
+    "interviewer": "generator",
+    "persona": "fast",
+    "summary": "generator",
+    "analyst": "generator",
 }
+FAST_PROFILE = "fast"
+
+# Module attributes kept for older imports (`from config import llm_fast`), built lazily
+_LEGACY_CLIENTS = {
+    "llm_generator": "generator",
+    "llm_critic": "critic",
+    "llm_router": "router",
+    "llm_fast": "fast",
+}
+
+
+def _safety_settings():
+    from langchain_google_genai import HarmCategory, HarmBlockThreshold
+    # Настройка отключения фильтров
+    return {
+        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+    }
+
+
+def _build(spec: Dict[str, Any]):
+    options = {k: v for k, v in spec.items() if k not in ("provider", "model", "disable_safety_filters")}
+    http_client, http_async_client = configure_proxy()
+    if spec["provider"] == "google":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        if spec.get("disable_safety_filters"):
+            options["safety_settings"] = _safety_settings()
+        # Google lib uses the proxy env vars set by configure_proxy
+        return ChatGoogleGenerativeAI(model=spec["model"], google_api_key=os.getenv("GOOGLE_API_KEY"), **options)
+    if spec["provider"] == "openai":
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(
+            model=spec["model"],
+            openai_api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=http_client,
+            http_async_client=http_async_client,
+            **options,
+        )
+    raise ValueError(f"Unknown provider '{spec['provider']}' in model profile.")
+
+
+_clients: Dict[str, Any] = {}
+_clients_lock = threading.Lock()
+
+
+def get_llm(profile: str):
+    """The chat client for `profile`, built on first use and shared afterwards."""
+    if profile not in MODEL_PROFILES:
+        raise KeyError(f"Unknown model profile '{profile}'. Known: {', '.join(sorted(MODEL_PROFILES))}")
+    with _clients_lock:
+        client = _clients.get(profile)
+        if client is None:
+            client = _clients[profile] = _build(MODEL_PROFILES[profile])
+        return client
+
+
+def profile_for(role: str, model_profiles: Optional[Dict[str, str]] = None, use_fast_model: bool = False) -> str:
+    """Profile a run uses for `role`: its explicit choice, else the fast or the default tier."""
+    if model_profiles and model_profiles.get(role):
+        return model_profiles[role]
+    return FAST_PROFILE if use_fast_model else ROLE_PROFILES[role]
+
+
+def __getattr__(name: str):
+    if name in _LEGACY_CLIENTS:
+        return get_llm(_LEGACY_CLIENTS[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-# GENERATOR: Gemini 3 Pro
-# Features: Native Grounding (Search built-in), 2M+ Token Context
-llm_generator = ChatGoogleGenerativeAI(
-    model="gemini-3-pro-preview",
-    # model="gemini-2.5-pro",
-    temperature=1,
-    google_api_key=os.getenv("GOOGLE_API_KEY"),
-    safety_settings=safety_settings, 
-    convert_system_message_to_human=True, 
-)
-
-# CRITIC: ChatGPT 5.1 (Reasoning Heavy)
-# Features: Deep Reasoning (System 2), Simulation capabilities
-llm_critic = ChatOpenAI(
-    model="gpt-5.1", 
-    # model="gpt-5-mini", 
-    temperature=0.1, # Keep it cold and logical
-    reasoning_effort="high", # Enable deep thinking
-    openai_api_key=os.getenv("OPENAI_API_KEY"),
-    http_client=http_client
-)
-
-# ROUTER: Gemini 2.5 Flash (Speed & Cost)
-# Checks if we should exit the loop to save money
-llm_router = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    temperature=0,
-    google_api_key=os.getenv("GOOGLE_API_KEY")
-    # Google lib uses env vars set above
-)
-
-# FAST MODEL: Gemini 2.5 Flash (For Debug Mode)
-# FAST MODEL: GPT-4o-mini (For Debug Mode / Fast Iterations)
-# Replaced Gemini Flash as requested for better speed/reliability in debug
-llm_fast = ChatOpenAI(
-    model="gpt-4o-mini",
-    temperature=0.7,
-    openai_api_key=os.getenv("OPENAI_API_KEY"),
-    http_client=http_client
-)
 
 GENERATOR_SYSTEM_PROMPT = """
 ### РОЛЬ И КОНТЕКСТ
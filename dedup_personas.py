@@ -0,0 +1,244 @@
+"""
+Near-duplicate persona removal (MinHash + LSH), run between filter_personas.py
+and build_vector_index.py.
+
+Two streaming passes over the input, with constant memory per record:
+
+1. Every persona text is reduced to word 3-gram shingles and a MinHash
+   signature. Signatures and per-band LSH hashes go to temporary memory-mapped
+   files.
+2. Rows sharing a band hash are candidates. Within a bucket, each row is
+   verified against the bucket's cluster representatives and merged
+   (union-find) with one whose estimated Jaccard similarity reaches the
+   threshold. Only the first row of every cluster is written to the output.
+
+Rows without any words are never merged: they carry no text to compare.
+"""
+
+import os
+import json
+import time
+import zlib
+import logging
+import itertools
+import tempfile
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from embeddings import tokenize
+from record_stream import RecordWriter, read_lines, batched, dataset_persona_field
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = 0.8
+NUM_PERM = 64
+SHINGLE_WORDS = 3
+BATCH_SIZE = 500
+
+# Universal hashing (a * x + b) mod p with p > 2^32; with 32-bit shingle
+# hashes and 32-bit coefficients, a * x + b stays below 2^64
+_PRIME = np.uint64(4294967311)
+_EMPTY_SHINGLE = zlib.crc32(b"")
+
+
+def lsh_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """
+    (bands, rows per band) whose S-curve midpoint (1/b)^(1/r) is closest to
+    the threshold from below, so candidates err on the side of recall (every
+    candidate is verified against the full signature afterwards).
+    """
+    best = (num_perm, 1)
+    best_gap = float("inf")
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        midpoint = (1.0 / bands) ** (1.0 / rows)
+        if midpoint <= threshold and threshold - midpoint < best_gap:
+            best, best_gap = (bands, rows), threshold - midpoint
+    return best
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)[:, None]
+        self.b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)[:, None]
+
+    @staticmethod
+    def shingles(text: str) -> List[int]:
+        tokens = tokenize(text)
+        if len(tokens) < SHINGLE_WORDS:
+            grams = [" ".join(tokens)]
+        else:
+            grams = [" ".join(tokens[i:i + SHINGLE_WORDS]) for i in range(len(tokens) - SHINGLE_WORDS + 1)]
+        return list({zlib.crc32(g.encode("utf-8")) for g in grams}) or [_EMPTY_SHINGLE]
+
+    def signatures(self, texts: Sequence[str]) -> np.ndarray:
+        """uint32 [texts x num_perm] MinHash signatures, one vectorized pass per batch."""
+        shingle_sets = [self.shingles(t) for t in texts]
+        starts = np.cumsum([0] + [len(s) for s in shingle_sets[:-1]])
+        values = np.fromiter((h for s in shingle_sets for h in s), dtype=np.uint64)
+        hashed = (self.a * values[None, :] + self.b) % _PRIME  # [num_perm x shingles]
+        return np.minimum.reduceat(hashed, starts, axis=1).T.astype(np.uint32)
+
+
+def _band_hashes(signatures: np.ndarray, bands: int, rows: int) -> np.ndarray:
+    """uint64 [texts x bands]: each band's rows folded into one hash."""
+    band_values = signatures[:, :bands * rows].astype(np.uint64).reshape(len(signatures), bands, rows)
+    multipliers = (np.arange(rows, dtype=np.uint64) * np.uint64(2654435761) + np.uint64(0x9E3779B97F4A7C15))
+    # uint64 arithmetic wraps, which is what a hash wants
+    with np.errstate(over="ignore"):
+        return (band_values * multipliers).sum(axis=2, dtype=np.uint64) ^ np.arange(bands, dtype=np.uint64)
+
+
+def persona_text(record: Dict[str, Any], field: Optional[str]) -> str:
+    value = record.get(field) if field is not None else None
+    return value if isinstance(value, str) else ""
+
+
+def _union(parent: np.ndarray, a: int, b: int):
+    root_a, root_b = _find(parent, a), _find(parent, b)
+    if root_a != root_b:
+        # The earliest row represents the cluster
+        parent[max(root_a, root_b)] = min(root_a, root_b)
+
+
+def _find(parent: np.ndarray, i: int) -> int:
+    root = i
+    while parent[root] != root:
+        root = parent[root]
+    while parent[i] != root:
+        parent[i], i = root, parent[i]
+    return root
+
+
+def dedup_personas(
+    input_file: str,
+    output_file: str,
+    threshold: float = DEFAULT_THRESHOLD,
+    num_perm: int = NUM_PERM,
+    field: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Writes `input_file` to `output_file` (JSONL) without near-duplicates:
+    rows whose persona texts have an estimated Jaccard similarity (word 3-gram
+    shingles) of at least `threshold` to an earlier row are dropped.
+    `field` names the text field (default: detected once for the whole dataset,
+    as filter_personas.py does, so every row is compared on the same field).
+    Returns counts and timings.
+    """
+    started = time.monotonic()
+    if field is None:
+        field = dataset_persona_field(input_file)
+        if field is None:
+            logger.warning(f"No persona field found in {input_file}; every row is kept.")
+        else:
+            logger.info(f"Using '{field}' as persona field.")
+    hasher = MinHasher(num_perm)
+    bands, rows_per_band = lsh_bands(num_perm, threshold)
+    logger.info(f"Dedup: threshold {threshold}, {num_perm} permutations, {bands} bands x {rows_per_band} rows.")
+
+    scratch_dir = os.path.dirname(os.path.abspath(output_file))
+    with tempfile.TemporaryDirectory(dir=scratch_dir, prefix=".dedup-") as scratch:
+        sig_path = os.path.join(scratch, "signatures.bin")
+        band_path = os.path.join(scratch, "bands.bin")
+
+        # Pass 1: signatures and band hashes to disk
+        total = 0
+        empty_batches = []
+        with open(sig_path, 'wb') as sig_file, open(band_path, 'wb') as band_file:
+            for lines in batched(read_lines(input_file), BATCH_SIZE):
+                texts = [persona_text(json.loads(line), field) for line in lines]
+                signatures = hasher.signatures(texts)
+                sig_file.write(signatures.tobytes())
+                band_file.write(_band_hashes(signatures, bands, rows_per_band).tobytes())
+                empty_batches.append(np.array([not tokenize(t) for t in texts], dtype=bool))
+                total += len(lines)
+        # Wordless rows all get the same signature; they stay out of the buckets
+        empty = np.concatenate(empty_batches) if empty_batches else np.zeros(0, dtype=bool)
+        signature_seconds = time.monotonic() - started
+        logger.info(f"Signed {total} personas in {signature_seconds:.1f}s.")
+
+        parent = np.arange(total, dtype=np.int64)
+        if total:
+            signatures = np.memmap(sig_path, dtype=np.uint32, mode='r', shape=(total, num_perm))
+            band_table = np.memmap(band_path, dtype=np.uint64, mode='r', shape=(total, bands))
+
+            # Rows with equal band hashes form a bucket; each is checked against
+            # the bucket's first row and merged on a verified match
+            candidates = verified = 0
+            for band in range(bands):
+                column = np.array(band_table[:, band])
+                order = np.argsort(column, kind="stable")
+                order = order[~empty[order]]
+                sorted_values = column[order]
+                same = np.flatnonzero(sorted_values[1:] == sorted_values[:-1]) + 1
+                if not len(same):
+                    continue
+                # Position of each bucket's first row in `order`
+                run_start = np.flatnonzero(np.r_[True, sorted_values[1:] != sorted_values[:-1]])
+                heads = order[run_start[np.searchsorted(run_start, same, side="right") - 1]]
+                members = order[same]
+                candidates += len(members)
+
+                agreement = (signatures[members] == signatures[heads]).mean(axis=1)
+                matched = agreement >= threshold
+                for head, member in zip(heads[matched], members[matched]):
+                    verified += 1
+                    _union(parent, int(head), int(member))
+
+                # Rows unlike their bucket's first row may still match each other: in
+                # bucket order, each joins the first representative it matches or becomes one
+                unmatched = zip(heads[~matched].tolist(), members[~matched].tolist())
+                for _, group in itertools.groupby(unmatched, key=lambda pair: pair[0]):
+                    representatives = []
+                    for _, member in group:
+                        if representatives:
+                            agreement = (signatures[representatives] == signatures[member]).mean(axis=1)
+                            hits = np.flatnonzero(agreement >= threshold)
+                            if len(hits):
+                                verified += 1
+                                _union(parent, representatives[hits[0]], member)
+                                continue
+                        representatives.append(member)
+            logger.info(f"LSH: {candidates} candidate pairs, {verified} above the threshold.")
+            del signatures, band_table
+
+    roots = np.array([_find(parent, i) for i in range(total)], dtype=np.int64)
+    keep = roots == np.arange(total)
+
+    # Pass 2: copy the representatives
+    with RecordWriter(output_file) as writer:
+        for i, line in enumerate(read_lines(input_file)):
+            if i < total and keep[i]:
+                writer.write_line(line)
+
+    elapsed = time.monotonic() - started
+    stats = {
+        "input": total,
+        "output": writer.count,
+        "collapsed": total - writer.count,
+        "clusters": int(np.count_nonzero(np.bincount(roots) > 1)) if total else 0,
+        "seconds": elapsed,
+    }
+    logger.info(
+        f"Dedup: {stats['input']} -> {stats['output']} personas, collapsed {stats['collapsed']} rows "
+        f"({stats['collapsed'] / max(total, 1):.1%}) in {stats['clusters']} clusters, {elapsed:.1f}s."
+    )
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Remove near-duplicate personas (MinHash LSH).")
+    parser.add_argument("--input", default="personahub_filtered_human.jsonl")
+    parser.add_argument("--output", default="personahub_dedup.jsonl")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Jaccard similarity (word 3-grams) at which rows count as duplicates")
+    parser.add_argument("--num-perm", type=int, default=NUM_PERM, help="MinHash permutations")
+    parser.add_argument("--field", default=None, help="Text field to compare (default: detected once per dataset)")
+    args = parser.parse_args()
+
+    dedup_personas(args.input, args.output, threshold=args.threshold, num_perm=args.num_perm, field=args.field)
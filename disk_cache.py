@@ -0,0 +1,144 @@
+"""
+Small SQLite-backed key/value cache with size-based eviction and optional TTL.
+
+Values are opaque bytes. When the stored total exceeds `max_bytes`, the least
+recently accessed entries are dropped until it is back under the low-water mark.
+Safe to share between threads; several processes may also open the same file.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+import logging
+from typing import Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# After eviction the cache is trimmed to this fraction of max_bytes
+EVICT_LOW_WATER = 0.9
+
+
+class DiskCache:
+    def __init__(self, path: str, max_bytes: int, ttl_seconds: Optional[float] = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL,"
+            " created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed)")
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+
+        now = time.time()
+        found, expired = {}, []
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value, created FROM entries WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, value, created in rows:
+                    if self._expired(created, now):
+                        expired.append(key)
+                    else:
+                        found[key] = value
+
+            if found:
+                self._conn.executemany("UPDATE entries SET accessed = ? WHERE key = ?", [(now, k) for k in found])
+            if expired:
+                self._delete(expired)
+        return found
+
+    def set(self, key: str, value: bytes):
+        self.set_many([(key, value)])
+
+    def set_many(self, items: Iterable[Tuple[str, bytes]]):
+        items = list(items)
+        if not items:
+            return
+
+        now = time.time()
+        with self._lock:
+            old_sizes = self._sizes([k for k, _ in items])
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                [(k, v, len(v), now, now) for k, v in items],
+            )
+            self._total_bytes += sum(len(v) for _, v in items) - sum(old_sizes.values())
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._delete([key])
+
+    def _sizes(self, keys):
+        sizes = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            sizes.update(self._conn.execute(
+                f"SELECT key, size FROM entries WHERE key IN ({placeholders})", chunk
+            ).fetchall())
+        return sizes
+
+    def _delete(self, keys):
+        sizes = self._sizes(keys)
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k in sizes])
+        self._total_bytes -= sum(sizes.values())
+
+    def _evict(self):
+        """Drops least recently used entries down to the low-water mark. Caller holds the lock."""
+        # Other processes may have written too, start from the real total
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        target = int(self.max_bytes * EVICT_LOW_WATER)
+        if self._total_bytes <= target:
+            return
+
+        to_free = self._total_bytes - target
+        freed, victims = 0, []
+        for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY accessed ASC"):
+            victims.append(key)
+            freed += size
+            if freed >= to_free:
+                break
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k in victims])
+        self._total_bytes -= freed
+        logger.info(f"Evicted {len(victims)} entries ({freed / 1024 / 1024:.1f} MB) from {self.path}")
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
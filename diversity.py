@@ -0,0 +1,81 @@
+"""
+Maximal-marginal-relevance selection across the specs of one recruiting round.
+
+Every spec brings its own candidate rows. Picks are made greedily in
+round-robin order over the specs, and each pick trades relevance to the spec
+against similarity to everything already picked (for any spec):
+
+    mmr(c) = lambda * sim(spec, c) - (1 - lambda) * max sim(c, picked)
+
+A row is picked at most once, and rows nearly identical to a picked row
+(similarity >= duplicate_threshold) are skipped entirely, so no two specs pay
+for enriching the same persona.
+"""
+
+import logging
+import numpy as np
+from typing import List, Sequence
+
+logger = logging.getLogger(__name__)
+
+MMR_LAMBDA = 0.7
+DUPLICATE_THRESHOLD = 0.95
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def mmr_select(
+    query_embeddings: np.ndarray,
+    candidate_rows: Sequence[Sequence[int]],
+    row_embeddings: np.ndarray,
+    rows: np.ndarray,
+    per_query: int,
+    lambda_: float = MMR_LAMBDA,
+    duplicate_threshold: float = DUPLICATE_THRESHOLD,
+) -> List[List[int]]:
+    """
+    Selects up to `per_query` distinct rows for every query.
+    `candidate_rows[q]` are the rows query q may choose from; `rows` is the
+    sorted union of all candidates and `row_embeddings` their vectors.
+    """
+    n_queries, n_rows = len(query_embeddings), len(rows)
+    selected: List[List[int]] = [[] for _ in range(n_queries)]
+    if n_rows == 0:
+        return selected
+
+    vectors = _normalize(np.asarray(row_embeddings, dtype=np.float32))
+    relevance = _normalize(np.asarray(query_embeddings, dtype=np.float32)) @ vectors.T  # [queries x rows]
+    similarity = vectors @ vectors.T  # [rows x rows]
+
+    eligible = np.zeros((n_queries, n_rows), dtype=bool)
+    for q, candidates in enumerate(candidate_rows):
+        eligible[q, np.searchsorted(rows, np.asarray(candidates, dtype=rows.dtype))] = True
+
+    available = np.ones(n_rows, dtype=bool)
+    # Highest similarity of every row to anything picked so far (floored at 0)
+    redundancy = np.zeros(n_rows, dtype=np.float32)
+    skipped = 0
+
+    for _ in range(per_query):
+        for q in range(n_queries):
+            open_rows = eligible[q] & available
+            if not open_rows.any():
+                continue
+            scores = np.where(open_rows, lambda_ * relevance[q] - (1.0 - lambda_) * redundancy, -np.inf)
+            pick = int(np.argmax(scores))
+
+            selected[q].append(int(rows[pick]))
+            available[pick] = False
+            # Near-duplicates of the pick are withdrawn for every query
+            duplicates = available & (similarity[pick] >= duplicate_threshold)
+            skipped += int(duplicates.sum())
+            available &= ~duplicates
+            np.maximum(redundancy, similarity[pick], out=redundancy)
+
+    if skipped:
+        logger.info(f"[MMR] Dropped {skipped} near-duplicate candidates (similarity >= {duplicate_threshold}).")
+    return selected
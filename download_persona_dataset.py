@@ -1,51 +1,68 @@
 """
 Download PersonaHub dataset from HuggingFace.
-Downloads the 'instruction' split and saves a sample of 20k rows.
+Streams the 'instruction' split and saves a sample of 20k rows (or the whole
+split) as JSONL, optionally sharded (see record_stream.py).
 """
 
 from datasets import load_dataset
+from itertools import islice
 import json
 
-def download_personahub_dataset(output_file='personahub_instruction_20k.json', num_samples=20000):
+from record_stream import RecordWriter
+
+def download_personahub_dataset(output_file='personahub_instruction_20k.jsonl', num_samples=20000, shard_size=None):
     """
-    Download PersonaHub dataset (instruction split) and save sample to JSON.
-    
+    Download PersonaHub dataset (instruction split) and save sample to JSONL.
+    Rows are written as they arrive, so memory does not grow with the sample.
+
     Args:
-        output_file: Path to save the JSON file
-        num_samples: Number of samples to download (default: 20000)
+        output_file: Path to save the JSONL file (a directory when sharding)
+        num_samples: Number of samples to download (default: 20000, None: whole split)
+        shard_size: Records per shard file (default: single file)
+
+    Returns:
+        Number of saved records
     """
     print(f"Downloading PersonaHub dataset (instruction split)...")
-    print(f"Requesting {num_samples} samples...")
-    
+    print(f"Requesting {num_samples or 'all'} samples...")
+
     # Load the dataset from HuggingFace
-    # Using streaming=True for efficiency with large datasets
+    # streaming=True yields rows as they are downloaded instead of materializing the split
     dataset = load_dataset(
         "proj-persona/PersonaHub",
         "instruction",
-        split=f"train[:{num_samples}]",
+        split="train",
+        streaming=True,
         trust_remote_code=True
     )
-    
-    print(f"Downloaded {len(dataset)} samples")
-    
-    # Convert to list of dictionaries
-    data = []
-    for item in dataset:
-        data.append(dict(item))
-    
-    # Save to JSON file
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    
-    print(f"Saved {len(data)} samples to {output_file}")
-    print(f"File size: {len(json.dumps(data, ensure_ascii=False)) / 1024 / 1024:.2f} MB")
-    
+
+    sample = None
+    with RecordWriter(output_file, shard_size=shard_size) as writer:
+        for item in islice(dataset, num_samples):
+            record = dict(item)
+            if sample is None:
+                sample = record
+            writer.write(record)
+            if writer.count % 10000 == 0:
+                print(f"  ...{writer.count} records")
+
+    print(f"Saved {writer.count} samples to {output_file}")
+    print(f"File size: {writer.bytes_written / 1024 / 1024:.2f} MB")
+
     # Print sample record to understand structure
-    if data:
+    if sample:
         print("\nSample record structure:")
-        print(json.dumps(data[0], ensure_ascii=False, indent=2))
-    
-    return data
+        print(json.dumps(sample, ensure_ascii=False, indent=2))
+
+    return writer.count
 
 if __name__ == "__main__":
-    download_personahub_dataset()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Download the PersonaHub instruction split.")
+    parser.add_argument("--output", default="personahub_instruction_20k.jsonl")
+    parser.add_argument("--samples", type=int, default=20000, help="Rows to download (0: whole split)")
+    parser.add_argument("--shard-size", type=int, default=0, help="Records per JSONL shard (0: single file)")
+    args = parser.parse_args()
+
+    download_personahub_dataset(args.output, num_samples=args.samples or None, shard_size=args.shard_size or None)
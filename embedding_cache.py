@@ -0,0 +1,170 @@
+"""
+Two-tier cache for embedding vectors.
+
+Entries are keyed by (model, task_type, title, normalized text). Lookups go
+through an in-memory LRU first and a SQLite file second (see disk_cache.py);
+only the misses are sent to the embedding API, in a single request.
+
+`embed_content` mirrors `genai.embed_content` so call sites can switch to it
+without reshaping results.
+"""
+
+import os
+import hashlib
+import threading
+import logging
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+from disk_cache import DiskCache
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite")
+MEMORY_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MEMORY_ENTRIES", "4096"))
+DISK_MAX_BYTES = int(os.environ.get("EMBEDDING_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+
+def normalize_text(text: str) -> str:
+    """Collapses whitespace so trivially re-formatted queries share an entry."""
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    def __init__(
+        self,
+        path: str = CACHE_PATH,
+        memory_entries: int = MEMORY_ENTRIES,
+        disk_max_bytes: int = DISK_MAX_BYTES,
+    ):
+        self.memory_entries = memory_entries
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.disk = DiskCache(path, max_bytes=disk_max_bytes)
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model: str, task_type: str, text: str, title: Optional[str] = None) -> str:
+        payload = "\x1f".join([model, task_type, title or "", normalize_text(text)])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: np.ndarray):
+        """Inserts into the LRU tier. Caller holds the lock."""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def embed(
+        self,
+        texts: Sequence[str],
+        model: str,
+        task_type: str,
+        embed_fn: Callable[[List[str]], List[List[float]]],
+        title: Optional[str] = None,
+    ) -> List[np.ndarray]:
+        """
+        Returns float32 vectors for `texts`, calling `embed_fn` once with the
+        misses only (duplicates inside the batch are embedded once).
+        """
+        keys = [self.key(model, task_type, t, title) for t in texts]
+        vectors: Dict[str, np.ndarray] = {}
+
+        with self._lock:
+            for k in keys:
+                if k in self._memory:
+                    self._memory.move_to_end(k)
+                    vectors[k] = self._memory[k]
+            self.memory_hits += sum(1 for k in keys if k in vectors)
+
+        pending = [k for k in dict.fromkeys(keys) if k not in vectors]
+        if pending:
+            from_disk = self.disk.get_many(pending)
+            with self._lock:
+                for k, blob in from_disk.items():
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    vectors[k] = vector
+                    self._remember(k, vector)
+                self.disk_hits += sum(1 for k in keys if k in from_disk)
+
+        missing = {k: t for k, t in zip(keys, texts) if k not in vectors}
+        if missing:
+            with self._lock:
+                self.misses += sum(1 for k in keys if k in missing)
+            fresh = embed_fn(list(missing.values()))
+            new_items = []
+            with self._lock:
+                for k, embedding in zip(missing, fresh):
+                    vector = np.asarray(embedding, dtype=np.float32)
+                    vectors[k] = vector
+                    self._remember(k, vector)
+                    new_items.append((k, vector.tobytes()))
+            self.disk.set_many(new_items)
+
+        return [vectors[k] for k in keys]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_bytes": self.disk.total_bytes,
+        }
+
+    def log_stats(self):
+        s = self.stats()
+        logger.info(
+            f"[EmbeddingCache] hit rate {s['hit_rate']:.1%} "
+            f"(memory {s['memory_hits']}, disk {s['disk_hits']}, misses {s['misses']}), "
+            f"{s['disk_bytes'] / 1024 / 1024:.1f} MB on disk"
+        )
+
+
+_default_cache: Optional[EmbeddingCache] = None
+_default_lock = threading.Lock()
+
+
+def get_cache() -> EmbeddingCache:
+    """Process-wide cache instance, created on first use."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = EmbeddingCache()
+        return _default_cache
+
+
+def embed_content(
+    model: str,
+    content: Union[str, Sequence[str]],
+    task_type: str,
+    title: Optional[str] = None,
+    use_cache: bool = True,
+) -> Dict[str, Any]:
+    """
+    Cached drop-in for `genai.embed_content`: returns {'embedding': vector} for a
+    single string and {'embedding': [vectors]} for a list, like the SDK.
+    `use_cache=False` calls the API directly, for one-off texts such as a
+    corpus being indexed that would only evict the entries worth keeping.
+    """
+    texts = [content] if isinstance(content, str) else list(content)
+
+    def _call_api(batch: List[str]) -> List[List[float]]:
+        import google.generativeai as genai
+        kwargs = {"title": title} if title else {}
+        result = genai.embed_content(model=model, content=batch, task_type=task_type, **kwargs)
+        return result['embedding']
+
+    if use_cache:
+        vectors = get_cache().embed(texts, model, task_type, _call_api, title=title)
+    else:
+        vectors = [np.asarray(v, dtype=np.float32) for v in _call_api(texts)]
+    if isinstance(content, str):
+        return {'embedding': vectors[0].tolist()}
+    return {'embedding': [v.tolist() for v in vectors]}
@@ -0,0 +1,175 @@
+"""
+Embedding providers for the persona index.
+
+    gemini   - Gemini embedding API (through the embedding cache)
+    hashing  - local hashed n-gram TF-IDF, projected into a dense vector by
+               signed feature hashing. No network, sub-millisecond per query.
+
+The index manifest records which backend built it; the recruiter asks
+`provider_for_index` for the matching provider, so queries are always encoded
+the same way as the documents.
+"""
+
+import os
+import re
+import zlib
+import logging
+import numpy as np
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+GEMINI_EMBEDDING_MODEL = "models/text-embedding-004"
+DEFAULT_BACKEND = os.environ.get("EMBEDDING_BACKEND", "gemini")
+
+HASHING_DIMS = 768
+HASHING_IDF_FILE = "hashing_idf.npy"
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased alphanumeric tokens. Shared with the lexical index."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+class EmbeddingProvider:
+    """Encodes documents and queries into float32 vectors of a fixed size."""
+
+    backend: str = ""
+    model: str = ""
+    requires_api_key: bool = False
+    # A document's vector depends only on its text (not on the rest of the
+    # corpus), so vectors from a previous build can be reused as-is
+    stateless: bool = True
+
+    def fit(self, texts: Iterable[str]):
+        """Learns corpus statistics (in one streaming pass) before documents are embedded. No-op by default."""
+
+    def embed_documents(self, texts: Sequence[str]) -> np.ndarray:
+        raise NotImplementedError
+
+    def embed_queries(self, texts: Sequence[str]) -> np.ndarray:
+        raise NotImplementedError
+
+    def params(self) -> Dict[str, Any]:
+        """Backend parameters recorded in the manifest."""
+        return {}
+
+    def state_files(self) -> Dict[str, np.ndarray]:
+        """Arrays to store in the index directory (e.g. fitted IDF weights)."""
+        return {}
+
+
+class GeminiEmbeddingProvider(EmbeddingProvider):
+    backend = "gemini"
+    requires_api_key = True
+
+    def __init__(self, model: str = GEMINI_EMBEDDING_MODEL):
+        self.model = model
+
+    def _embed(self, texts: Sequence[str], task_type: str, title: Optional[str] = None,
+               use_cache: bool = True) -> np.ndarray:
+        # Imported lazily so the local backend works without the Gemini SDK configured
+        import embedding_cache
+        result = embedding_cache.embed_content(
+            model=self.model,
+            content=list(texts),
+            task_type=task_type,
+            title=title,
+            use_cache=use_cache,
+        )
+        return np.array(result['embedding'], dtype=np.float32)
+
+    def embed_documents(self, texts: Sequence[str]) -> np.ndarray:
+        # task_type="retrieval_document" optimizes for search. Index builds reuse
+        # vectors through their checkpoints and the previous index, not the disk cache
+        return self._embed(texts, "retrieval_document", title="Persona Profile", use_cache=False)
+
+    def embed_queries(self, texts: Sequence[str]) -> np.ndarray:
+        return self._embed(texts, "retrieval_query")
+
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """
+    Word unigrams and bigrams are hashed (crc32, stable across processes) into
+    `dims` signed buckets, weighted by sublinear TF times a per-bucket IDF that
+    is fitted on the corpus at build time, and L2-normalized.
+    """
+
+    backend = "hashing"
+    # The IDF is refitted on every build, so every vector changes with the corpus
+    stateless = False
+
+    def __init__(self, dims: int = HASHING_DIMS, idf: Optional[np.ndarray] = None):
+        self.dims = dims
+        self.model = f"hashing-ngram-{dims}"
+        self.idf = idf if idf is not None else np.ones(dims, dtype=np.float32)
+
+    @staticmethod
+    def _features(text: str) -> Counter:
+        tokens = tokenize(text)
+        features = Counter(tokens)
+        features.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+        return features
+
+    def _bucket(self, feature: str):
+        h = zlib.crc32(feature.encode("utf-8"))
+        return h % self.dims, (1.0 if h & 0x80000000 else -1.0)
+
+    def fit(self, texts: Iterable[str]):
+        df = np.zeros(self.dims, dtype=np.float64)
+        n = 0
+        for text in texts:
+            buckets = {self._bucket(f)[0] for f in self._features(text)}
+            df[list(buckets)] += 1
+            n += 1
+        self.idf = (np.log((1 + n) / (1 + df)) + 1.0).astype(np.float32)
+        logger.info(f"Fitted hashing IDF on {n} documents.")
+
+    def _encode(self, texts: Iterable[str]) -> np.ndarray:
+        texts = list(texts)
+        matrix = np.zeros((len(texts), self.dims), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, tf in self._features(text).items():
+                bucket, sign = self._bucket(feature)
+                matrix[row, bucket] += sign * (1.0 + np.log(tf))
+        matrix *= self.idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def embed_documents(self, texts: Sequence[str]) -> np.ndarray:
+        return self._encode(texts)
+
+    def embed_queries(self, texts: Sequence[str]) -> np.ndarray:
+        return self._encode(texts)
+
+    def params(self) -> Dict[str, Any]:
+        return {"dims": self.dims}
+
+    def state_files(self) -> Dict[str, np.ndarray]:
+        return {HASHING_IDF_FILE: self.idf}
+
+
+def create_provider(backend: str = DEFAULT_BACKEND) -> EmbeddingProvider:
+    """A fresh provider for building a new index."""
+    if backend == GeminiEmbeddingProvider.backend:
+        return GeminiEmbeddingProvider()
+    if backend == HashingEmbeddingProvider.backend:
+        return HashingEmbeddingProvider()
+    raise ValueError(f"Unknown embedding backend '{backend}'. Use 'gemini' or 'hashing'.")
+
+
+def provider_for_index(manifest: Dict[str, Any], index_dir: str) -> EmbeddingProvider:
+    """The provider an existing index was built with (indexes predating the field are Gemini)."""
+    backend = manifest.get("embedding_backend", GeminiEmbeddingProvider.backend)
+    params = manifest.get("embedding_params") or {}
+
+    if backend == GeminiEmbeddingProvider.backend:
+        return GeminiEmbeddingProvider(manifest.get("embedding_model", GEMINI_EMBEDDING_MODEL))
+    if backend == HashingEmbeddingProvider.backend:
+        idf = np.load(os.path.join(index_dir, HASHING_IDF_FILE))
+        return HashingEmbeddingProvider(dims=params.get("dims", len(idf)), idf=idf)
+    raise ValueError(f"Index '{index_dir}' was built with unknown embedding backend '{backend}'.")
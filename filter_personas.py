@@ -5,12 +5,26 @@ Filtering criteria:
 1. Length: 20-150 words
 2. Contains human markers (age, location, profession, hobbies, emotions)
 3. Excludes AI-related terms
+
+The input is streamed in chunks and kept records are appended to a JSONL
+output, so the dataset never has to fit in memory. Each chunk is matched
+against one compiled alternation per marker list with vectorized pandas
+string ops, and chunks are spread over a process pool.
 """
 
+import os
+import re
 import json
+import time
 import pandas as pd
-import re
-from typing import Optional
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from record_stream import RecordWriter, read_lines, read_records, batched, run_ordered, dataset_persona_field
+
+# Records per pandas chunk (one unit of work for the process pool)
+CHUNK_SIZE = 50000
+FILTER_WORKERS = int(os.environ.get("FILTER_WORKERS", "0")) or os.cpu_count() or 1
 
 # Keywords that indicate human-like personas
 HUMAN_MARKERS = [
@@ -29,6 +43,18 @@ AI_MARKERS = [
     'virtual assistant', 'digital assistant', 'automated'
 ]
 
+def _alternation(markers: List[str]) -> re.Pattern:
+    """
+    One compiled alternation for a marker list, matched against lowercased text.
+    Unanchored, so it keeps the substring semantics of `marker in text`.
+    """
+    return re.compile("|".join(re.escape(m) for m in sorted(set(markers), key=len, reverse=True)))
+
+HUMAN_PATTERN = _alternation(HUMAN_MARKERS)
+AI_PATTERN = _alternation(AI_MARKERS)
+# Same tokens as str.split(): maximal runs of non-whitespace
+WORD_PATTERN = re.compile(r"\S+")
+
 def count_words(text: str) -> int:
     """Count words in text."""
     if pd.isna(text) or not isinstance(text, str):
@@ -39,95 +65,137 @@ def contains_human_markers(text: str) -> bool:
     """Check if text contains human-like markers."""
     if pd.isna(text) or not isinstance(text, str):
         return False
-    text_lower = text.lower()
-    return any(marker in text_lower for marker in HUMAN_MARKERS)
+    return HUMAN_PATTERN.search(text.lower()) is not None
 
 def contains_ai_markers(text: str) -> bool:
     """Check if text contains AI-related terms."""
     if pd.isna(text) or not isinstance(text, str):
         return False
-    text_lower = text.lower()
-    return any(marker in text_lower for marker in AI_MARKERS)
+    return AI_PATTERN.search(text.lower()) is not None
+
+def mark_texts(texts: pd.Series) -> pd.DataFrame:
+    """
+    Vectorized word counts and marker flags for a column of texts.
+    Non-string values count as 0 words without markers, like the scalar helpers.
+    """
+    # The .str accessor turns non-strings into NaN
+    lowered = texts.astype(object).str.lower()
+    return pd.DataFrame({
+        'word_count': lowered.str.count(WORD_PATTERN).fillna(0).astype(int),
+        'has_human_markers': lowered.str.contains(HUMAN_PATTERN, na=False).astype(bool),
+        'has_ai_markers': lowered.str.contains(AI_PATTERN, na=False).astype(bool),
+    })
+
+def _filter_chunk(job: Tuple[List[str], str, int, int]) -> Tuple[List[str], Dict[str, Any]]:
+    """
+    Runs in a worker process on raw JSONL lines: parses them, marks the
+    persona texts and returns the kept lines unchanged and the counters.
+    """
+    lines, persona_field, min_words, max_words = job
+    records = [json.loads(line) for line in lines]
+    stats = {"input": len(records)}
+    marks = mark_texts(pd.Series([r.get(persona_field) for r in records], dtype=object))
+    
+    # Apply filters: length, then AI exclusion, then human markers
+    keep = (marks['word_count'] >= min_words) & (marks['word_count'] <= max_words)
+    stats.update({
+        "with_human_markers": int(marks['has_human_markers'].sum()),
+        "with_ai_markers": int(marks['has_ai_markers'].sum()),
+        "min_words": int(marks['word_count'].min()) if len(records) else None,
+        "max_words": int(marks['word_count'].max()) if len(records) else None,
+        "length": int(keep.sum()),
+    })
+    keep &= ~marks['has_ai_markers']
+    stats["ai_excluded"] = int(keep.sum())
+    keep &= marks['has_human_markers']
+    stats["human"] = int(keep.sum())
+    return [line for line, kept in zip(lines, keep.tolist()) if kept], stats
 
 def filter_personas(
     input_file: str,
     output_file: str,
     min_words: int = 20,
     max_words: int = 150,
-    verbose: bool = True
-) -> pd.DataFrame:
+    verbose: bool = True,
+    chunk_size: int = CHUNK_SIZE,
+    workers: int = FILTER_WORKERS,
+) -> dict:
     """
     Filter PersonaHub dataset for human-like personas using pandas.
+    Records are streamed in chunks of `chunk_size` (see record_stream.py), so
+    memory stays constant for any input size. Chunks are marked with compiled
+    marker alternations and vectorized string ops across `workers` processes.
     
     Args:
-        input_file: Path to input JSON file
-        output_file: Path to save filtered JSON file
+        input_file: Path to input JSONL/JSON file or directory of JSONL shards
+        output_file: Path to save filtered JSONL file
         min_words: Minimum word count (default: 20)
         max_words: Maximum word count (default: 150)
         verbose: Print filtering statistics
+        chunk_size: Records per pandas chunk
+        workers: Worker processes (1: filter in-process)
     
     Returns:
-        Filtered DataFrame
+        Filtering statistics (counts per stage)
     """
-    # Load input data into pandas DataFrame
-    print(f"Loading data from {input_file}...")
-    df = pd.read_json(input_file)
-    
-    initial_count = len(df)
-    print(f"Loaded {initial_count} records")
-    
-    # Try to identify the persona field
-    persona_field = None
-    for field in ['persona', 'input_persona', 'synthesized_text', 'text', 'instruction']:
-        if field in df.columns:
-            persona_field = field
-            print(f"Using '{field}' as persona field")
-            break
-    
+    print(f"Streaming data from {input_file}...")
+    
+    stats = {
+        "input": 0, "length": 0, "ai_excluded": 0, "human": 0,
+        "with_human_markers": 0, "with_ai_markers": 0,
+        "min_words": None, "max_words": None,
+    }
+    samples = []
+    started = time.monotonic()
+    
+    # Identify the persona field once for the whole dataset (dedup_personas.py does the same)
+    persona_field = dataset_persona_field(input_file)
     if persona_field is None:
         print("Error: No persona field found in dataset!")
-        print(f"Available columns: {df.columns.tolist()}")
-        return pd.DataFrame()
-    
-    # Create a copy to work with
-    df = df.copy()
-    
-    # Add word count column
-    df['word_count'] = df[persona_field].apply(count_words)
-    
-    # Add marker columns for analysis
-    df['has_human_markers'] = df[persona_field].apply(contains_human_markers)
-    df['has_ai_markers'] = df[persona_field].apply(contains_ai_markers)
-    
-    if verbose:
+        print(f"Available columns: {sorted({key for record in read_records(input_file, chunk_size) for key in record})}")
+        return stats
+    print(f"Using '{persona_field}' as persona field")
+    
+    with RecordWriter(output_file) as writer:
+        def _on_chunk(job, result):
+            kept_lines, chunk_stats = result
+            for key in ("input", "length", "ai_excluded", "human", "with_human_markers", "with_ai_markers"):
+                stats[key] += chunk_stats[key]
+            for key, pick in (("min_words", min), ("max_words", max)):
+                if chunk_stats[key] is not None:
+                    stats[key] = chunk_stats[key] if stats[key] is None else pick(stats[key], chunk_stats[key])
+            
+            # Original records are written unchanged
+            for line in kept_lines:
+                writer.write_line(line)
+                if len(samples) < 3:
+                    samples.append(json.loads(line)[persona_field])
+            
+            if verbose:
+                rate = stats["input"] / max(time.monotonic() - started, 1e-9)
+                print(f"  ...{stats['input']} records read, {writer.count} kept | {rate:,.0f} rows/s")
+        
+        chunks = batched(read_lines(input_file), chunk_size)
+        jobs = ((lines, persona_field, min_words, max_words) for lines in chunks)
+        # A single worker runs in-process (no pickling); otherwise chunks fan out to processes
+        pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else ThreadPoolExecutor(max_workers=1)
+        with pool:
+            run_ordered(jobs, _filter_chunk, _on_chunk, pool, max_pending=workers * 2)
+    
+    elapsed = time.monotonic() - started
+    stats["rows_per_second"] = stats["input"] / max(elapsed, 1e-9)
+    
+    initial_count = stats["input"]
+    if verbose and initial_count:
         print("\nInitial statistics:")
-        print(f"  Word count range: {df['word_count'].min()} - {df['word_count'].max()}")
-        print(f"  Records with human markers: {df['has_human_markers'].sum()} ({df['has_human_markers'].sum()/len(df)*100:.2f}%)")
-        print(f"  Records with AI markers: {df['has_ai_markers'].sum()} ({df['has_ai_markers'].sum()/len(df)*100:.2f}%)")
-    
-    # Apply filters
-    print(f"\nApplying filters...")
-    
-    # Filter by word count
-    before_length = len(df)
-    df = df[(df['word_count'] >= min_words) & (df['word_count'] <= max_words)]
-    print(f"  Length filter ({min_words}-{max_words} words): {before_length} → {len(df)} (-{before_length - len(df)})")
-    
-    # Filter out AI markers
-    before_ai = len(df)
-    df = df[~df['has_ai_markers']]
-    print(f"  AI exclusion filter: {before_ai} → {len(df)} (-{before_ai - len(df)})")
-    
-    # Filter for human markers
-    before_human = len(df)
-    df = df[df['has_human_markers']]
-    print(f"  Human marker filter: {before_human} → {len(df)} (-{before_human - len(df)})")
-    
-    # Remove temporary columns
-    filtered_df = df.drop(columns=['word_count', 'has_human_markers', 'has_ai_markers'])
-    
-    # Save to JSON
-    filtered_df.to_json(output_file, orient='records', force_ascii=False, indent=2)
+        print(f"  Word count range: {stats['min_words']} - {stats['max_words']}")
+        print(f"  Records with human markers: {stats['with_human_markers']} ({stats['with_human_markers']/initial_count*100:.2f}%)")
+        print(f"  Records with AI markers: {stats['with_ai_markers']} ({stats['with_ai_markers']/initial_count*100:.2f}%)")
+        
+        print(f"\nApplied filters:")
+        print(f"  Length filter ({min_words}-{max_words} words): {initial_count} → {stats['length']} (-{initial_count - stats['length']})")
+        print(f"  AI exclusion filter: {stats['length']} → {stats['ai_excluded']} (-{stats['length'] - stats['ai_excluded']})")
+        print(f"  Human marker filter: {stats['ai_excluded']} → {stats['human']} (-{stats['ai_excluded'] - stats['human']})")
     
     # Print statistics
     if verbose:
@@ -135,26 +203,26 @@ def filter_personas(
         print("FILTERING RESULTS")
         print("="*60)
         print(f"Input records:    {initial_count}")
-        print(f"Filtered records: {len(filtered_df)}")
-        print(f"Retention rate:   {len(filtered_df)/initial_count*100:.2f}%")
+        print(f"Filtered records: {stats['human']}")
+        print(f"Retention rate:   {stats['human']/max(initial_count, 1)*100:.2f}%")
+        print(f"Throughput:       {stats['rows_per_second']:,.0f} rows/s ({elapsed:.1f}s, {workers} workers)")
         print(f"\nSaved to: {output_file}")
         
         # Show sample filtered personas
-        if len(filtered_df) > 0:
+        if samples:
             print("\n" + "="*60)
             print("SAMPLE FILTERED PERSONAS (first 3)")
             print("="*60)
-            for i, (idx, row) in enumerate(filtered_df.head(3).iterrows()):
-                persona_text = row[persona_field]
+            for i, persona_text in enumerate(samples):
                 print(f"\n{i+1}. [{count_words(persona_text)} words]")
                 print(persona_text[:300] + ("..." if len(persona_text) > 300 else ""))
     
-    return filtered_df
+    return stats
 
 if __name__ == "__main__":
     filter_personas(
-        input_file='personahub_instruction_20k.json',
-        output_file='personahub_filtered_human.json',
+        input_file='personahub_instruction_20k.jsonl',
+        output_file='personahub_filtered_human.jsonl',
         min_words=20,
         max_words=150,
         verbose=True
@@ -7,6 +7,7 @@ import Sidebar from './components/Sidebar';
 import IterationCard from './components/IterationCard';
 import TranscriptModal from './components/TranscriptModal';
 import IntroPanel from './components/IntroPanel';
+import LiveOutput from './components/LiveOutput';
 
 function App() {
   const {
@@ -15,6 +16,7 @@ function App() {
     setIdea,
     iterations,
     currentIteration,
+    liveOutput,
     config,
     startValidation,
     stopValidation,
@@ -80,7 +82,8 @@ function App() {
     currentIteration.interviews.length > 0
   );
 
-  const hasResults = allIterations.length > 0 || showCurrentIteration;
+  const hasLiveOutput = status === 'running' && Object.keys(liveOutput).length > 0;
+  const hasResults = allIterations.length > 0 || showCurrentIteration || hasLiveOutput;
 
   return (
     <div className="app">
@@ -185,6 +188,9 @@ function App() {
               />
             )}
 
+            {/* Tokens of the node that is still running */}
+            {status === 'running' && <LiveOutput liveOutput={liveOutput} />}
+
             {/* Export */}
             {status === 'complete' && (
               <div className="export-section">
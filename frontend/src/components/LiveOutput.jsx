@@ -0,0 +1,57 @@
+const NODE_LABELS = {
+    generator: 'THE CONCEPT',
+    researcher: 'RESEARCH PLAN',
+    analyst: 'ANALYST',
+    critic: 'THE INVESTOR',
+};
+
+function LiveOutput({ liveOutput }) {
+    const nodes = Object.keys(liveOutput).filter((node) => liveOutput[node].text);
+    if (nodes.length === 0) return null;
+
+    return (
+        <>
+            {nodes.map((node) => (
+                <div key={node} className="comic-panel fade-in" style={{
+                    border: 'var(--border-width) solid var(--c-ink)',
+                    boxShadow: '8px 8px 0 var(--c-ink)',
+                    background: 'var(--c-panel)',
+                    position: 'relative',
+                    marginTop: '1.5rem'
+                }}>
+                    <div style={{
+                        background: 'var(--c-ink)',
+                        color: 'var(--c-panel)',
+                        padding: '0.2rem 1rem',
+                        display: 'inline-block',
+                        position: 'absolute',
+                        top: '-15px',
+                        left: '-4px',
+                        fontFamily: 'var(--font-headline)',
+                        fontSize: '1.2rem',
+                        border: 'var(--border-width) solid var(--c-ink)'
+                    }}>
+                        <span className="loading-spinner"></span>
+                        {NODE_LABELS[node] || node.toUpperCase()} IS WRITING...
+                    </div>
+
+                    {/* Raw model output (often partial JSON) until the node returns its result */}
+                    <pre style={{
+                        fontFamily: 'var(--font-body)',
+                        fontSize: '0.95rem',
+                        whiteSpace: 'pre-wrap',
+                        wordBreak: 'break-word',
+                        marginTop: '1rem',
+                        maxHeight: '300px',
+                        overflowY: 'auto',
+                        color: 'var(--c-ink-soft)'
+                    }}>
+                        {liveOutput[node].text}
+                    </pre>
+                </div>
+            ))}
+        </>
+    );
+}
+
+export default LiveOutput;
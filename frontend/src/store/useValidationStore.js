@@ -34,6 +34,9 @@ const useValidationStore = create((set, get) => ({
         critique: null,
     },
 
+    // Live LLM output per node while it is being generated: { [node]: { messageId, text } }
+    liveOutput: {},
+
     // Error
     error: null,
 
@@ -56,6 +59,7 @@ const useValidationStore = create((set, get) => ({
             analystReport: null,
             critique: null,
         },
+        liveOutput: {},
         error: null,
     }),
 
@@ -97,6 +101,26 @@ const useValidationStore = create((set, get) => ({
         // Check if aborted
         if (get().status === 'stopped') return;
 
+        // Token deltas: "<node>.delta" while the node's LLM call is running
+        if (eventType.endsWith('.delta')) {
+            const node = eventType.slice(0, -'.delta'.length);
+            set((state) => {
+                const previous = state.liveOutput[node];
+                // A new message id means the node started a new call (e.g. a retry)
+                const text = previous && previous.messageId === data.message_id
+                    ? previous.text + data.text
+                    : data.text;
+                return { liveOutput: { ...state.liveOutput, [node]: { messageId: data.message_id, text } } };
+            });
+            return;
+        }
+
+        // The node's final result replaces its live output
+        if (get().liveOutput[eventType]) {
+            const { [eventType]: _done, ...rest } = get().liveOutput;
+            set({ liveOutput: rest });
+        }
+
         const handlers = {
             start: () => set({ status: 'running', error: null }),
 
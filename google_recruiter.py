@@ -1,13 +1,16 @@
 import os
 import json
 import logging
+import functools
 import numpy as np
-import google.generativeai as genai
-from google.api_core import retry
 from typing import List, Dict, Any, Optional
-from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 
+import index_registry
+from diversity import mmr_select, MMR_LAMBDA
+from embeddings import EmbeddingProvider, provider_for_index
+from persona_index import DEFAULT_INDEX_DIR
+
 # Load environment variables
 load_dotenv()
 
@@ -16,156 +19,241 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 logger = logging.getLogger(__name__)
 
 # Constants
-INDEX_FILE = "personas_index.json"
-EMBEDDING_MODEL = "models/text-embedding-004"
-GENERATION_MODEL = "gemini-1.5-flash"
+INDEX_DIR = DEFAULT_INDEX_DIR
+# Candidates per query considered by diverse search, as a multiple of k
+MMR_POOL_FACTOR = 5
+
 
-# --- Pydantic Models ---
+def is_transient_error(error: BaseException) -> bool:
+    """Embedding API and network failures worth retrying; index errors surface at once."""
+    from google.api_core import exceptions as api_exceptions
+    # A missing or unreadable index file is an OSError too, but retrying will not fix it
+    if isinstance(error, (FileNotFoundError, PermissionError, IsADirectoryError, NotADirectoryError)):
+        return False
+    return isinstance(error, (
+        api_exceptions.ServiceUnavailable,
+        api_exceptions.ResourceExhausted,
+        api_exceptions.TooManyRequests,
+        api_exceptions.InternalServerError,
+        api_exceptions.DeadlineExceeded,
+        api_exceptions.GatewayTimeout,
+        OSError,
+    ))
 
-class RichPersona(BaseModel):
-    """Represents a detailed persona selected for the interview."""
-    name: str = Field(description="A generated name for the persona")
-    role: str = Field(description="Role or profession of the persona")
-    background: str = Field(description="Key background details relevant to the startup idea")
-    attitude: str = Field(description="Attitude towards the idea (e.g., Enthusiastic, Skeptical, Critical)")
-    original_text: str = Field(description="The original raw text from the dataset")
 
-class RecruiterState(BaseModel):
-    """State for the recruiter node."""
-    startup_idea: str
-    selected_personas: List[RichPersona] = []
+def retry_transient(fn):
+    """Retries `fn` on transient errors. The Google SDK is only imported on the first call."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        from google.api_core import retry
+        return retry.Retry(predicate=is_transient_error)(fn)(*args, **kwargs)
+    return wrapper
 
 # --- GoogleRecruiter Class ---
 
+_configured_api_key: Optional[str] = None
+
+def configure_genai(api_key: str):
+    """Configures the Gemini SDK once per process (and again only if the key changes)."""
+    global _configured_api_key
+    if _configured_api_key != api_key:
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        _configured_api_key = api_key
+
 class GoogleRecruiter:
-    def __init__(self, api_key: Optional[str] = None, index_file: str = INDEX_FILE):
-        self.api_key = api_key or os.environ.get("GOOGLE_API_KEY")
-        if not self.api_key:
-            raise ValueError("GOOGLE_API_KEY not found.")
-        
-        genai.configure(api_key=self.api_key)
-        self.index_file = index_file
-        self.embeddings = None
-        self.texts = None
+    def __init__(self, api_key: Optional[str] = None, index_dir: str = INDEX_DIR):
+        self.index_dir = index_dir
+        self.index: Optional[index_registry.AnyIndex] = None
+        self.provider: Optional[EmbeddingProvider] = None
         self._load_index()
+        
+        # Only the Gemini backend needs the API; local indexes search fully offline
+        self.api_key = api_key or os.environ.get("GOOGLE_API_KEY")
+        if self.provider.requires_api_key:
+            if not self.api_key:
+                self.close()
+                raise ValueError("GOOGLE_API_KEY not found.")
+            configure_genai(self.api_key)
 
     def _load_index(self):
-        """Loads the vector index."""
-        if not os.path.exists(self.index_file):
-            raise FileNotFoundError(
-                f"Index file '{self.index_file}' not found. "
-                "Please run 'build_vector_index.py' first."
-            )
-        
-        logger.info(f"Loading index from {self.index_file}...")
-        with open(self.index_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            
-        self.embeddings = np.array(data['embeddings'])
-        self.texts = data['texts']
-        logger.info(f"Loaded {len(self.texts)} personas and embeddings.")
+        """
+        Leases the shared, already-opened index from the process registry.
+        The recruiter keeps that snapshot until `close` (one graph run); a newly
+        published version is picked up by the next recruiter, and the old one is
+        unmapped once no recruiter holds it.
+        Queries are encoded by the same backend that built the index.
+        """
+        self.index = index_registry.acquire(self.index_dir)
+        self.provider = provider_for_index(self.index.manifest, self.index.index_dir)
+
+    def close(self):
+        """Returns the index lease. The recruiter must not search afterwards."""
+        if self.index is not None:
+            index_registry.release(self.index)
+            self.index = None
+
+    def __enter__(self):
+        return self
 
-    @retry.Retry(predicate=retry.if_exception_type(Exception))
-    def search_personas(self, query: str, limit: int = 10) -> List[str]:
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def __del__(self):
+        # Safety net for callers that never close (module globals may be gone at exit)
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    @retry_transient
+    def search_personas(
+        self,
+        query: str,
+        limit: int = 10,
+        nprobe: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> List[str]:
         """
         Searches for personas using vector similarity.
+        `nprobe` is the recall/latency knob of the IVF index (ignored for exact search).
+        `filters` (e.g. {"age": (35, 50), "profession": ["sales"]}) restrict the
+        search to matching rows; see persona_metadata.filters_from_query.
         """
         logger.info(f"--- [Recruiter] Search Query ---")
-        logger.info(f"Query: {query}")
+        logger.info(f"Query: {query}" + (f" | Filters: {filters}" if filters else ""))
         
-        # Embed query
-        result = genai.embed_content(
-            model=EMBEDDING_MODEL,
-            content=query,
-            task_type="retrieval_query"
-        )
-        query_embedding = np.array(result['embedding'])
+        # Embed query (Gemini: repeated phrasings are served from the embedding cache)
+        query_embedding = self.provider.embed_queries([query])[0]
         
-        # Compute cosine similarity
-        scores = np.dot(self.embeddings, query_embedding)
-        
-        # Get top K indices
-        top_indices = np.argsort(scores)[-limit:][::-1]
+        # Compute cosine similarity over the matching rows and take top K
+        hits = self.index.search(query_embedding, limit, nprobe=nprobe, filters=filters)
         
         results = []
         logger.info(f"--- [Recruiter] Search Results (Top {limit}) ---")
-        for rank, idx in enumerate(top_indices, 1):
-            score = scores[idx]
-            text = self.texts[idx]
+        for rank, (idx, score) in enumerate(hits, 1):
+            text = self.index.text(idx)
             snippet = text[:100].replace('\n', ' ')
             logger.info(f"Rank {rank}: Score={score:.4f} | Text='{snippet}...'")
-            results.append(self.texts[idx])
+            results.append(text)
             
         logger.info(f"Found {len(results)} relevant personas.")
         return results
 
-# --- Recruiter Node ---
-
-def recruiter_node(state: RecruiterState) -> RecruiterState:
-    """
-    Orchestrates the finding and selection of personas.
-    """
-    logger.info("Starting recruiter_node...")
-    
-    try:
-        # 1. Initialize Recruiter
-        recruiter = GoogleRecruiter()
-        
-        # 2. Search
-        raw_chunks = recruiter.search_personas(state.startup_idea, limit=10)
-        
-        if not raw_chunks:
-            logger.warning("No personas found.")
-            return state
-            
-        context_text = "\n\n".join([f"Persona {i+1}:\n{chunk}" for i, chunk in enumerate(raw_chunks)])
-        
-        # 3. Parse and Select with Gemini
-        parsing_model = genai.GenerativeModel(
-            GENERATION_MODEL,
-            generation_config={
-                "response_mime_type": "application/json",
-                "response_schema": list[RichPersona]
-            }
-        )
-        
-        selection_prompt = f"""
-        Here is the description of a startup idea: "{state.startup_idea}"
-        
-        Here are {len(raw_chunks)} potential candidate profiles found in our database:
-        
-        {context_text}
+    def _search_hits(
+        self,
+        queries: List[str],
+        limit: int,
+        nprobe: Optional[int],
+        hybrid: bool,
+        filters: List[Optional[Dict[str, Any]]],
+        query_embeddings: Optional[np.ndarray] = None,
+    ):
+        """
+        Embeds all queries in one request (unless `query_embeddings` are given)
+        and returns (query embeddings, (row, score) hits per query).
+        """
+        if query_embeddings is None:
+            query_embeddings = self.provider.embed_queries(queries)
+        query_embeddings = np.asarray(query_embeddings, dtype=np.float32)
         
-        Your Task:
-        1. Analyze these profiles.
-        2. Select exactly 3 BEST target users and 1 TOUGH CRITIC.
-        3. Extract their details and format them into the required JSON structure.
-        4. For the 'attitude' field, label the critic as 'Critical' or 'Skeptical'.
+        # Group queries by filter so each group is one masked matrix product
+        groups: Dict[str, List[int]] = {}
+        for i, query_filters in enumerate(filters):
+            groups.setdefault(json.dumps(query_filters, sort_keys=True), []).append(i)
         
-        Return ONLY the JSON list.
+        batch_hits: List[List] = [[] for _ in queries]
+        for positions in groups.values():
+            group_hits = self.index.search_batch(
+                query_embeddings[positions],
+                limit,
+                nprobe=nprobe,
+                query_texts=[queries[i] for i in positions] if hybrid else None,
+                filters=filters[positions[0]],
+            )
+            for i, hits in zip(positions, group_hits):
+                batch_hits[i] = hits
+        return query_embeddings, batch_hits
+
+    @retry_transient
+    def search_personas_batch(
+        self,
+        queries: List[str],
+        k: int = 3,
+        nprobe: Optional[int] = None,
+        hybrid: bool = True,
+        filters: Optional[List[Optional[Dict[str, Any]]]] = None,
+    ) -> List[List[str]]:
+        """
+        Searches for several queries at once: one embedding request for all of
+        them and one matrix product over the index. Returns texts per query.
+        With `hybrid`, BM25 matches on the query words are fused in, so hard
+        constraints like a profession are not lost to pure cosine similarity.
+        `filters` holds one metadata filter (or None) per query; queries sharing
+        the same filter are still searched together.
         """
+        if not queries:
+            return []
+        logger.info(f"--- [Recruiter] Batch Search ({len(queries)} queries, top {k}) ---")
         
-        logger.info("Asking Gemini to select and parse personas...")
-        response = parsing_model.generate_content(selection_prompt)
+        filters = filters or [None] * len(queries)
+        _, batch_hits = self._search_hits(queries, k, nprobe, hybrid, filters)
         
-        selected_personas_data = json.loads(response.text)
-        state.selected_personas = [RichPersona(**p) for p in selected_personas_data]
+        results = []
+        for query, query_filters, hits in zip(queries, filters, batch_hits):
+            logger.info(f"Query: {query}" + (f" | Filters: {query_filters}" if query_filters else ""))
+            texts = []
+            for rank, (idx, score) in enumerate(hits, 1):
+                text = self.index.text(idx)
+                logger.info(f"  Rank {rank}: Score={score:.4f} | Text='{text[:100]}...'".replace('\n', ' '))
+                texts.append(text)
+            results.append(texts)
+        return results
+
+    @retry_transient
+    def search_personas_diverse(
+        self,
+        queries: List[str],
+        k: int = 3,
+        nprobe: Optional[int] = None,
+        hybrid: bool = True,
+        filters: Optional[List[Optional[Dict[str, Any]]]] = None,
+        lambda_: float = MMR_LAMBDA,
+        query_embeddings: Optional[np.ndarray] = None,
+    ) -> List[List[str]]:
+        """
+        Like `search_personas_batch`, but the specs of one round never share a
+        persona: each query draws from a deeper candidate pool and the final k
+        per query are chosen by maximal marginal relevance across all queries
+        (see diversity.py). Near-duplicate rows are only returned once.
+        `query_embeddings` skips the embedding request when the caller has them.
+        """
+        if not queries:
+            return []
+        depth = k * MMR_POOL_FACTOR
+        logger.info(f"--- [Recruiter] Diverse Search ({len(queries)} queries, top {k} of {depth}) ---")
         
-        logger.info(f"Successfully selected {len(state.selected_personas)} personas.")
+        filters = filters or [None] * len(queries)
+        query_embeddings, batch_hits = self._search_hits(queries, depth, nprobe, hybrid, filters, query_embeddings)
         
-    except Exception as e:
-        logger.error(f"Error in recruiter_node: {e}")
-        raise
+        candidate_rows = [[r for r, _ in hits] for hits in batch_hits]
+        rows = np.unique(np.array([r for c in candidate_rows for r in c], dtype=np.int64))
+        selected = mmr_select(
+            query_embeddings, candidate_rows, self.index.embeddings[rows], rows, k, lambda_=lambda_
+        )
         
-    return state
+        results = []
+        for query, picks in zip(queries, selected):
+            logger.info(f"Query: {query}")
+            texts = self.index.texts(picks)
+            for rank, text in enumerate(texts, 1):
+                logger.info(f"  Pick {rank}: Text='{text[:100]}...'".replace('\n', ' '))
+            results.append(texts)
+        return results
 
 if __name__ == "__main__":
-    # Test
-    test_idea = "A subscription service for rare and exotic houseplants with AI care tips."
-    try:
-        initial_state = RecruiterState(startup_idea=test_idea)
-        final_state = recruiter_node(initial_state)
-        for p in final_state.selected_personas:
-            print(f"\nName: {p.name}\nRole: {p.role}\nAttitude: {p.attitude}")
-    except Exception as e:
-        print(f"Error: {e}")
+    # Smoke test against the local index
+    with GoogleRecruiter() as recruiter:
+        for text in recruiter.search_personas("A subscription service for rare houseplants with AI care tips.", limit=5):
+            print(f"\n{text[:300]}")
@@ -0,0 +1,172 @@
+"""
+Process-wide registry of opened persona indexes.
+
+The index is opened once (at API startup or on first use) and shared by all
+graph runs in the process. Every lookup stats the version pointer and the
+manifest, so a newly published version (see index_versions.py) is picked up on
+the next lookup without a restart.
+
+Runs hold the index through a lease (`acquire` / `release`). A replaced index
+stays open while leases on it are outstanding and is closed when the last one
+is released, so at most the pages of the versions still in use are mapped and
+memory never has to hold two copies for longer than an in-flight search.
+Each opened version is also leased on disk (see index_versions.py) until it is
+closed, so a publish from another process cannot prune files it still reads.
+"""
+
+import os
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple, Union
+
+from persona_index import PersonaIndex, DEFAULT_INDEX_DIR, MANIFEST_FILE, convert_legacy_index
+from sharded_index import ShardedPersonaIndex, open_index
+from index_versions import CURRENT_FILE, VersionLease, lease_version, resolve_index_dir
+from embeddings import GEMINI_EMBEDDING_MODEL
+
+logger = logging.getLogger(__name__)
+
+LEGACY_INDEX_FILE = "personas_index.json"
+
+# Either a PersonaIndex or, for sharded builds, a ShardedPersonaIndex (same search API)
+AnyIndex = Union[PersonaIndex, ShardedPersonaIndex]
+Stamp = Tuple[Optional[Tuple[int, int, int]], Optional[Tuple[int, int, int]]]
+
+
+class _Entry:
+    def __init__(self, index: AnyIndex, stamp: Stamp, version_lease: Optional[VersionLease] = None):
+        self.index = index
+        self.stamp = stamp
+        self.version_lease = version_lease
+        self.leases = 0
+        self.retired = False
+
+    def close(self):
+        self.index.close()
+        if self.version_lease is not None:
+            self.version_lease.release()
+
+
+_lock = threading.Lock()
+_indexes: Dict[str, _Entry] = {}
+# Entries replaced by a newer version but still leased, by id of their index
+_retired: Dict[int, _Entry] = {}
+
+
+def _stat(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def _manifest_stamp(index_dir: str) -> Stamp:
+    """Stats of the version pointer and the live manifest; either changes when a new index is published."""
+    return (
+        _stat(os.path.join(index_dir, CURRENT_FILE)),
+        _stat(os.path.join(resolve_index_dir(index_dir), MANIFEST_FILE)),
+    )
+
+
+def _open(index_dir: str, stamp: Stamp) -> _Entry:
+    if not os.path.exists(index_dir) and os.path.exists(LEGACY_INDEX_FILE):
+        # One-off migration of the old JSON index; later loads are instant
+        logger.warning(f"Index '{index_dir}' not found, converting legacy {LEGACY_INDEX_FILE}...")
+        convert_legacy_index(LEGACY_INDEX_FILE, index_dir, GEMINI_EMBEDDING_MODEL)
+
+    path, version_lease = lease_version(index_dir)
+    try:
+        index = open_index(path)
+    except BaseException:
+        if version_lease is not None:
+            version_lease.release()
+        raise
+    shards = f", {len(index.shards)} shards" if isinstance(index, ShardedPersonaIndex) else ""
+    logger.info(f"Opened index {index.index_dir}: {len(index)} personas ({index.dims} dims{shards}).")
+    return _Entry(index, stamp, version_lease)
+
+
+def _retire(entry: _Entry):
+    """Called with the lock held: closes a replaced index now, or once its last lease ends."""
+    entry.retired = True
+    if entry.leases == 0:
+        entry.close()
+    else:
+        _retired[id(entry.index)] = entry
+
+
+def _current(index_dir: str) -> _Entry:
+    key = os.path.abspath(index_dir)
+    stamp = _manifest_stamp(index_dir)
+
+    entry = _indexes.get(key)
+    if entry is not None and entry.stamp == stamp:
+        return entry
+
+    with _lock:
+        # Another thread may have swapped it while we waited
+        entry = _indexes.get(key)
+        stamp = _manifest_stamp(index_dir)
+        if entry is not None and entry.stamp == stamp:
+            return entry
+
+        fresh = _open(index_dir, stamp)
+        _indexes[key] = fresh
+        if entry is not None:
+            logger.info(f"Hot-swapped index {index_dir}.")
+            _retire(entry)
+        return fresh
+
+
+def get_index(index_dir: str = DEFAULT_INDEX_DIR) -> AnyIndex:
+    """
+    Returns the shared index for `index_dir`, reopening it if a new version was
+    published since it was last opened. Without a lease the index may be closed
+    by the next swap; use `acquire` / `lease` to keep it for a whole run.
+    """
+    return _current(index_dir).index
+
+
+def acquire(index_dir: str = DEFAULT_INDEX_DIR) -> AnyIndex:
+    """The current index, kept open until the matching `release`."""
+    while True:
+        entry = _current(index_dir)
+        with _lock:
+            # A swap may have retired (and closed) it between lookup and lease
+            if not entry.retired:
+                entry.leases += 1
+                return entry.index
+
+
+def release(index: AnyIndex):
+    with _lock:
+        for entry in list(_indexes.values()) + list(_retired.values()):
+            if entry.index is index:
+                break
+        else:
+            return
+        entry.leases -= 1
+        if entry.retired and entry.leases == 0:
+            _retired.pop(id(index), None)
+            entry.close()
+            logger.info(f"Closed replaced index {index.index_dir}.")
+
+
+@contextmanager
+def lease(index_dir: str = DEFAULT_INDEX_DIR):
+    index = acquire(index_dir)
+    try:
+        yield index
+    finally:
+        release(index)
+
+
+def preload(index_dir: str = DEFAULT_INDEX_DIR) -> Optional[AnyIndex]:
+    """Opens the index ahead of the first request. Missing indexes are only logged."""
+    try:
+        return get_index(index_dir)
+    except FileNotFoundError as e:
+        logger.warning(f"Persona index not preloaded: {e}")
+        return None
@@ -0,0 +1,231 @@
+"""
+Versioned index directories with an atomic "current" pointer.
+
+    personas_index/
+        CURRENT                  - id of the live version (one line)
+        versions/<id>/           - complete indexes (single or sharded), never
+                                   modified after they are published
+        leases/<id>.lock         - lock files of the versions processes have open
+
+A build writes a new version directory next to the live one and, once it is
+complete and its checksum verifies, replaces CURRENT with a rename. Readers
+resolve CURRENT when they open the index, so they see either the old or the
+new version in full, never a mix. Old versions are pruned after a publish.
+
+Indexes open their files lazily (column store, IVF lists, metadata), so a
+version has to outlive every process that still reads it. Readers open a
+version through `lease_version`, which holds a shared lock on its lock file
+until `release`; `prune` skips versions it cannot lock exclusively. Locks die
+with their process, so a crashed reader never pins a version. Where flock is
+unavailable, leases are not enforced.
+
+A root without CURRENT is an unversioned index and is opened directly.
+
+    python index_versions.py list [root]
+    python index_versions.py verify [root] [id]
+    python index_versions.py rollback <id> [root]
+"""
+
+import os
+import time
+import shutil
+import logging
+from typing import List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, leases are not enforced
+    fcntl = None
+
+from persona_index import DEFAULT_INDEX_DIR, MANIFEST_FILE, read_manifest, index_checksum
+
+logger = logging.getLogger(__name__)
+
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+LEASES_DIR = "leases"
+# Published versions kept on disk, the live one included (older ones allow a rollback)
+KEEP_VERSIONS = int(os.environ.get("INDEX_KEEP_VERSIONS", "2"))
+
+
+def version_dir(root: str, version: str) -> str:
+    return os.path.join(root, VERSIONS_DIR, version)
+
+
+def current_version(root: str) -> Optional[str]:
+    try:
+        with open(os.path.join(root, CURRENT_FILE), 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def resolve_index_dir(root: str) -> str:
+    """Directory of the live index under `root` (`root` itself when unversioned)."""
+    version = current_version(root)
+    return version_dir(root, version) if version else root
+
+
+def list_versions(root: str) -> List[str]:
+    """Complete (manifest written) versions, oldest first. Ids sort by creation time."""
+    path = os.path.join(root, VERSIONS_DIR)
+    if not os.path.isdir(path):
+        return []
+    return sorted(
+        name for name in os.listdir(path)
+        if os.path.exists(os.path.join(path, name, MANIFEST_FILE))
+    )
+
+
+def new_version_dir(root: str) -> str:
+    """Creates and returns an empty directory for the next version."""
+    while True:
+        now = time.time()
+        version = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f"-{int(now * 1000) % 1000:03d}-{os.getpid()}"
+        path = version_dir(root, version)
+        try:
+            os.makedirs(path)
+            return path
+        except FileExistsError:
+            time.sleep(0.001)
+
+
+def _lock_file(root: str, version: str):
+    path = os.path.join(root, LEASES_DIR)
+    os.makedirs(path, exist_ok=True)
+    return open(os.path.join(path, version + ".lock"), 'a+')
+
+
+class VersionLease:
+    """Shared lock on one version; `prune` leaves the version alone until it is released."""
+
+    def __init__(self, root: str, version: str):
+        self.root = root
+        self.version = version
+        try:
+            self._file = _lock_file(root, version)
+        except OSError as e:
+            # e.g. a read-only mount: nothing can prune it from here either
+            logger.warning(f"Cannot lease index version {version} in {root}: {e}")
+            self._file = None
+            return
+        if fcntl is not None:
+            # Blocks while a prune is deleting this version
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_SH)
+
+    def release(self):
+        if self._file is not None:
+            self._file.close()  # drops the lock
+            self._file = None
+
+
+def lease_version(root: str) -> Tuple[str, Optional[VersionLease]]:
+    """
+    Directory of the live index under `root` and a lease keeping it on disk
+    (None for unversioned roots). Release the lease once the index is closed.
+    """
+    while True:
+        version = current_version(root)
+        if version is None:
+            return root, None
+        lease = VersionLease(root, version)
+        path = version_dir(root, version)
+        if os.path.exists(os.path.join(path, MANIFEST_FILE)):
+            return path, lease
+        lease.release()
+        if current_version(root) == version:
+            raise FileNotFoundError(f"Index version {version} in {root} is missing.")
+        # Pruned between reading CURRENT and taking the lease; CURRENT has moved on
+
+
+def verify(index_dir: str) -> bool:
+    """True if the files match the manifest checksum (indexes without one always pass)."""
+    expected = read_manifest(index_dir).get("checksum")
+    if expected is None:
+        logger.warning(f"Index {index_dir} has no checksum, not verified.")
+        return True
+    return index_checksum(index_dir) == expected
+
+
+def publish(root: str, version: str, check: bool = True):
+    """
+    Makes `version` the live index: verifies it, then atomically replaces
+    CURRENT. Running processes pick it up on their next index lookup.
+    """
+    path = version_dir(root, version)
+    read_manifest(path)
+    if check and not verify(path):
+        raise ValueError(f"Index version {version} does not match its checksum, not publishing it.")
+
+    tmp_path = os.path.join(root, CURRENT_FILE + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(root, CURRENT_FILE))
+    logger.info(f"Published index version {version} in {root}.")
+    prune(root)
+
+
+def _lock_for_delete(root: str, version: str):
+    """Exclusively locked lock file of `version`, or None while a reader holds a lease."""
+    f = _lock_file(root, version)
+    if fcntl is None:
+        return f
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        return None
+    return f
+
+
+def prune(root: str, keep: int = KEEP_VERSIONS):
+    """
+    Deletes all but the newest `keep` versions (never the live one) and abandoned
+    partial builds. Versions leased by a running process are kept for a later prune.
+    """
+    current = current_version(root)
+    complete = list_versions(root)
+    keep_set = set(complete[-keep:]) | {current}
+    versions_path = os.path.join(root, VERSIONS_DIR)
+    for name in sorted(os.listdir(versions_path)) if os.path.isdir(versions_path) else []:
+        if name in keep_set or (name not in complete and name > (current or "")):
+            # Newer directories without a manifest may be builds still running
+            continue
+        lock = _lock_for_delete(root, name)
+        if lock is None:
+            logger.info(f"Kept index version {name}, still leased.")
+            continue
+        try:
+            shutil.rmtree(os.path.join(versions_path, name), ignore_errors=True)
+            os.remove(lock.name)
+        finally:
+            lock.close()
+        logger.info(f"Removed index version {name}.")
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    command, args = (sys.argv[1], sys.argv[2:]) if len(sys.argv) > 1 else ("list", [])
+
+    if command == "list":
+        root = args[0] if args else DEFAULT_INDEX_DIR
+        current = current_version(root)
+        for version in list_versions(root):
+            manifest = read_manifest(version_dir(root, version))
+            marker = "*" if version == current else " "
+            print(f"{marker} {version}  {manifest['rows']} rows, {manifest['dims']} dims, {manifest['embedding_model']}")
+    elif command == "verify":
+        root = args[0] if args else DEFAULT_INDEX_DIR
+        path = version_dir(root, args[1]) if len(args) > 1 else resolve_index_dir(root)
+        ok = verify(path)
+        print(f"{path}: {'OK' if ok else 'CHECKSUM MISMATCH'}")
+        sys.exit(0 if ok else 1)
+    elif command == "rollback" and args:
+        publish(args[1] if len(args) > 1 else DEFAULT_INDEX_DIR, args[0])
+    else:
+        print("Usage: python index_versions.py list [root] | verify [root] [id] | rollback <id> [root]")
+        sys.exit(1)
@@ -0,0 +1,437 @@
+"""
+Persona ingestion pipeline behind one command:
+
+    download -> filter -> dedup -> build
+                             \\--> upload    (opt-in: Google File Search)
+
+Every stage declares the paths it reads and writes. Before a stage runs, its
+fingerprint is computed from:
+- the stage parameters;
+- the source of the modules it runs;
+- the content hashes of its inputs.
+The stage is skipped when this fingerprint matches the last successful run
+recorded in `.ingest_state.json` and its outputs have not changed since.
+Inputs are compared by content, not by mtime. So a change that leaves a stage's
+output identical (e.g. a filter tweak that keeps the same rows) stops
+propagating at that stage.
+
+Stages run as soon as their inputs are ready, independent ones in parallel.
+Per-stage timings are reported at the end.
+
+    python ingest.py                    # everything up to the index
+    python ingest.py build upload       # also refresh the File Search upload
+    python ingest.py --force filter     # rerun filter, then whatever it changes
+    python ingest.py --dry-run
+"""
+
+import os
+import ast
+import json
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from dotenv import load_dotenv
+
+from index_versions import CURRENT_FILE, resolve_index_dir
+from persona_index import MANIFEST_FILE
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+STATE_FILE = ".ingest_state.json"
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", "2"))
+HASH_CHUNK_BYTES = 1 << 20
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_TARGETS = ["build"]
+
+
+def local_modules(*entry_points: str) -> List[str]:
+    """
+    The entry point modules and every module of this repository they import,
+    directly or through each other (deferred imports inside functions included).
+    """
+    found: List[str] = []
+    pending = list(entry_points)
+    while pending:
+        module = pending.pop()
+        path = os.path.join(SOURCE_DIR, module)
+        if module in found or not os.path.exists(path):
+            continue
+        found.append(module)
+        with open(path, 'r', encoding='utf-8') as f:
+            tree = ast.parse(f.read(), filename=module)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names = [node.module]
+            else:
+                continue
+            pending.extend(name.split(".")[0] + ".py" for name in names)
+    return sorted(found)
+
+
+class Stage:
+    """One pipeline step: `run()` turns `inputs` into `outputs`."""
+
+    def __init__(
+        self,
+        name: str,
+        run: Callable[[], Any],
+        inputs: List[str],
+        outputs: List[str],
+        params: Optional[Dict[str, Any]] = None,
+        modules: Optional[List[str]] = None,
+    ):
+        self.name = name
+        self.run = run
+        self.inputs = inputs
+        self.outputs = outputs
+        self.params = params or {}
+        # Source files whose edits invalidate the stage's outputs
+        self.modules = modules or []
+
+
+class Fingerprints:
+    """
+    Content hashes of files and directories. Digests are memoized by
+    (size, mtime) in the state file, so unchanged files are not re-read.
+    """
+
+    def __init__(self, cache: Dict[str, List[Any]]):
+        self.cache = cache
+        self._lock = threading.Lock()
+
+    def file(self, path: str) -> str:
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        with self._lock:
+            cached = self.cache.get(key)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+                digest.update(chunk)
+        result = digest.hexdigest()
+        with self._lock:
+            self.cache[key] = [stat.st_size, stat.st_mtime_ns, result]
+        return result
+
+    def path(self, path: str) -> Optional[str]:
+        """
+        Hash of a file, or of every file under a directory; None if missing.
+        A versioned index root (see index_versions.py) is identified by its
+        CURRENT pointer and the live version's manifest, which holds that
+        version's checksum; lease files and older versions do not count.
+        """
+        if not os.path.exists(path):
+            return None
+        if not os.path.isdir(path):
+            return self.file(path)
+
+        digest = hashlib.blake2b(digest_size=16)
+        if os.path.isfile(os.path.join(path, CURRENT_FILE)):
+            manifest = os.path.join(resolve_index_dir(path), MANIFEST_FILE)
+            for full in (os.path.join(path, CURRENT_FILE), manifest):
+                digest.update(os.path.relpath(full, path).encode("utf-8"))
+                digest.update((self.file(full) if os.path.exists(full) else "missing").encode("ascii"))
+            return digest.hexdigest()
+
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                full = os.path.join(root, name)
+                digest.update(os.path.relpath(full, path).encode("utf-8"))
+                digest.update(self.file(full).encode("ascii"))
+        return digest.hexdigest()
+
+
+class IngestState:
+    """`.ingest_state.json`: the last successful run of every stage, plus the hash cache."""
+
+    def __init__(self, path: str = STATE_FILE):
+        self.path = path
+        data = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable {path}: {e}")
+        self.stages: Dict[str, Dict[str, Any]] = data.get("stages", {})
+        self.fingerprints = Fingerprints(data.get("hashes", {}))
+        self._lock = threading.Lock()
+
+    def record(self, name: str, entry: Dict[str, Any]):
+        with self._lock:
+            self.stages[name] = entry
+            self._save()
+
+    def _save(self):
+        with self.fingerprints._lock:
+            data = {"stages": self.stages, "hashes": self.fingerprints.cache}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def _stage_key(stage: Stage, fingerprints: Fingerprints) -> Dict[str, Any]:
+    return {
+        "params": stage.params,
+        "code": {m: fingerprints.file(os.path.join(SOURCE_DIR, m)) for m in stage.modules},
+        "inputs": {p: fingerprints.path(p) for p in stage.inputs},
+    }
+
+
+def _outputs(stage: Stage, fingerprints: Fingerprints) -> Dict[str, Optional[str]]:
+    return {p: fingerprints.path(p) for p in stage.outputs}
+
+
+def stale_reason(stage: Stage, state: IngestState, adopt: bool = True) -> Optional[str]:
+    """
+    Why `stage` has to run, or None if its outputs are up to date. With `adopt`,
+    outputs of source stages that predate the state file are recorded as current.
+    """
+    missing = [p for p in stage.inputs if not os.path.exists(p)]
+    if missing:
+        raise FileNotFoundError(f"Stage '{stage.name}' is missing its input {missing[0]}")
+
+    fingerprints = state.fingerprints
+    outputs = _outputs(stage, fingerprints)
+    if any(digest is None for digest in outputs.values()):
+        return "outputs missing"
+
+    record = state.stages.get(stage.name)
+    key = _stage_key(stage, fingerprints)
+    if record is None:
+        if not stage.inputs:
+            # Source stages (downloads) adopt data that predates the state file
+            if adopt:
+                state.record(stage.name, {"key": key, "outputs": outputs, "seconds": 0.0, "finished_at": time.time()})
+            return None
+        return "never run"
+    if record.get("outputs") != outputs:
+        return "outputs modified"
+    old = record.get("key", {})
+    for part, label in (("inputs", "inputs changed"), ("code", "code changed"), ("params", "parameters changed")):
+        if old.get(part) != key[part]:
+            return label
+    return None
+
+
+def _dependencies(stages: Dict[str, Stage]) -> Dict[str, List[str]]:
+    producers = {os.path.normpath(p): s.name for s in stages.values() for p in s.outputs}
+    return {
+        s.name: sorted({producers[os.path.normpath(p)] for p in s.inputs if os.path.normpath(p) in producers})
+        for s in stages.values()
+    }
+
+
+def _required(targets: Iterable[str], deps: Dict[str, List[str]]) -> List[str]:
+    needed, todo = set(), list(targets)
+    while todo:
+        name = todo.pop()
+        if name not in deps:
+            raise ValueError(f"Unknown stage '{name}' (stages: {', '.join(deps)})")
+        if name not in needed:
+            needed.add(name)
+            todo.extend(deps[name])
+    return [name for name in deps if name in needed]
+
+
+def run_pipeline(
+    stages: List[Stage],
+    targets: Iterable[str] = DEFAULT_TARGETS,
+    force: Iterable[str] = (),
+    dry_run: bool = False,
+    workers: int = INGEST_WORKERS,
+    state_file: str = STATE_FILE,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Brings `targets` and every stage they depend on up to date. Returns
+    {stage: {"status": ran|skipped|failed|blocked|pending, "seconds", "reason"}}.
+    A failed stage blocks its dependents; independent stages still run.
+    """
+    by_name = {s.name: s for s in stages}
+    deps = _dependencies(by_name)
+    order = _required(targets, deps)
+    force = set(force)
+    state = IngestState(state_file)
+    results: Dict[str, Dict[str, Any]] = {}
+
+    if dry_run:
+        for name in order:
+            upstream = [d for d in deps[name] if results[d]["status"] == "pending"]
+            if name in force:
+                reason = "forced"
+            elif upstream:
+                reason = f"after {', '.join(upstream)}"
+            else:
+                try:
+                    reason = stale_reason(by_name[name], state, adopt=False)
+                except FileNotFoundError:
+                    reason = "inputs missing"
+            results[name] = {"status": "pending" if reason else "skipped", "seconds": 0.0, "reason": reason}
+            logger.info(f"[{name}] {'would run: ' + reason if reason else 'up to date'}")
+        return results
+
+    def _execute(stage: Stage) -> Dict[str, Any]:
+        started = time.monotonic()
+        reason = "forced" if stage.name in force else stale_reason(stage, state)
+        if reason is None:
+            logger.info(f"[{stage.name}] up to date, skipped")
+            return {"status": "skipped", "seconds": time.monotonic() - started, "reason": None}
+
+        logger.info(f"[{stage.name}] running ({reason})")
+        # The key is taken before running: inputs are final once dependencies finish
+        key = _stage_key(stage, state.fingerprints)
+        stage.run()
+        seconds = time.monotonic() - started
+        outputs = _outputs(stage, state.fingerprints)
+        missing = [p for p, digest in outputs.items() if digest is None]
+        if missing:
+            raise RuntimeError(f"Stage '{stage.name}' did not produce {', '.join(missing)}")
+        state.record(stage.name, {
+            "key": key,
+            "outputs": outputs,
+            "seconds": seconds,
+            "finished_at": time.time(),
+        })
+        logger.info(f"[{stage.name}] done in {seconds:.1f}s")
+        return {"status": "ran", "seconds": seconds, "reason": reason}
+
+    waiting = list(order)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        while waiting or running:
+            for name in list(waiting):
+                statuses = [results.get(d, {}).get("status") for d in deps[name]]
+                if any(s in ("failed", "blocked") for s in statuses):
+                    waiting.remove(name)
+                    results[name] = {"status": "blocked", "seconds": 0.0, "reason": "upstream failed"}
+                    logger.warning(f"[{name}] blocked by a failed upstream stage")
+                elif all(s in ("ran", "skipped") for s in statuses):
+                    waiting.remove(name)
+                    running[pool.submit(_execute, by_name[name])] = name
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    logger.error(f"[{name}] failed: {e}")
+                    results[name] = {"status": "failed", "seconds": 0.0, "reason": str(e)}
+
+    return results
+
+
+def report(results: Dict[str, Dict[str, Any]], wall_seconds: float):
+    logger.info("=" * 60)
+    logger.info(f"{'Stage':<10} {'Status':<8} {'Seconds':>9}  Reason")
+    for name, result in results.items():
+        logger.info(f"{name:<10} {result['status']:<8} {result['seconds']:>9.1f}  {result.get('reason') or ''}")
+    logger.info(f"Total wall time: {wall_seconds:.1f}s")
+    logger.info("=" * 60)
+
+
+def default_stages(config: Dict[str, Any]) -> List[Stage]:
+    """The PersonaHub pipeline; `config` holds the paths and stage options (see the CLI)."""
+
+    def _download():
+        from download_persona_dataset import download_personahub_dataset
+        download_personahub_dataset(config["raw"], num_samples=config["samples"] or None)
+
+    def _filter():
+        from filter_personas import filter_personas
+        filter_personas(config["raw"], config["filtered"], min_words=config["min_words"],
+                        max_words=config["max_words"], verbose=False)
+
+    def _dedup():
+        from dedup_personas import dedup_personas
+        dedup_personas(config["filtered"], config["deduped"], threshold=config["threshold"])
+
+    def _build():
+        from build_vector_index import build_index
+        build_index(config["deduped"], config["index"], api_key=os.environ.get("GOOGLE_API_KEY"),
+                    backend=config["backend"], ann=config["ann"],
+                    quantization=None if config["quantization"] == "none" else config["quantization"],
+                    shards=config["shards"])
+
+    def _upload():
+        from upload_to_file_search import convert_to_jsonl, upload_to_google_file_search
+        api_key = os.environ.get("GOOGLE_API_KEY")
+        if not api_key:
+            raise ValueError("GOOGLE_API_KEY not found.")
+        convert_to_jsonl(config["deduped"], config["upload_jsonl"])
+        upload_to_google_file_search(config["upload_jsonl"], api_key, store_id_file=config["store_id_file"])
+
+    return [
+        Stage("download", _download, inputs=[], outputs=[config["raw"]],
+              params={"samples": config["samples"]}),
+        Stage("filter", _filter, inputs=[config["raw"]], outputs=[config["filtered"]],
+              params={"min_words": config["min_words"], "max_words": config["max_words"]},
+              modules=local_modules("filter_personas.py")),
+        Stage("dedup", _dedup, inputs=[config["filtered"]], outputs=[config["deduped"]],
+              params={"threshold": config["threshold"]},
+              modules=local_modules("dedup_personas.py")),
+        Stage("build", _build, inputs=[config["deduped"]], outputs=[config["index"]],
+              params={"backend": config["backend"], "ann": config["ann"], "quantization": config["quantization"],
+                      "shards": config["shards"]},
+              modules=local_modules("build_vector_index.py")),
+        Stage("upload", _upload, inputs=[config["deduped"]],
+              outputs=[config["upload_jsonl"], config["store_id_file"]],
+              modules=local_modules("upload_to_file_search.py")),
+    ]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the persona ingestion pipeline (only stale stages run).")
+    parser.add_argument("targets", nargs="*", default=DEFAULT_TARGETS,
+                        help="Stages to bring up to date, with their dependencies "
+                             "(download, filter, dedup, build, upload; default: build)")
+    parser.add_argument("--force", action="append", default=[], metavar="STAGE", help="Rerun a stage even if up to date")
+    parser.add_argument("--dry-run", action="store_true", help="Only show which stages would run")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="Stages run in parallel")
+    parser.add_argument("--state", default=STATE_FILE)
+    parser.add_argument("--raw", default="personahub_instruction_20k.jsonl")
+    parser.add_argument("--filtered", default="personahub_filtered_human.jsonl")
+    parser.add_argument("--deduped", default="personahub_dedup.jsonl")
+    parser.add_argument("--index", default="personas_index")
+    parser.add_argument("--upload-jsonl", default="personas.jsonl")
+    parser.add_argument("--store-id-file", default="file_search_store_id.txt")
+    parser.add_argument("--samples", type=int, default=20000, help="Rows to download (0: whole split)")
+    parser.add_argument("--min-words", type=int, default=20)
+    parser.add_argument("--max-words", type=int, default=150)
+    parser.add_argument("--threshold", type=float, default=0.8, help="Near-duplicate Jaccard threshold")
+    parser.add_argument("--backend", choices=["gemini", "hashing"], default="gemini")
+    parser.add_argument("--ann", choices=["auto", "ivf", "none"], default="auto")
+    parser.add_argument("--quantization", choices=["none", "int8", "pq"], default="none")
+    parser.add_argument("--shards", type=int, default=1, help="Index shards searched in parallel")
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    results = run_pipeline(
+        default_stages(vars(args)),
+        targets=args.targets,
+        force=args.force,
+        dry_run=args.dry_run,
+        workers=args.workers,
+        state_file=args.state,
+    )
+    report(results, time.monotonic() - started)
+    if any(r["status"] in ("failed", "blocked") for r in results.values()):
+        exit(1)
@@ -0,0 +1,200 @@
+"""
+Compact BM25 inverted index over persona texts, plus reciprocal-rank fusion.
+
+Postings are stored as CSR-style arrays, with BM25 term impacts precomputed at
+build time. A query is then a handful of array slices and one np.bincount:
+
+    bm25_vocab.json     - terms, position = term id
+    bm25_offsets.npy    - int64 [terms + 1], posting list boundaries
+    bm25_docs.npy       - int32 row ids, grouped by term
+    bm25_impacts.npy    - float32 BM25 contribution of the term to that row
+    bm25_tfs.npy        - float32 term frequency per posting
+    bm25_doc_lengths.npy - float32 tokens per row
+
+Vector search misses hard constraints ("accountant", "veterinarian") that BM25
+matches exactly; `reciprocal_rank_fusion` merges both rankings.
+
+The impacts use the statistics (IDF, average length) of the index they were
+built for. Indexes searched together (shards) pass `BM25Stats` summed over all
+of them instead, and rows are scored from the raw term frequencies, so scores
+are comparable across indexes.
+"""
+
+import os
+import json
+import logging
+import numpy as np
+from array import array
+from collections import Counter
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+from embeddings import tokenize
+
+logger = logging.getLogger(__name__)
+
+VOCAB_FILE = "bm25_vocab.json"
+OFFSETS_FILE = "bm25_offsets.npy"
+DOCS_FILE = "bm25_docs.npy"
+IMPACTS_FILE = "bm25_impacts.npy"
+TFS_FILE = "bm25_tfs.npy"
+DOC_LENGTHS_FILE = "bm25_doc_lengths.npy"
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+
+
+def build_bm25(texts: Sequence[str], k1: float = BM25_K1, b: float = BM25_B) -> Tuple[Dict[str, np.ndarray], List[str], Dict[str, Any]]:
+    """Returns the posting arrays (by file name), the vocabulary and the manifest entry."""
+    vocab: Dict[str, int] = {}
+    # Typed arrays: 4 bytes per posting instead of a Python int object
+    term_ids, doc_ids, tfs = array('i'), array('i'), array('f')
+    doc_lengths = np.zeros(len(texts), dtype=np.float32)
+
+    for row, text in enumerate(texts):
+        tokens = tokenize(text)
+        doc_lengths[row] = len(tokens)
+        for term, tf in Counter(tokens).items():
+            term_ids.append(vocab.setdefault(term, len(vocab)))
+            doc_ids.append(row)
+            tfs.append(tf)
+
+    term_ids = np.frombuffer(term_ids, dtype=np.int32).astype(np.int64)
+    doc_ids = np.frombuffer(doc_ids, dtype=np.int32)
+    tfs = np.frombuffer(tfs, dtype=np.float32)
+
+    n_docs = max(len(texts), 1)
+    avg_length = float(doc_lengths.mean()) if len(texts) else 1.0
+    df = np.bincount(term_ids, minlength=len(vocab)).astype(np.float32)
+    idf = np.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+
+    norm = k1 * (1.0 - b + b * doc_lengths[doc_ids] / max(avg_length, 1e-9))
+    impacts = (idf[term_ids] * tfs * (k1 + 1.0) / (tfs + norm)).astype(np.float32)
+
+    # Group postings by term, rows stay ascending inside a list
+    order = np.argsort(term_ids, kind="stable")
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    np.cumsum(df.astype(np.int64), out=offsets[1:])
+
+    terms = [None] * len(vocab)
+    for term, term_id in vocab.items():
+        terms[term_id] = term
+
+    logger.info(f"Built BM25 index: {len(vocab)} terms, {len(doc_ids)} postings.")
+    files = {
+        OFFSETS_FILE: offsets,
+        DOCS_FILE: doc_ids[order],
+        IMPACTS_FILE: impacts[order],
+        TFS_FILE: tfs[order],
+        DOC_LENGTHS_FILE: doc_lengths,
+    }
+    manifest = {"type": "bm25", "k1": k1, "b": b, "terms": len(vocab), "total_length": float(doc_lengths.sum())}
+    return files, terms, manifest
+
+
+def write_vocab(path: str, terms: List[str]):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(terms, f, ensure_ascii=False)
+
+
+class BM25Stats:
+    """Collection statistics for scoring several indexes as one corpus."""
+
+    def __init__(self, docs: int, total_length: float, document_frequencies: Dict[str, int]):
+        self.docs = docs
+        self.total_length = total_length
+        self.document_frequencies = document_frequencies
+
+    @property
+    def avg_length(self) -> float:
+        return self.total_length / self.docs if self.docs else 1.0
+
+
+class BM25Index:
+    """Read side of the postings. The vocabulary is parsed on the first query."""
+
+    def __init__(self, index_dir: str, rows: int, params: Optional[Dict[str, Any]] = None):
+        self.index_dir = index_dir
+        self.rows = rows
+        self.params = params or {}
+        self.offsets = np.load(os.path.join(index_dir, OFFSETS_FILE))
+        self.docs = np.load(os.path.join(index_dir, DOCS_FILE), mmap_mode="r")
+        self.impacts = np.load(os.path.join(index_dir, IMPACTS_FILE), mmap_mode="r")
+        # Raw frequencies and lengths; missing in indexes built before they were stored
+        tfs_path = os.path.join(index_dir, TFS_FILE)
+        lengths_path = os.path.join(index_dir, DOC_LENGTHS_FILE)
+        self.tfs = np.load(tfs_path, mmap_mode="r") if os.path.exists(tfs_path) else None
+        self.doc_lengths = np.load(lengths_path, mmap_mode="r") if os.path.exists(lengths_path) else None
+        self._vocab: Optional[Dict[str, int]] = None
+
+    @property
+    def supports_global_stats(self) -> bool:
+        return self.tfs is not None and self.doc_lengths is not None and "total_length" in self.params
+
+    def stats(self, queries: Sequence[str]) -> BM25Stats:
+        """This index's share of the collection statistics for the terms of `queries`."""
+        terms = {t for q in queries for t in tokenize(q)}
+        return BM25Stats(
+            self.rows,
+            float(self.params.get("total_length", 0.0)),
+            {t: int(self.offsets[self.vocab[t] + 1] - self.offsets[self.vocab[t]]) for t in terms if t in self.vocab},
+        )
+
+    @property
+    def vocab(self) -> Dict[str, int]:
+        if self._vocab is None:
+            with open(os.path.join(self.index_dir, VOCAB_FILE), 'r', encoding='utf-8') as f:
+                self._vocab = {term: i for i, term in enumerate(json.load(f))}
+        return self._vocab
+
+    def scores(self, query: str, stats: Optional[BM25Stats] = None) -> np.ndarray:
+        """
+        BM25 score of every row for the query (zero for rows sharing no term).
+        With `stats`, IDF and length normalization come from those collection
+        statistics rather than from this index alone.
+        """
+        terms = {t for t in tokenize(query) if t in self.vocab}
+        if not terms:
+            return np.zeros(self.rows, dtype=np.float32)
+        term_ids = [self.vocab[t] for t in terms]
+        slices = [slice(self.offsets[t], self.offsets[t + 1]) for t in term_ids]
+        docs = np.concatenate([self.docs[s] for s in slices])
+
+        if stats is None:
+            impacts = np.concatenate([self.impacts[s] for s in slices])
+            return np.bincount(docs, weights=impacts, minlength=self.rows).astype(np.float32)
+        if not self.supports_global_stats:
+            raise ValueError(f"BM25 postings in '{self.index_dir}' predate global statistics; rebuild the index.")
+
+        k1 = self.params.get("k1", BM25_K1)
+        b = self.params.get("b", BM25_B)
+        n_docs = max(stats.docs, 1)
+        df = np.array([stats.document_frequencies.get(t, 0) for t in terms], dtype=np.float32)
+        idf = np.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+        term_idf = np.concatenate([np.full(s.stop - s.start, idf[i], dtype=np.float32) for i, s in enumerate(slices)])
+        tfs = np.concatenate([self.tfs[s] for s in slices])
+        norm = k1 * (1.0 - b + b * self.doc_lengths[docs] / max(stats.avg_length, 1e-9))
+        impacts = term_idf * tfs * (k1 + 1.0) / (tfs + norm)
+        return np.bincount(docs, weights=impacts, minlength=self.rows).astype(np.float32)
+
+    def close(self):
+        """Drops the mappings of the postings."""
+        self.docs = self.impacts = self.tfs = self.doc_lengths = None
+
+
+def combine_stats(parts: Sequence[BM25Stats]) -> BM25Stats:
+    """Statistics of the union of the indexes the parts were taken from."""
+    frequencies: Dict[str, int] = {}
+    for part in parts:
+        for term, df in part.document_frequencies.items():
+            frequencies[term] = frequencies.get(term, 0) + df
+    return BM25Stats(sum(p.docs for p in parts), sum(p.total_length for p in parts), frequencies)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], limit: int, k: int = RRF_K) -> List[Tuple[int, float]]:
+    """Fuses ranked id lists: score(id) = sum over lists of 1 / (k + rank)."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, 1):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)[:limit]
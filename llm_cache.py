@@ -0,0 +1,255 @@
+"""
+Content-addressed cache for LLM responses, shared by all graph nodes.
+
+Entries are keyed by the client's model and sampling parameters, the
+normalized message list and, for structured calls, the output schema. They
+live in a SQLite file (see disk_cache.py) with a TTL and size-based eviction,
+so rerunning an idea or resuming after a crash replays earlier answers
+instead of paying for them again. Calls that do reach the provider are queued
+through llm_scheduler.py (concurrency, rate limits, priority per node).
+
+Caching is opt-in per node. LLM_CACHE_NODES lists the nodes that use it
+("all" / "none" also work); when it is unset, a node is cached only if its
+client is cold (temperature <= LLM_CACHE_MAX_TEMPERATURE), because a hot
+generator is expected to answer differently every time.
+
+    llm = cached(llm_critic, "critic")
+    feedback = llm.with_structured_output(CritiqueFeedback).invoke(messages)
+"""
+
+import os
+import json
+import asyncio
+import hashlib
+import threading
+import logging
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict, convert_to_messages
+
+from disk_cache import DiskCache
+from llm_scheduler import get_scheduler, model_name
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = os.environ.get("LLM_CACHE_PATH", ".cache/llm.sqlite")
+DISK_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024
+# Entries older than this are treated as missing (0 keeps them until evicted)
+TTL_SECONDS = float(os.environ.get("LLM_CACHE_TTL_HOURS", "168")) * 3600 or None
+# Comma-separated node names, "all" or "none"; unset means "cold clients only"
+CACHE_NODES = os.environ.get("LLM_CACHE_NODES")
+MAX_TEMPERATURE = float(os.environ.get("LLM_CACHE_MAX_TEMPERATURE", "0.3"))
+
+# Client attributes that change the answer; anything else (keys, timeouts, proxies) does not
+KEY_PARAMS = (
+    "temperature", "top_p", "top_k", "max_tokens", "max_output_tokens",
+    "reasoning_effort", "seed", "n", "stop",
+)
+
+
+def normalize_text(text: str) -> str:
+    """Collapses whitespace so re-indented prompts share an entry."""
+    return " ".join(text.split())
+
+
+def client_params(llm) -> Dict[str, Any]:
+    params = {"class": type(llm).__name__, "model": model_name(llm)}
+    for name in KEY_PARAMS:
+        value = getattr(llm, name, None)
+        if value is not None:
+            params[name] = value
+    return params
+
+
+def _normalize_messages(messages) -> List[List[Any]]:
+    normalized = []
+    for message in convert_to_messages([messages] if isinstance(messages, str) else messages):
+        content = message.content
+        if isinstance(content, str):
+            content = normalize_text(content)
+        normalized.append([message.type, content])
+    return normalized
+
+
+def _schema_key(schema) -> Optional[Any]:
+    if schema is None:
+        return None
+    if hasattr(schema, "model_json_schema"):
+        return schema.model_json_schema()
+    return schema
+
+
+def node_enabled(node: str, llm) -> bool:
+    """Whether calls made by `node` through `llm` go through the cache."""
+    if CACHE_NODES is None:
+        temperature = getattr(llm, "temperature", None)
+        return temperature is not None and temperature <= MAX_TEMPERATURE
+    selected = {name.strip().lower() for name in CACHE_NODES.split(",") if name.strip()}
+    if "none" in selected:
+        return False
+    return "all" in selected or node.lower() in selected
+
+
+class LLMCache:
+    def __init__(self, path: str = CACHE_PATH, disk_max_bytes: int = DISK_MAX_BYTES,
+                 ttl_seconds: Optional[float] = TTL_SECONDS):
+        self.disk = DiskCache(path, max_bytes=disk_max_bytes, ttl_seconds=ttl_seconds)
+        self._lock = threading.Lock()
+        # node -> {"hits", "misses", "bypassed"}
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    @staticmethod
+    def key(llm, messages, schema=None) -> str:
+        payload = {
+            "params": client_params(llm),
+            "messages": _normalize_messages(messages),
+            "schema": _schema_key(schema),
+        }
+        blob = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def count(self, node: str, outcome: str):
+        with self._lock:
+            counters = self._counters.setdefault(node, {"hits": 0, "misses": 0, "bypassed": 0})
+            counters[outcome] += 1
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        blob = self.disk.get(key)
+        return json.loads(blob) if blob is not None else None
+
+    def set(self, key: str, entry: Dict[str, Any]):
+        self.disk.set(key, json.dumps(entry, ensure_ascii=False).encode("utf-8"))
+
+    def delete(self, key: str):
+        self.disk.delete(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            nodes = {node: dict(c) for node, c in self._counters.items()}
+        hits = sum(c["hits"] for c in nodes.values())
+        misses = sum(c["misses"] for c in nodes.values())
+        return {
+            "hits": hits,
+            "misses": misses,
+            "bypassed": sum(c["bypassed"] for c in nodes.values()),
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "nodes": nodes,
+            "disk_bytes": self.disk.total_bytes,
+        }
+
+    def log_stats(self):
+        s = self.stats()
+        logger.info(
+            f"[LLMCache] hit rate {s['hit_rate']:.1%} "
+            f"(hits {s['hits']}, misses {s['misses']}, bypassed {s['bypassed']}), "
+            f"{s['disk_bytes'] / 1024 / 1024:.1f} MB on disk"
+        )
+
+
+def _encode(result, schema) -> Optional[Dict[str, Any]]:
+    """JSON form of a result, or None for results not worth keeping (empty answers)."""
+    if schema is None:
+        if not isinstance(result, BaseMessage) or not result.content:
+            return None
+        return {"message": message_to_dict(result)}
+    if result is None:
+        return None
+    if hasattr(result, "model_dump"):
+        return {"structured": result.model_dump(mode="json")}
+    return {"structured": result}
+
+
+def _decode(entry: Dict[str, Any], schema):
+    if "message" in entry:
+        return messages_from_dict([entry["message"]])[0]
+    if hasattr(schema, "model_validate"):
+        return schema.model_validate(entry["structured"])
+    return entry["structured"]
+
+
+class CachedLLM:
+    """
+    Wraps a chat client (or its structured-output runnable) for one node.
+    `invoke(messages, refresh=True)` skips the lookup and overwrites the entry,
+    for retries after an answer that could not be used; `forget(messages)`
+    drops such an answer when there is no retry.
+    """
+
+    def __init__(self, llm, node: str, cache: Optional[LLMCache] = None, schema=None, runnable=None):
+        self.llm = llm
+        self.node = node
+        self.schema = schema
+        self.enabled = node_enabled(node, llm)
+        self._cache = cache
+        self._runnable = runnable if runnable is not None else llm
+
+    @property
+    def cache(self) -> LLMCache:
+        return self._cache or get_cache()
+
+    def with_structured_output(self, schema, **kwargs) -> "CachedLLM":
+        return CachedLLM(self.llm, self.node, self._cache, schema=schema,
+                         runnable=self.llm.with_structured_output(schema, **kwargs))
+
+    def invoke(self, messages, refresh: bool = False, **kwargs):
+        if not self.enabled or kwargs:
+            self.cache.count(self.node, "bypassed")
+            return get_scheduler().invoke(self.llm, self._runnable, messages, self.node, **kwargs)
+
+        cache = self.cache
+        key = cache.key(self.llm, messages, self.schema)
+        if not refresh:
+            entry = cache.get(key)
+            if entry is not None:
+                cache.count(self.node, "hits")
+                return _decode(entry, self.schema)
+
+        cache.count(self.node, "misses")
+        result = get_scheduler().invoke(self.llm, self._runnable, messages, self.node)
+        entry = _encode(result, self.schema)
+        if entry is not None:
+            cache.set(key, entry)
+        return result
+
+    async def ainvoke(self, messages, refresh: bool = False, **kwargs):
+        """`invoke` for async nodes. SQLite reads and writes run in a worker thread."""
+        if not self.enabled or kwargs:
+            self.cache.count(self.node, "bypassed")
+            return await get_scheduler().ainvoke(self.llm, self._runnable, messages, self.node, **kwargs)
+
+        cache = self.cache
+        key = cache.key(self.llm, messages, self.schema)
+        if not refresh:
+            entry = await asyncio.to_thread(cache.get, key)
+            if entry is not None:
+                cache.count(self.node, "hits")
+                return _decode(entry, self.schema)
+
+        cache.count(self.node, "misses")
+        result = await get_scheduler().ainvoke(self.llm, self._runnable, messages, self.node)
+        entry = _encode(result, self.schema)
+        if entry is not None:
+            await asyncio.to_thread(cache.set, key, entry)
+        return result
+
+    def forget(self, messages):
+        if self.enabled:
+            self.cache.delete(self.cache.key(self.llm, messages, self.schema))
+
+
+_default_cache: Optional[LLMCache] = None
+_default_lock = threading.Lock()
+
+
+def get_cache() -> LLMCache:
+    """Process-wide cache instance, created on first use."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = LLMCache()
+        return _default_cache
+
+
+def cached(llm, node: str) -> CachedLLM:
+    """`llm` as used by `node`: cached if the node is opted in, a plain passthrough otherwise."""
+    return CachedLLM(llm, node)
@@ -0,0 +1,336 @@
+"""
+Process-wide scheduler for LLM calls.
+
+Every call made through llm_cache.CachedLLM (that is, every graph node) passes
+through here before it reaches a provider:
+
+    pacing gate    - one call per model at a time takes its rate-limit
+                     reservation and waits it out
+    rate limiter   - RPM / TPM token buckets per model (see rate_limiter.py),
+                     halved on a 429, after which the call is re-queued
+    model gate     - at most N calls in flight per model
+    provider gate  - at most M calls in flight per provider (google, openai)
+
+Gates hand free slots to the waiting call with the best priority lane first,
+so a fan-out of simulation interviews cannot starve the critic or the analyst.
+Because reservations are only taken by the call holding the pacing gate, a
+critic call queues ahead of simulation calls for the rate budget too, and no
+concurrency slot is held while a call waits for it. A reservation whose wait is
+cancelled is refunded. Waiting time (rate limiting plus gates) is recorded per lane.
+
+Limits come from MODEL_LIMITS / PROVIDER_CONCURRENCY and can be overridden
+with LLM_MODEL_LIMITS, a JSON object such as '{"gpt-5.1": {"rpm": 200}}'.
+"""
+
+import os
+import json
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+import logging
+from typing import Any, Dict, Optional
+
+from rate_limiter import RateLimiter, estimate_tokens, is_rate_limit_error
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first; nodes not listed get DEFAULT_PRIORITY
+PRIORITIES = {
+    "critic": 0,
+    "analyst": 0,
+    "generator": 1,
+    "researcher": 1,
+    "recruiter": 1,
+    "simulation": 2,
+}
+DEFAULT_PRIORITY = 1
+
+PROVIDER_CONCURRENCY = {
+    "google": int(os.environ.get("LLM_CONCURRENCY_GOOGLE", "8")),
+    "openai": int(os.environ.get("LLM_CONCURRENCY_OPENAI", "16")),
+}
+DEFAULT_PROVIDER_CONCURRENCY = 8
+
+# Per-model limits; tpm None means requests are only counted
+MODEL_LIMITS: Dict[str, Dict[str, Any]] = {
+    "gemini-3-pro-preview": {"concurrency": 4, "rpm": 25, "tpm": 1_000_000},
+    "gemini-2.5-flash": {"concurrency": 8, "rpm": 1000, "tpm": 1_000_000},
+    "gpt-5.1": {"concurrency": 4, "rpm": 500, "tpm": 500_000},
+    "gpt-4o-mini": {"concurrency": 16, "rpm": 5000, "tpm": 2_000_000},
+}
+DEFAULT_MODEL_LIMITS = {"concurrency": 4, "rpm": 60, "tpm": None}
+MODEL_LIMITS_OVERRIDE = json.loads(os.environ.get("LLM_MODEL_LIMITS", "{}"))
+
+# Times a call is re-queued after a 429 before the error reaches the node
+MAX_RATE_LIMIT_RETRIES = 3
+
+
+def model_name(llm) -> str:
+    name = str(getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__)
+    # Gemini clients may report "models/gemini-..."
+    return name[len("models/"):] if name.startswith("models/") else name
+
+
+def provider_of(llm) -> str:
+    name = type(llm).__name__.lower()
+    if "google" in name or "gemini" in name:
+        return "google"
+    if "openai" in name:
+        return "openai"
+    return name
+
+
+def model_limits(model: str) -> Dict[str, Any]:
+    limits = dict(DEFAULT_MODEL_LIMITS)
+    limits.update(MODEL_LIMITS.get(model, {}))
+    limits.update(MODEL_LIMITS_OVERRIDE.get(model, {}))
+    return limits
+
+
+def _message_text(messages) -> str:
+    if isinstance(messages, str):
+        return messages
+    return "\n".join(str(getattr(m, "content", m)) for m in messages)
+
+
+class _Waiter:
+    __slots__ = ("loop", "future", "event", "granted", "cancelled")
+
+    def __init__(self, loop=None, future=None, event=None):
+        self.loop = loop
+        self.future = future
+        self.event = event
+        self.granted = False
+        self.cancelled = False
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class PriorityGate:
+    """
+    Counting semaphore whose free slots go to the waiter with the lowest
+    priority value (FIFO within a priority). Works across threads and event
+    loops: async waiters are woken on their own loop, sync ones via an Event.
+    """
+
+    def __init__(self, limit: int, name: str):
+        self.limit = max(1, limit)
+        self.name = name
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiters = []  # heap of (priority, seq, _Waiter)
+        self._seq = itertools.count()
+
+    def _take_or_enqueue(self, priority: int, waiter: _Waiter) -> bool:
+        """Called with the lock held. True if a slot was free (and taken)."""
+        if self._active < self.limit and not self._waiters:
+            self._active += 1
+            return True
+        heapq.heappush(self._waiters, (priority, next(self._seq), waiter))
+        return False
+
+    async def acquire(self, priority: int):
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(loop=loop, future=loop.create_future())
+        with self._lock:
+            if self._take_or_enqueue(priority, waiter):
+                return
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                waiter.cancelled = True
+                granted = waiter.granted
+            if granted:
+                # The slot was handed over just as we were cancelled
+                self.release()
+            raise
+
+    def acquire_sync(self, priority: int):
+        waiter = _Waiter(event=threading.Event())
+        with self._lock:
+            if self._take_or_enqueue(priority, waiter):
+                return
+        waiter.event.wait()
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                _, _, waiter = heapq.heappop(self._waiters)
+                if waiter.cancelled:
+                    continue
+                # The slot passes straight to the waiter, _active stays the same
+                waiter.granted = True
+                if waiter.event is not None:
+                    waiter.event.set()
+                else:
+                    waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+                return
+            self._active -= 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "active": self._active,
+                "queued": sum(not w.cancelled for _, _, w in self._waiters),
+            }
+
+
+class LLMScheduler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._provider_gates: Dict[str, PriorityGate] = {}
+        self._model_gates: Dict[str, PriorityGate] = {}
+        self._pacers: Dict[str, PriorityGate] = {}
+        self._limiters: Dict[str, RateLimiter] = {}
+        self._providers: Dict[str, str] = {}
+        # lane -> {"calls", "wait_total", "wait_max"}
+        self._waits: Dict[str, Dict[str, float]] = {}
+
+    def _resources(self, llm):
+        provider, model = provider_of(llm), model_name(llm)
+        with self._lock:
+            if model not in self._model_gates:
+                limits = model_limits(model)
+                self._model_gates[model] = PriorityGate(limits["concurrency"], model)
+                self._pacers[model] = PriorityGate(1, model + ":rate")
+                self._limiters[model] = RateLimiter(limits["rpm"], limits["tpm"], name=model)
+                self._providers[model] = provider
+            if provider not in self._provider_gates:
+                self._provider_gates[provider] = PriorityGate(
+                    PROVIDER_CONCURRENCY.get(provider, DEFAULT_PROVIDER_CONCURRENCY), provider
+                )
+            return (self._model_gates[model], self._provider_gates[provider],
+                    self._pacers[model], self._limiters[model])
+
+    def _record(self, lane: str, waited: float):
+        with self._lock:
+            w = self._waits.setdefault(lane, {"calls": 0, "wait_total": 0.0, "wait_max": 0.0})
+            w["calls"] += 1
+            w["wait_total"] += waited
+            w["wait_max"] = max(w["wait_max"], waited)
+
+    async def ainvoke(self, llm, runnable, messages, node: str, **kwargs):
+        """`runnable.ainvoke(messages)` once `llm`'s model and provider have capacity for `node`."""
+        model_gate, provider_gate, pacer, limiter = self._resources(llm)
+        priority = PRIORITIES.get(node, DEFAULT_PRIORITY)
+        tokens = estimate_tokens(_message_text(messages))
+
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            start = time.monotonic()
+            await pacer.acquire(priority)
+            try:
+                wait = limiter.reserve(tokens)
+                if wait > 0:
+                    try:
+                        await asyncio.sleep(wait)
+                    except asyncio.CancelledError:
+                        limiter.refund(tokens)
+                        raise
+            finally:
+                pacer.release()
+            # Always model before provider, so two calls never hold each other's slot
+            await model_gate.acquire(priority)
+            try:
+                await provider_gate.acquire(priority)
+            except BaseException:
+                model_gate.release()
+                raise
+            try:
+                self._record(node, time.monotonic() - start)
+                try:
+                    result = await runnable.ainvoke(messages, **kwargs)
+                except Exception as e:
+                    if is_rate_limit_error(e) and attempt < MAX_RATE_LIMIT_RETRIES:
+                        limiter.on_rate_limited()
+                        continue
+                    raise
+                limiter.on_success()
+                return result
+            finally:
+                provider_gate.release()
+                model_gate.release()
+
+    def invoke(self, llm, runnable, messages, node: str, **kwargs):
+        """Blocking counterpart of `ainvoke`, for synchronous callers."""
+        model_gate, provider_gate, pacer, limiter = self._resources(llm)
+        priority = PRIORITIES.get(node, DEFAULT_PRIORITY)
+        tokens = estimate_tokens(_message_text(messages))
+
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            start = time.monotonic()
+            pacer.acquire_sync(priority)
+            try:
+                limiter.acquire(tokens)
+            finally:
+                pacer.release()
+            model_gate.acquire_sync(priority)
+            try:
+                provider_gate.acquire_sync(priority)
+            except BaseException:
+                model_gate.release()
+                raise
+            try:
+                self._record(node, time.monotonic() - start)
+                try:
+                    result = runnable.invoke(messages, **kwargs)
+                except Exception as e:
+                    if is_rate_limit_error(e) and attempt < MAX_RATE_LIMIT_RETRIES:
+                        limiter.on_rate_limited()
+                        continue
+                    raise
+                limiter.on_success()
+                return result
+            finally:
+                provider_gate.release()
+                model_gate.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lanes = {
+                lane: {
+                    "calls": int(w["calls"]),
+                    "wait_total": round(w["wait_total"], 3),
+                    "wait_avg": round(w["wait_total"] / w["calls"], 3) if w["calls"] else 0.0,
+                    "wait_max": round(w["wait_max"], 3),
+                }
+                for lane, w in self._waits.items()
+            }
+            model_gates = dict(self._model_gates)
+            provider_gates = dict(self._provider_gates)
+            limiters = dict(self._limiters)
+            pacers = dict(self._pacers)
+            providers = dict(self._providers)
+        return {
+            "lanes": lanes,
+            "models": {
+                model: dict(
+                    gate.stats(),
+                    provider=providers[model],
+                    rate_fraction=round(limiters[model].fraction, 3),
+                    rate_limited=limiters[model].rate_limited,
+                    rate_queued=pacers[model].stats()["queued"],
+                )
+                for model, gate in model_gates.items()
+            },
+            "providers": {provider: gate.stats() for provider, gate in provider_gates.items()},
+        }
+
+
+_default_scheduler: Optional[LLMScheduler] = None
+_default_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    """Process-wide scheduler, created on first use."""
+    global _default_scheduler
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = LLMScheduler()
+        return _default_scheduler
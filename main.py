@@ -1,4 +1,5 @@
 from langgraph.graph import END, StateGraph, START
+from langchain_core.runnables import RunnableLambda
 from dotenv import load_dotenv
 import os
 
@@ -6,7 +7,10 @@ from state import GraphState
 from nodes import (
     generator_node, researcher_node, 
     simulation_node, analyst_node, critic_node,
-    recruiter_node
+    recruiter_node,
+    agenerator_node, aresearcher_node,
+    asimulation_node, aanalyst_node, acritic_node,
+    arecruiter_node
 )
 from models import BusinessIdea
 
@@ -80,14 +84,18 @@ def should_continue(state: GraphState) -> str:
 
 # --- Build the Graph ---
 
+def _node(func, afunc) -> RunnableLambda:
+    """Node usable from both app.stream (CLI) and app.astream (API, without blocking the event loop)."""
+    return RunnableLambda(func, afunc=afunc, name=func.__name__)
+
 workflow = StateGraph(GraphState)
 
-workflow.add_node("generator", generator_node)
-workflow.add_node("researcher", researcher_node)
-workflow.add_node("recruiter", recruiter_node)
-workflow.add_node("simulation", simulation_node)
-workflow.add_node("analyst", analyst_node)
-workflow.add_node("critic", critic_node)
+workflow.add_node("generator", _node(generator_node, agenerator_node))
+workflow.add_node("researcher", _node(researcher_node, aresearcher_node))
+workflow.add_node("recruiter", _node(recruiter_node, arecruiter_node))
+workflow.add_node("simulation", _node(simulation_node, asimulation_node))
+workflow.add_node("analyst", _node(analyst_node, aanalyst_node))
+workflow.add_node("critic", _node(critic_node, acritic_node))
 
 workflow.add_edge(START, "generator")
 
@@ -140,7 +148,8 @@ def map_personas_to_interviews(state: GraphState):
             "rich_persona": p,
             "interview_guide": state["interview_guide"],
             "current_idea": state["current_idea"],
-            "use_fast_model": state.get("use_fast_model", False)
+            "use_fast_model": state.get("use_fast_model", False),
+            "model_profiles": state.get("model_profiles")
         }) for p in personas
     ]
 
@@ -217,3 +226,7 @@ if __name__ == "__main__":
     if final_state.get("critique"):
         print(f"Final Score: {final_state['critique'].score}")
         print(f"Approved: {final_state['critique'].is_approved}")
+
+    from llm_cache import get_cache
+    cache_stats = get_cache().stats()
+    print(f"LLM cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['bypassed']} uncached")
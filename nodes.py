@@ -1,9 +1,10 @@
 import json
+import asyncio
 import re
 import pathlib
 from langchain_core.messages import HumanMessage, SystemMessage
 from config import (
-    llm_generator, llm_critic, llm_fast,
+    get_llm, profile_for,
     GENERATOR_SYSTEM_PROMPT, CRITIC_SYSTEM_PROMPT, 
     RESEARCHER_SYSTEM_PROMPT, INTERVIEWER_SYSTEM_PROMPT, PERSONA_SYSTEM_PROMPT,
     ANALYST_SYSTEM_PROMPT, MOCK_SIMULATION, RECRUITER_ENRICHMENT_PROMPT
@@ -14,12 +15,20 @@ from models import (
     PersonaThought, InterviewerThought
 )
 from google_recruiter import GoogleRecruiter
-from google.api_core import retry
-import google.generativeai as genai
+from persona_metadata import filters_from_query
+from persona_segments import get_store as get_dossier_store, context_key as dossier_context_key
+from llm_cache import cached
 from state import GraphState
-from utils import extract_json_from_text, save_artifact
+from utils import extract_json_from_text, save_artifact, run_sync
 
-def generator_node(state: GraphState) -> GraphState:
+
+def _llm(state: dict, role: str, node: str = None):
+    """Cached client for `role` in this run: the request's model_profiles, else the fast or default tier."""
+    profile = profile_for(role, state.get("model_profiles"), state.get("use_fast_model", False))
+    return cached(get_llm(profile), node or role)
+
+
+async def agenerator_node(state: GraphState) -> GraphState:
     print(f"\n--- GENERATOR NODE (Iteration {state['iteration_count']}) ---")
     
     # DEBUG
@@ -129,7 +138,7 @@ def generator_node(state: GraphState) -> GraphState:
     ]
 
     # Select LLM based on mode
-    llm = llm_fast if state.get("use_fast_model") else llm_generator
+    llm = _llm(state, "generator")
     if state.get("use_fast_model"):
         print("   -> [DEBUG] Using FAST Model (GPT-4o-mini)")
 
@@ -141,7 +150,8 @@ def generator_node(state: GraphState) -> GraphState:
         try:
             print(f"   -> Invoking LLM (Attempt {attempt + 1})...")
             
-            response = llm.invoke(messages)
+            # Retries must not get the unparsable cached answer back
+            response = await llm.ainvoke(messages, refresh=attempt > 0)
             raw_content = response.content
             
             # --- FIX: ОБРАБОТКА СПИСКА ---
@@ -200,14 +210,14 @@ def generator_node(state: GraphState) -> GraphState:
         "critique": None         # Clear for next cycle
     }
 
-def critic_node(state: GraphState) -> GraphState:
+async def acritic_node(state: GraphState) -> GraphState:
     """
     Simulates and critiques the idea using ChatGPT 5.1 (Reasoning).
     """
     print("\n--- CRITIC NODE ---")
     
     # 1. Bind Structured Output
-    structured_llm = llm_critic.with_structured_output(CritiqueFeedback)
+    structured_llm = _llm(state, "critic").with_structured_output(CritiqueFeedback)
     
     current_idea = state["current_idea"]
     
@@ -227,15 +237,8 @@ def critic_node(state: GraphState) -> GraphState:
         HumanMessage(content=user_content)
     ]
     
-    # Select LLM
-    llm = llm_fast if state.get("use_fast_model") else llm_critic
-    if state.get("use_fast_model"):
-        print("   -> [DEBUG] Using FAST Model (GPT-4o-mini) for Critique")
-        # Note: structured output might behave differently on Flash, but we try
-        structured_llm = llm.with_structured_output(CritiqueFeedback)
-    
     try:
-        feedback = structured_llm.invoke(messages)
+        feedback = await structured_llm.ainvoke(messages)
         
         # Validate the response
         if feedback is None:
@@ -264,7 +267,7 @@ def critic_node(state: GraphState) -> GraphState:
         
     return {"critique": feedback}
 
-def researcher_node(state: GraphState) -> GraphState:
+async def aresearcher_node(state: GraphState) -> GraphState:
     """
     Generates hypotheses and an interview guide using Gemini 3 Pro.
     Saves the guide to a local file.
@@ -329,7 +332,7 @@ def researcher_node(state: GraphState) -> GraphState:
     ]
     
     # Select LLM
-    llm = llm_fast if state.get("use_fast_model") else llm_generator
+    llm = _llm(state, "researcher")
     if state.get("use_fast_model"):
         print("   -> [DEBUG] Using FAST Model (GPT-4o-mini) for Research")
 
@@ -341,7 +344,7 @@ def researcher_node(state: GraphState) -> GraphState:
     for attempt in range(3):
         try:
             print(f"   -> Invoking Researcher (Attempt {attempt + 1})...")
-            response = llm.invoke(messages)
+            response = await llm.ainvoke(messages, refresh=attempt > 0)
             raw_content = response.content
             
             if isinstance(raw_content, list):
@@ -400,7 +403,7 @@ def researcher_node(state: GraphState) -> GraphState:
         "iteration_count": state["iteration_count"]
     }
 
-def recruiter_node(state: GraphState) -> GraphState:
+async def arecruiter_node(state: GraphState) -> GraphState:
     """
     Finds relevant personas using Google Vector Search (Role-based) and "enriches" them.
     """
@@ -415,40 +418,80 @@ def recruiter_node(state: GraphState) -> GraphState:
     rich_personas_list = []
     
     try:
-        # 1. Initialize Recruiter
-        recruiter = GoogleRecruiter()
-        # Ensure we have a model for enrichment
-        llm = llm_fast if state.get("use_fast_model") else llm_generator
-        
-        # Limit the number of personas to interview based on user config
-        limit = state.get("num_personas", 3)
-        print(f"   -> Limiting selection to first {limit} personas (requested by user).")
-        
-        # 2. Iterate Strategy
-        for i, spec in enumerate(target_personas_specs[:limit], 1):
-            print(f"   -> [{i}/{limit}] Hunting for: {spec.role} ({spec.archetype})")
+        # 1. Initialize Recruiter (cheap: the index is shared process-wide)
+        recruiter = await asyncio.to_thread(GoogleRecruiter)
+        try:
+            # Ensure we have a model for enrichment
+            llm = _llm(state, "recruiter")
             
-            # A. Generate Query
-            # We use the specific English search query provided by Researcher for better vector matching
-            query = spec.search_query_en
-            print(f"      -> Query: {query}")
+            # Limit the number of personas to interview based on user config
+            limit = state.get("num_personas", 3)
+            print(f"   -> Limiting selection to first {limit} personas (requested by user).")
+            specs = target_personas_specs[:limit]
             
-            # B. Search
-            found_text = ""
+            # 2. Search all segments at once
+            # We use the specific English search query provided by Researcher for better vector matching.
+            # One embedding request + one matrix product for every spec, 3 personas per spec.
+            # Age ranges and professions named in the query pre-filter the index rows.
+            # MMR across specs: no two specs get the same (or a near-identical) persona,
+            # so every enrichment call below works on distinct source material.
+            queries = [spec.search_query_en for spec in specs]
+            
+            # Dossiers enriched for near-identical specs of the same idea in earlier runs
+            # are reused as-is (see persona_segments.py); only the remaining specs are
+            # searched and enriched. The query embeddings are computed once and shared with the search.
+            dossier_store = get_dossier_store(recruiter.provider)
+            idea = state.get("current_idea")
+            dossier_context = dossier_context_key(idea.model_dump_json() if idea else state.get("initial_input", ""))
+            query_embeddings = None
+            reused = [None] * len(specs)
             try:
-                # We search for top 3 and pick best match text or just concat top 2
-                raw_chunks = recruiter.search_personas(query, limit=3)
-                if raw_chunks:
-                    found_text = "\n\n".join(raw_chunks)
-                    print(f"      -> Found {len(raw_chunks)} candidates in DB.")
-                else:
-                    print(f"      -> No direct matches in DB. Will rely on synthetic enrichment.")
-                    found_text = "No direct match in database. Generate realistic details based on requirements."
+                query_embeddings = await asyncio.to_thread(recruiter.provider.embed_queries, queries)
+                reused = await asyncio.to_thread(dossier_store.lookup, query_embeddings, dossier_context)
             except Exception as e:
-                print(f"      -> Search Error: {e}")
+                print(f"   -> Dossier store unavailable: {e}")
+            to_search = [j for j, match in enumerate(reused) if match is None]
+            
+            try:
+                found = await asyncio.to_thread(
+                    recruiter.search_personas_diverse,
+                    [queries[j] for j in to_search], k=3,
+                    filters=[filters_from_query(queries[j]) or None for j in to_search],
+                    query_embeddings=query_embeddings[to_search] if query_embeddings is not None else None,
+                )
+                batch_chunks = [[] for _ in specs]
+                for j, chunks in zip(to_search, found):
+                    batch_chunks[j] = chunks
+            except Exception as e:
+                print(f"   -> Search Error: {e}")
+                batch_chunks = None
+        finally:
+            # Search is done; a newer index version may now replace this one
+            recruiter.close()
+        
+        # 3. Enrich every spec (the LLM calls run concurrently, results keep spec order)
+        async def _enrich(i, spec):
+            print(f"   -> [{i}/{limit}] Hunting for: {spec.role} ({spec.archetype})")
+            print(f"      -> Query: {spec.search_query_en}")
+            
+            if reused[i - 1] is not None:
+                persona, similarity = reused[i - 1]
+                rich_p = RichPersona(**persona)
+                print(f"      -> Reusing stored dossier: {rich_p.name} (query similarity {similarity:.2f})")
+                return rich_p, False
+            
+            # A. Search results for this spec
+            if batch_chunks is None:
                 found_text = "Search unavailable."
+            elif batch_chunks[i - 1]:
+                raw_chunks = batch_chunks[i - 1]
+                found_text = "\n\n".join(raw_chunks)
+                print(f"      -> Found {len(raw_chunks)} candidates in DB.")
+            else:
+                print(f"      -> No direct matches in DB. Will rely on synthetic enrichment.")
+                found_text = "No direct match in database. Generate realistic details based on requirements."
                 
-            # C. Enrichment (LLM)
+            # B. Enrichment (LLM)
             # We feed the Spec + Found Text -> RichPersona
             
             # Prepare prompts
@@ -462,7 +505,7 @@ def recruiter_node(state: GraphState) -> GraphState:
             
             try:
                 print(f"      -> Enriching profile with LLM...")
-                response = llm.invoke(messages)
+                response = await llm.ainvoke(messages)
                 cleaned_json = extract_json_from_text(response.content)
                 data_dict = json.loads(cleaned_json)
                 
@@ -471,16 +514,38 @@ def recruiter_node(state: GraphState) -> GraphState:
                    data_dict = data_dict[0] # Take first if array returned
                 
                 rich_p = RichPersona(**data_dict)
-                rich_personas_list.append(rich_p)
-                
                 print(f"      -> Created RichPersona: {rich_p.name} | {rich_p.company_context}")
+                return rich_p, True
                 
             except Exception as e:
                 print(f"      -> Enrichment Error for {spec.role}: {e}")
+                await asyncio.to_thread(llm.forget, messages)
                 # Fallback: Create semi-synthetic from Spec
                 # Note: We miss age/bio etc. but enough to proceed?
                 # Actually, better to skip or retry. Let's try to make a minimal one.
-                pass
+                return None, False
+        
+        results = await asyncio.gather(*(_enrich(i, spec) for i, spec in enumerate(specs, 1)))
+        enriched = []  # (spec position, RichPersona) created by the LLM in this run
+        for j, (rich_p, created) in enumerate(results):
+            if rich_p is not None:
+                rich_personas_list.append(rich_p)
+                if created:
+                    enriched.append((j, rich_p))
+        
+        # 4. Keep the new dossiers for later runs
+        if enriched and query_embeddings is not None:
+            try:
+                await asyncio.to_thread(
+                    dossier_store.append,
+                    query_embeddings[[j for j, _ in enriched]],
+                    [queries[j] for j, _ in enriched],
+                    [p.model_dump() for _, p in enriched],
+                    dossier_context,
+                )
+                await asyncio.to_thread(dossier_store.maybe_compact)
+            except Exception as e:
+                print(f"   -> Could not store dossiers: {e}")
 
     except Exception as e:
         print(f"   -> Recruiter Critical Error: {e}")
@@ -493,15 +558,14 @@ def recruiter_node(state: GraphState) -> GraphState:
         "iteration_count": state["iteration_count"]
     }
 
-def simulation_node(payload: dict) -> dict:
+async def asimulation_node(payload: dict) -> dict:
     """
     Simulates ONE user interview. 
-    Input payload: {"rich_persona": dict, "interview_guide": InterviewGuide, "current_idea": BusinessIdea, "use_fast_model": bool}
+    Input payload: {"rich_persona": dict, "interview_guide": InterviewGuide, "current_idea": BusinessIdea, "use_fast_model": bool, "model_profiles": dict}
     """
     rich_p_dict = payload.get("rich_persona")
     interview_guide = payload.get("interview_guide")
     current_idea = payload.get("current_idea") # Optional, needed for context? Actually not used heavily inside loop.
-    use_fast_model = payload.get("use_fast_model", False)
 
     if not rich_p_dict:
         print("   -> CRITICAL: No rich persona in payload.")
@@ -529,10 +593,10 @@ def simulation_node(payload: dict) -> dict:
     )
 
     # Prepare LLMs
-    interviewer_llm = llm_fast if use_fast_model else llm_generator
+    interviewer_llm = _llm(payload, "interviewer", node="simulation")
     structured_interviewer = interviewer_llm.with_structured_output(InterviewerThought)
     
-    persona_llm = llm_fast 
+    persona_llm = _llm(payload, "persona", node="simulation")
     structured_persona = persona_llm.with_structured_output(PersonaThought)
 
     conversation_log = ""
@@ -586,7 +650,7 @@ def simulation_node(payload: dict) -> dict:
         ]
         
         try:
-            persona_thought = structured_persona.invoke(persona_messages)
+            persona_thought = await structured_persona.ainvoke(persona_messages)
         except Exception as e:
             print(f"      -> [Persona Error] {e}")
             persona_thought = PersonaThought(mood="Confused", patience=patience-10, inner_monologue="Error", verbal_response="Could you repeat that?")
@@ -623,7 +687,7 @@ def simulation_node(payload: dict) -> dict:
         ]
         
         try:
-            interviewer_thought = structured_interviewer.invoke(interviewer_messages)
+            interviewer_thought = await structured_interviewer.ainvoke(interviewer_messages)
             next_question = interviewer_thought.next_question
             
             if interviewer_thought.status == "WRAP_UP":
@@ -650,10 +714,12 @@ def simulation_node(payload: dict) -> dict:
     Do not use keys like 'pain_score'. Use 'pain_level'.
     """
     
+    summary_response = None
     try:
         print(f"      -> Generating summary for {p.name}...")
-        summary_llm = llm_fast if use_fast_model else llm_generator
-        summary_response = summary_llm.invoke([HumanMessage(content=summary_prompt)])
+        summary_llm = _llm(payload, "summary", node="simulation")
+        summary_messages = [HumanMessage(content=summary_prompt)]
+        summary_response = await summary_llm.ainvoke(summary_messages)
         raw_content = summary_response.content
         if isinstance(raw_content, list):
             raw_content = "".join([b.get("text", "") for b in raw_content if isinstance(b, dict)])
@@ -692,9 +758,11 @@ def simulation_node(payload: dict) -> dict:
         
     except Exception as e:
         print(f"   -> CRITICAL SUMMARY ERROR for {p.name}: {e}")
+        if summary_response is not None:
+            await asyncio.to_thread(summary_llm.forget, summary_messages)
         return {}
 
-def analyst_node(state: GraphState) -> GraphState:
+async def aanalyst_node(state: GraphState) -> GraphState:
     """
     Analyzes interview transcripts and generates a research report.
     """
@@ -748,14 +816,14 @@ def analyst_node(state: GraphState) -> GraphState:
     ]
     
     # Select LLM
-    llm = llm_fast if state.get("use_fast_model") else llm_generator
+    llm = _llm(state, "analyst")
     if state.get("use_fast_model"):
         print("   -> [DEBUG] Using FAST Model (GPT-4o-mini) for Analysis")
 
     # 2. Invoke LLM (Gemini 3 Pro)
     research_report = None
     try:
-        response = llm.invoke(messages)
+        response = await llm.ainvoke(messages)
         raw_content = response.content
         
         if isinstance(raw_content, list):
@@ -793,6 +861,9 @@ def analyst_node(state: GraphState) -> GraphState:
         
     except Exception as e:
         print(f"   -> Analyst Error: {e}")
+        if research_report is None:
+            # Don't replay an answer that could not be parsed
+            await asyncio.to_thread(llm.forget, messages)
     
     # Increment interview cycle counter
     current_cycle = state.get("current_interview_cycle", 0)
@@ -804,3 +875,23 @@ def analyst_node(state: GraphState) -> GraphState:
         "iteration_count": state["iteration_count"],
         "current_interview_cycle": new_cycle
     }
+
+
+# Synchronous entry points (CLI, scripts): the same nodes, run to completion
+def generator_node(state: GraphState) -> GraphState:
+    return run_sync(agenerator_node(state))
+
+def critic_node(state: GraphState) -> GraphState:
+    return run_sync(acritic_node(state))
+
+def researcher_node(state: GraphState) -> GraphState:
+    return run_sync(aresearcher_node(state))
+
+def recruiter_node(state: GraphState) -> GraphState:
+    return run_sync(arecruiter_node(state))
+
+def simulation_node(payload: dict) -> dict:
+    return run_sync(asimulation_node(payload))
+
+def analyst_node(state: GraphState) -> GraphState:
+    return run_sync(aanalyst_node(state))
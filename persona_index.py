@@ -0,0 +1,576 @@
+"""
+Binary on-disk persona index.
+
+An index is a directory with the following layout:
+
+    manifest.json      - small JSON manifest (format version, embedding backend
+                         and model, dims, rows, checksum of the other files)
+    embeddings.npy     - float32 matrix [rows x dims], opened with mmap
+    texts.bin          - UTF-8 persona texts concatenated back-to-back
+    text_offsets.npy   - int64 byte offsets into texts.bin ([rows + 1])
+    text_hashes.npy    - content hash per row, lets rebuilds reuse unchanged embeddings
+    ivf_*.npy          - optional IVF approximate search index (see ann_index.py)
+    quant_*.npy        - optional int8 / PQ codes scored before exact re-ranking
+                         (see quantization.py)
+    bm25_*             - BM25 postings for hybrid lexical + vector search
+                         (see lexical_index.py)
+    meta_*.npy         - age column and attribute bitmaps for filtered search
+                         (see persona_metadata.py)
+    col_*              - the source records, one string column per field
+                         (see persona_store.py)
+
+Builds normally write each index into a fresh version directory and switch
+an atomic pointer to it once complete (see index_versions.py).
+
+Only the manifest is parsed on open. Embeddings, texts and record columns are
+memory-mapped, so opening is near-instant, resident memory is dominated by the
+vectors that searches touch, and only the returned rows' strings are decoded.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+from array import array
+import logging
+import numpy as np
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+
+from ann_index import IVFIndex, build_ivf, EXACT_SEARCH_THRESHOLD, DEFAULT_NPROBE
+from quantization import QUANTIZERS, load_quantizer, rerank_size
+from lexical_index import BM25Index, BM25Stats, build_bm25, write_vocab, reciprocal_rank_fusion, VOCAB_FILE
+from persona_metadata import PersonaMetadata, build_metadata, open_metadata
+from persona_store import StringColumn, ColumnStoreWriter, PersonaStore
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+DEFAULT_INDEX_DIR = os.environ.get("PERSONA_INDEX_DIR", "personas_index")
+# How deep each ranking goes before reciprocal-rank fusion
+HYBRID_DEPTH = 50
+MANIFEST_FILE = "manifest.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+TEXTS_FILE = "texts.bin"
+OFFSETS_FILE = "text_offsets.npy"
+TEXT_HASHES_FILE = "text_hashes.npy"
+CHECKSUM_CHUNK_BYTES = 1 << 24
+
+
+def read_manifest(index_dir: str) -> Dict[str, Any]:
+    """Reads and validates the manifest of an index directory."""
+    manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        raise FileNotFoundError(
+            f"Index manifest '{manifest_path}' not found. "
+            "Please run 'build_vector_index.py' first."
+        )
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported index format version {manifest.get('format_version')} "
+            f"in '{index_dir}' (expected {FORMAT_VERSION}). Rebuild the index."
+        )
+    return manifest
+
+
+def text_hash(text: str) -> bytes:
+    """Content hash of a persona text (hex, so numpy 'S32' arrays round-trip it)."""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest().encode('ascii')
+
+
+def text_hashes(texts: Sequence[str]) -> np.ndarray:
+    return np.array([text_hash(t) for t in texts], dtype="S32")
+
+
+def index_checksum(index_dir: str) -> str:
+    """blake2b over the names and contents of every file in an index directory but its manifest."""
+    digest = hashlib.blake2b(digest_size=16)
+    for root, dirs, files in os.walk(index_dir):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            relpath = os.path.relpath(path, index_dir)
+            if relpath == MANIFEST_FILE or name.endswith(".tmp"):
+                continue
+            digest.update(relpath.encode("utf-8") + b"\0")
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(CHECKSUM_CHUNK_BYTES), b""):
+                    digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _replace_into(index_dir: str, name: str, write_fn):
+    """
+    Writes a file under a temporary name and renames it into place, so readers
+    that still map the previous file keep a consistent copy.
+    """
+    final_path = os.path.join(index_dir, name)
+    tmp_path = final_path + ".tmp"
+    write_fn(tmp_path)
+    os.replace(tmp_path, final_path)
+
+
+def _save_npy(array: np.ndarray):
+    def _write(path):
+        with open(path, 'wb') as f:
+            np.save(f, array)
+    return _write
+
+
+class IndexWriter:
+    """
+    Builds an index from rows appended in batches. Vectors, texts and record
+    columns go straight to disk, so memory does not grow with the corpus (apart
+    from offsets and one hash per row); the ANN, quantization, BM25 and metadata
+    structures are built from the memory-mapped files in `finish`.
+    See `write_index` for the options.
+    """
+
+    def __init__(
+        self,
+        index_dir: str,
+        embedding_model: str,
+        ann: str = "auto",
+        n_lists: Optional[int] = None,
+        quantization: Optional[str] = None,
+        embedding_backend: str = "gemini",
+        embedding_params: Optional[Dict[str, Any]] = None,
+        extra_files: Optional[Dict[str, np.ndarray]] = None,
+        lexical: bool = True,
+        metadata: bool = True,
+        columns: bool = True,
+        dims: Optional[int] = None,
+    ):
+        self.index_dir = index_dir
+        self.embedding_model = embedding_model
+        self.ann = ann
+        self.n_lists = n_lists
+        self.quantization = quantization
+        self.embedding_backend = embedding_backend
+        self.embedding_params = embedding_params or {}
+        self.extra_files = extra_files or {}
+        self.lexical = lexical
+        self.metadata = metadata
+        self.dims = dims
+        self.rows = 0
+
+        os.makedirs(index_dir, exist_ok=True)
+        self._vectors_path = os.path.join(index_dir, EMBEDDINGS_FILE + ".rows.tmp")
+        self._texts_path = os.path.join(index_dir, TEXTS_FILE + ".tmp")
+        self._vectors = open(self._vectors_path, 'wb')
+        self._texts = open(self._texts_path, 'wb')
+        self._offsets = array('q', [0])
+        self._hashes = bytearray()
+        self._columns = ColumnStoreWriter(index_dir) if columns else None
+
+    def append(
+        self,
+        embeddings: Sequence[Sequence[float]],
+        texts: Sequence[str],
+        records: Optional[Sequence[Dict[str, Any]]] = None,
+    ):
+        """`records` are the source rows behind `texts`, stored field by field."""
+        matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if matrix.ndim != 2 or len(matrix) != len(texts):
+            raise ValueError(
+                f"Expected a [rows x dims] matrix matching {len(texts)} texts, got shape {matrix.shape}."
+            )
+        if self.dims is None:
+            self.dims = matrix.shape[1]
+        elif matrix.shape[1] != self.dims and len(matrix):
+            raise ValueError(f"Expected {self.dims}-dimensional vectors, got {matrix.shape[1]}.")
+        if records is not None and len(records) != len(texts):
+            raise ValueError(f"Expected {len(texts)} records, got {len(records)}.")
+
+        self._vectors.write(matrix.tobytes())
+        for text in texts:
+            encoded = text.encode('utf-8')
+            self._texts.write(encoded)
+            self._offsets.append(self._offsets[-1] + len(encoded))
+            self._hashes += text_hash(text)
+        if self._columns is not None:
+            if records is None:
+                self._columns.skip(len(texts))
+            else:
+                self._columns.append(records)
+        self.rows += len(matrix)
+
+    def abort(self):
+        """Drops the partial files; the previous index (if any) stays untouched."""
+        self._vectors.close()
+        self._texts.close()
+        for path in (self._vectors_path, self._texts_path):
+            if os.path.exists(path):
+                os.remove(path)
+        if self._columns is not None:
+            self._columns.abort()
+
+    def finish(self) -> Dict[str, Any]:
+        """
+        Writes the remaining files. The manifest is written last, so a directory
+        without one is never opened and a rewritten manifest signals a new index
+        to the registry.
+        """
+        self._vectors.close()
+        self._texts.close()
+        if self.dims is None:
+            self.abort()
+            raise ValueError("Cannot write an index without rows or known dimensions.")
+        index_dir = self.index_dir
+
+        def _write_embeddings(path):
+            # .npy header followed by the raw rows, copied without loading them
+            header = {
+                'descr': np.lib.format.dtype_to_descr(np.dtype(np.float32)),
+                'fortran_order': False,
+                'shape': (self.rows, self.dims),
+            }
+            with open(path, 'wb') as out, open(self._vectors_path, 'rb') as rows:
+                np.lib.format.write_array_header_1_0(out, header)
+                shutil.copyfileobj(rows, out, 1 << 24)
+
+        _replace_into(index_dir, EMBEDDINGS_FILE, _write_embeddings)
+        os.remove(self._vectors_path)
+
+        offsets = np.frombuffer(self._offsets, dtype=np.int64)
+        os.replace(self._texts_path, os.path.join(index_dir, TEXTS_FILE))
+        _replace_into(index_dir, OFFSETS_FILE, _save_npy(offsets))
+        _replace_into(index_dir, TEXT_HASHES_FILE, _save_npy(np.frombuffer(bytes(self._hashes), dtype="S32")))
+
+        manifest = {
+            "format_version": FORMAT_VERSION,
+            "embedding_backend": self.embedding_backend,
+            "embedding_model": self.embedding_model,
+            "embedding_params": self.embedding_params,
+            "dims": int(self.dims),
+            "rows": int(self.rows),
+            "dtype": "float32",
+            "ann": None,
+            "quantization": None,
+            "lexical": None,
+            "metadata": None,
+            "columns": None,
+        }
+
+        for name, extra in self.extra_files.items():
+            _replace_into(index_dir, name, _save_npy(extra))
+        if self._columns is not None and self._columns.rows:
+            manifest["columns"] = self._columns.finish()
+
+        matrix = np.load(os.path.join(index_dir, EMBEDDINGS_FILE), mmap_mode="r")
+        if self.ann == "ivf" or (self.ann == "auto" and self.rows >= EXACT_SEARCH_THRESHOLD):
+            ivf_files, manifest["ann"] = build_ivf(matrix, n_lists=self.n_lists)
+            for name, data in ivf_files.items():
+                _replace_into(index_dir, name, _save_npy(data))
+
+        if self.quantization:
+            quant_files, manifest["quantization"] = QUANTIZERS[self.quantization].train_encode(matrix)
+            for name, data in quant_files.items():
+                _replace_into(index_dir, name, _save_npy(data))
+
+        texts = StringColumn(os.path.join(index_dir, TEXTS_FILE), offsets)
+        try:
+            if self.lexical:
+                bm25_files, terms, manifest["lexical"] = build_bm25(texts)
+                for name, data in bm25_files.items():
+                    _replace_into(index_dir, name, _save_npy(data))
+                _replace_into(index_dir, VOCAB_FILE, lambda path: write_vocab(path, terms))
+
+            if self.metadata:
+                meta_files, manifest["metadata"] = build_metadata(texts)
+                for name, data in meta_files.items():
+                    _replace_into(index_dir, name, _save_npy(data))
+        finally:
+            texts.close()
+
+        manifest["checksum"] = index_checksum(index_dir)
+
+        def _write_manifest(path):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2)
+
+        _replace_into(index_dir, MANIFEST_FILE, _write_manifest)
+
+        logger.info(f"Wrote {manifest['rows']} personas ({manifest['dims']} dims) to {index_dir}")
+        return manifest
+
+
+def write_index(
+    index_dir: str,
+    embeddings: Sequence[Sequence[float]],
+    texts: Sequence[str],
+    embedding_model: str,
+    ann: str = "auto",
+    n_lists: Optional[int] = None,
+    quantization: Optional[str] = None,
+    embedding_backend: str = "gemini",
+    embedding_params: Optional[Dict[str, Any]] = None,
+    extra_files: Optional[Dict[str, np.ndarray]] = None,
+    lexical: bool = True,
+    metadata: bool = True,
+    records: Optional[Sequence[Dict[str, Any]]] = None,
+) -> Dict[str, Any]:
+    """
+    Writes embeddings and texts in the binary index layout.
+    `ann` selects the approximate search index: "ivf", "none", or "auto"
+    (IVF only once the corpus is too large for brute force to stay cheap).
+    `quantization` ("int8" or "pq") additionally writes compressed codes.
+    `extra_files` are stored as-is (e.g. the embedding provider's fitted state).
+    `lexical` builds the BM25 postings used for hybrid search.
+    `metadata` extracts the attribute columns used by filtered search.
+    `records` (the source rows behind `texts`) are kept in the columnar store.
+    For corpora that do not fit in memory, append batches to an `IndexWriter`.
+    """
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    writer = IndexWriter(
+        index_dir, embedding_model, ann=ann, n_lists=n_lists, quantization=quantization,
+        embedding_backend=embedding_backend, embedding_params=embedding_params,
+        extra_files=extra_files, lexical=lexical, metadata=metadata,
+        dims=matrix.shape[1] if matrix.ndim == 2 else None,
+    )
+    try:
+        writer.append(matrix, texts, records)
+    except Exception:
+        writer.abort()
+        raise
+    return writer.finish()
+
+
+def convert_legacy_index(json_file: str, index_dir: str, embedding_model: str) -> Dict[str, Any]:
+    """Converts an old single-file 'personas_index.json' into the binary layout."""
+    logger.info(f"Converting legacy index {json_file} -> {index_dir}...")
+    with open(json_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    # Old indexes carried a full copy of the dataset; it becomes the record columns
+    records = data.get('original_data')
+    if not isinstance(records, list) or len(records) != len(data['texts']):
+        records = None
+    return write_index(index_dir, data['embeddings'], data['texts'], embedding_model, records=records)
+
+
+def top_k(scores: np.ndarray, limit: int, ids: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+    """
+    Top `limit` (id, score) pairs in descending score order.
+    `ids` maps positions in `scores` to row ids when scoring a subset of rows.
+    """
+    limit = min(limit, len(scores))
+    if limit <= 0:
+        return []
+    top = np.argpartition(scores, -limit)[-limit:]
+    top = top[np.argsort(scores[top])[::-1]]
+    rows = top if ids is None else ids[top]
+    return [(int(r), float(scores[p])) for r, p in zip(rows, top)]
+
+
+def fuse_rankings(vector_hits: List[Tuple[int, float]], lexical_hits: List[Tuple[int, float]], limit: int) -> List[Tuple[int, float]]:
+    """Reciprocal-rank fusion of a vector and a BM25 ranking (scores become RRF scores)."""
+    return reciprocal_rank_fusion([[r for r, _ in vector_hits], [r for r, _ in lexical_hits]], limit)
+
+
+class PersonaIndex:
+    """Read-only, memory-mapped view of a binary persona index."""
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        self.manifest = read_manifest(index_dir)
+
+        self.embeddings = np.load(os.path.join(index_dir, EMBEDDINGS_FILE), mmap_mode="r")
+        offsets = np.load(os.path.join(index_dir, OFFSETS_FILE), mmap_mode="r")
+        self._texts = StringColumn(os.path.join(index_dir, TEXTS_FILE), offsets)
+
+        if self.embeddings.shape[0] != len(self._texts):
+            raise ValueError(f"Index '{index_dir}' is inconsistent: embeddings and texts row counts differ.")
+
+        ann = self.manifest.get("ann") or {}
+        self.ivf: Optional[IVFIndex] = IVFIndex(index_dir) if ann.get("type") == "ivf" else None
+        # Codes stay resident, full-precision rows are only read for re-ranking
+        self.quantizer = load_quantizer(index_dir, self.manifest.get("quantization"))
+        self.lexical: Optional[BM25Index] = (
+            BM25Index(index_dir, len(self), self.manifest["lexical"]) if self.manifest.get("lexical") else None
+        )
+        self.metadata: Optional[PersonaMetadata] = open_metadata(index_dir, len(self), self.manifest.get("metadata"))
+        # Record columns are opened on first access
+        self.store = PersonaStore(index_dir, self.manifest.get("columns"), len(self))
+
+    def __len__(self) -> int:
+        return self.embeddings.shape[0]
+
+    @property
+    def dims(self) -> int:
+        return self.embeddings.shape[1]
+
+    @property
+    def embedding_model(self) -> str:
+        return self.manifest["embedding_model"]
+
+    def text(self, row: int) -> str:
+        """Materializes a single persona text from the blob."""
+        return self._texts[row]
+
+    def texts(self, rows: Sequence[int]) -> List[str]:
+        return self._texts.take(rows)
+
+    def records(self, rows: Sequence[int], fields: Optional[Sequence[str]] = None) -> List[Dict[str, str]]:
+        """Source fields of the given rows (all stored fields by default), read from the columns."""
+        return self.store.records(rows, fields)
+
+    def text_hashes(self) -> np.ndarray:
+        """Content hash per row ('S32'); computed from the texts for indexes that predate the file."""
+        path = os.path.join(self.index_dir, TEXT_HASHES_FILE)
+        if os.path.exists(path):
+            return np.load(path)
+        return text_hashes(self.texts(range(len(self))))
+
+    def search(
+        self,
+        query_embedding: np.ndarray,
+        limit: int,
+        nprobe: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> List[Tuple[int, float]]:
+        """Returns (row, score) pairs for the top `limit` rows by dot product."""
+        return self.search_batch(np.asarray(query_embedding)[None, :], limit, nprobe=nprobe, filters=filters)[0]
+
+    def search_batch(
+        self,
+        query_embeddings: np.ndarray,
+        limit: int,
+        nprobe: Optional[int] = None,
+        query_texts: Optional[Sequence[str]] = None,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        Top `limit` rows per query.
+        `filters` (see persona_metadata.py) restrict every query of the batch to
+        matching rows before any vector is scored.
+        Given `query_texts` and BM25 postings, the vector ranking is fused with
+        the BM25 ranking by reciprocal-rank fusion (scores are then RRF scores).
+        Without an IVF index (small corpora) all queries are scored with a single
+        matrix-matrix product. With one, each query scores only the rows of its
+        `nprobe` closest lists, so just those rows are paged in from disk.
+        With quantized codes, candidates are scored from the codes and a short
+        list is re-ranked against the full-precision vectors.
+        """
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        mask = self.filter_mask(filters, limit) if filters else None
+        if query_texts is not None and self.lexical is not None:
+            vector_hits, lexical_hits = self.hybrid_candidates(queries, query_texts, max(limit, HYBRID_DEPTH), nprobe, mask)
+            return [fuse_rankings(v, l, limit) for v, l in zip(vector_hits, lexical_hits)]
+        return self.search_vectors(queries, limit, nprobe, mask)
+
+    def filter_mask(self, filters: Dict[str, Any], limit: int = 1) -> Optional[np.ndarray]:
+        """
+        Boolean row mask for `filters`, or None when the search should run
+        unfiltered: the index has no metadata, or fewer than `limit` rows match.
+        """
+        mask = self.raw_filter_mask(filters)
+        if mask is None:
+            return None
+        matched = int(mask.sum())
+        if matched < limit:
+            logger.info(f"Filters {filters} match {matched} rows (< {limit}), searching unfiltered.")
+            return None
+        return mask
+
+    def raw_filter_mask(self, filters: Dict[str, Any]) -> Optional[np.ndarray]:
+        """Rows matching `filters`, however few (None without metadata columns)."""
+        if self.metadata is None:
+            logger.warning(f"Index '{self.index_dir}' has no metadata columns, ignoring filters {filters}.")
+            return None
+        return self.metadata.mask(filters)
+
+    def hybrid_candidates(
+        self,
+        queries: np.ndarray,
+        query_texts: Sequence[str],
+        depth: int,
+        nprobe: Optional[int],
+        mask: Optional[np.ndarray] = None,
+        lexical_stats: Optional[BM25Stats] = None,
+    ) -> Tuple[List[List[Tuple[int, float]]], List[List[Tuple[int, float]]]]:
+        """
+        The two rankings hybrid search fuses, `depth` deep per query: vector
+        hits and BM25 hits (rows sharing no query term are left out).
+        `lexical_stats` scores BM25 against a larger collection (see sharded_index.py).
+        """
+        vector_hits = self.search_vectors(queries, depth, nprobe, mask)
+        lexical_hits = []
+        for text in query_texts:
+            lexical_scores = self.lexical.scores(text, lexical_stats)
+            if mask is not None:
+                lexical_scores[~mask] = 0.0
+            lexical_hits.append([(r, s) for r, s in top_k(lexical_scores, depth) if s > 0])
+        return vector_hits, lexical_hits
+
+    def search_vectors(
+        self,
+        queries: np.ndarray,
+        limit: int,
+        nprobe: Optional[int],
+        mask: Optional[np.ndarray] = None,
+    ) -> List[List[Tuple[int, float]]]:
+        """Top `limit` rows per query by dot product, among the rows of `mask` (all rows if None)."""
+        # Row ids allowed by the filters; None means every row
+        allowed = np.flatnonzero(mask) if mask is not None else None
+
+        if self.ivf is None and self.quantizer is None:
+            vectors = self.embeddings if allowed is None else self.embeddings[allowed]
+            scores = queries @ vectors.T  # [queries x allowed rows]
+            return [top_k(row_scores, limit, ids=allowed) for row_scores in scores]
+
+        if self.ivf is None:
+            # One pass over the codes for all queries
+            approx_all = self.quantizer.score(queries, allowed)
+
+        nprobe = nprobe or DEFAULT_NPROBE
+        results = []
+        for qi, query in enumerate(queries):
+            rows = allowed
+            if self.ivf is not None:
+                rows = self.ivf.candidates(query, nprobe)
+                if mask is not None:
+                    rows = rows[mask[rows]]
+                if len(rows) < limit:
+                    # Probed lists are too small to fill the page, score everything allowed
+                    rows = allowed
+
+            if self.quantizer is None:
+                scores = self.embeddings @ query if rows is None else self.embeddings[rows] @ query
+                results.append(top_k(scores, limit, ids=rows))
+                continue
+
+            if self.ivf is None:
+                approx = approx_all[qi]
+            else:
+                approx = self.quantizer.score(query[None, :], rows)[0]
+            shortlist = top_k(approx, rerank_size(limit), ids=rows)
+            results.append(self._rerank(query, shortlist, limit))
+        return results
+
+    def _rerank(self, query: np.ndarray, shortlist: List[Tuple[int, float]], limit: int) -> List[Tuple[int, float]]:
+        """Exact scores for a short candidate list, read from the memory-mapped vectors."""
+        rows = np.sort(np.array([r for r, _ in shortlist], dtype=np.int64))
+        return top_k(self.embeddings[rows] @ query, limit, ids=rows)
+
+    def close(self):
+        """Releases the mappings. The index must not be used afterwards."""
+        self._texts.close()
+        self.store.close()
+        for part in (self.ivf, self.lexical, self.metadata):
+            if part is not None:
+                part.close()
+        self.embeddings = None
+        self.ivf = self.quantizer = self.lexical = self.metadata = None
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if len(sys.argv) != 3:
+        print("Usage: python persona_index.py <legacy_index.json> <index_dir>")
+        sys.exit(1)
+    from embeddings import GEMINI_EMBEDDING_MODEL
+    convert_legacy_index(sys.argv[1], sys.argv[2], embedding_model=GEMINI_EMBEDDING_MODEL)
@@ -0,0 +1,216 @@
+"""
+Structured persona attributes extracted at index build time.
+
+Persona texts mention age, location, profession and hobbies (the same facts
+filter_personas.HUMAN_MARKERS looks for). They are pulled out once into
+columnar arrays so a search can restrict scoring to matching rows:
+
+    meta_age.npy          - uint8 [rows], 0 = unknown
+    meta_<field>.npy      - uint8 [categories x ceil(rows / 8)] packed bitmaps,
+                            one bit per row and category
+
+Category names per field are recorded in the manifest under "metadata".
+Filters look like {"age": (35, 50), "profession": ["sales"]}: categories of one
+field are OR-ed, fields are AND-ed.
+"""
+
+import os
+import re
+import logging
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+AGE_FILE = "meta_age.npy"
+BITMAP_FILE_TEMPLATE = "meta_{field}.npy"
+
+PROFESSIONS = {
+    "sales": ["sales", "salesperson", "account executive", "business development"],
+    "accounting": ["accountant", "accounting", "bookkeeper", "auditor", "cpa"],
+    "finance": ["finance", "financial", "banker", "investor", "analyst"],
+    "management": ["manager", "director", "executive", "ceo", "founder", "entrepreneur", "business owner"],
+    "marketing": ["marketing", "marketer", "advertising", "brand"],
+    "software": ["software", "developer", "programmer", "engineer", "it specialist", "data scientist"],
+    "healthcare": ["nurse", "doctor", "physician", "medical", "therapist", "pharmacist", "dentist"],
+    "veterinary": ["veterinarian", "vet ", "animal care"],
+    "education": ["teacher", "professor", "lecturer", "educator", "tutor"],
+    "legal": ["lawyer", "attorney", "legal", "paralegal", "judge"],
+    "hr": ["recruiter", "human resources", "hr "],
+    "retail": ["retail", "shop owner", "store", "cashier"],
+    "hospitality": ["chef", "cook", "restaurant", "hotel", "barista", "waiter"],
+    "construction": ["construction", "builder", "contractor", "architect", "electrician", "plumber"],
+    "transport": ["driver", "pilot", "logistics", "courier", "trucker"],
+    "agriculture": ["farmer", "farming", "agriculture", "rancher"],
+    "arts": ["artist", "designer", "musician", "writer", "photographer", "actor"],
+    "science": ["scientist", "researcher", "biologist", "chemist", "physicist"],
+    "student": ["student", "graduate", "undergraduate"],
+    "retired": ["retired", "retiree", "pensioner"],
+}
+
+LOCATIONS = {
+    "north_america": ["united states", "usa", "america", "canada", "new york", "california", "texas", "chicago"],
+    "europe": ["europe", "united kingdom", "london", "germany", "france", "italy", "spain", "russia", "moscow"],
+    "asia": ["asia", "india", "china", "japan", "korea", "singapore", "vietnam"],
+    "latin_america": ["brazil", "mexico", "argentina", "latin america"],
+    "africa": ["africa", "nigeria", "kenya", "egypt"],
+    "oceania": ["australia", "new zealand"],
+    "urban": ["city", "urban", "metropolitan", "downtown"],
+    "rural": ["rural", "village", "small town", "countryside", "farm"],
+}
+
+HOBBIES = {
+    "sports": ["sports", "football", "soccer", "basketball", "running", "gym", "fitness", "yoga", "hiking"],
+    "music": ["music", "guitar", "piano", "singing"],
+    "reading": ["reading", "books", "literature"],
+    "gaming": ["gaming", "video games", "board games"],
+    "cooking": ["cooking", "baking", "recipes"],
+    "travel": ["travel", "traveling", "travelling"],
+    "gardening": ["gardening", "plants", "garden"],
+    "pets": ["dog", "dogs", "cat", "cats", "pets"],
+    "crafts": ["knitting", "woodworking", "crafts", "painting"],
+    "technology": ["gadgets", "technology", "tech"],
+}
+
+FIELDS: Dict[str, Dict[str, List[str]]] = {
+    "profession": PROFESSIONS,
+    "location": LOCATIONS,
+    "hobby": HOBBIES,
+}
+
+_AGE_PATTERNS = [
+    re.compile(r"\b(\d{2})[- ]years?[- ]old\b"),
+    re.compile(r"\baged? (\d{2})\b"),
+]
+_DECADE_PATTERN = re.compile(r"\bin (?:his|her|their|my) (?:early |mid-|mid |late )?(\d)0s\b")
+# "35-50", "aged 35 to 50", "35-50 who likes gardening"; "20-50 employees", "$10-20" or "30-40%" are not ages
+_AGE_RANGE_PATTERN = re.compile(r"(?<![$€£¥])\b(\d{2})\s*(?:-|–|to)\s*(\d{2})\b(?:\s*([%$€£¥]|[a-z]+))?")
+_NON_AGE_UNITS = {
+    "%", "$", "€", "£", "¥", "percent", "k", "bn", "usd", "eur", "gbp", "dollars", "euros",
+    "kg", "lb", "lbs", "cm", "mm", "km", "mi", "miles", "mph", "kmh", "ft",
+    "employees", "people", "staff", "users", "customers", "clients", "students", "hours", "hrs", "minutes",
+    "min", "mins", "days", "weeks", "months", "items", "units",
+}
+
+
+def _compile(categories: Dict[str, List[str]]) -> Dict[str, re.Pattern]:
+    # Word-start boundary so "cat" does not match "education"
+    return {
+        name: re.compile(r"\b(?:" + "|".join(re.escape(k) for k in keywords) + ")")
+        for name, keywords in categories.items()
+    }
+
+
+_FIELD_PATTERNS = {field: _compile(categories) for field, categories in FIELDS.items()}
+
+
+def extract_age(text: str) -> int:
+    """Age in years if the text states one, 0 otherwise."""
+    lowered = text.lower()
+    for pattern in _AGE_PATTERNS:
+        match = pattern.search(lowered)
+        if match and 14 <= int(match.group(1)) <= 99:
+            return int(match.group(1))
+    match = _DECADE_PATTERN.search(lowered)
+    if match and int(match.group(1)) >= 2:
+        return int(match.group(1)) * 10 + 5
+    return 0
+
+
+def extract_attributes(text: str) -> Dict[str, Any]:
+    """{"age": int, "profession": [...], "location": [...], "hobby": [...]} for one text."""
+    lowered = text.lower()
+    attributes: Dict[str, Any] = {"age": extract_age(text)}
+    for field, patterns in _FIELD_PATTERNS.items():
+        attributes[field] = [name for name, pattern in patterns.items() if pattern.search(lowered)]
+    return attributes
+
+
+def build_metadata(texts: Sequence[str]) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+    """Extracts attribute columns for all rows. Returns arrays by file name and the manifest entry."""
+    rows = len(texts)
+    ages = np.zeros(rows, dtype=np.uint8)
+    bits = {field: np.zeros((len(categories), rows), dtype=bool) for field, categories in FIELDS.items()}
+    category_index = {field: {name: i for i, name in enumerate(categories)} for field, categories in FIELDS.items()}
+
+    for row, text in enumerate(texts):
+        attributes = extract_attributes(text)
+        ages[row] = attributes["age"]
+        for field in FIELDS:
+            for name in attributes[field]:
+                bits[field][category_index[field][name], row] = True
+
+    files = {AGE_FILE: ages}
+    for field, matrix in bits.items():
+        files[BITMAP_FILE_TEMPLATE.format(field=field)] = np.packbits(matrix, axis=1)
+
+    logger.info(
+        f"Extracted metadata: {int((ages > 0).sum())}/{rows} rows with age, "
+        + ", ".join(f"{int(m.any(axis=0).sum())} with {field}" for field, m in bits.items())
+    )
+    return files, {field: list(categories) for field, categories in FIELDS.items()}
+
+
+def filters_from_query(query: str) -> Dict[str, Any]:
+    """
+    Derives filters from a researcher's free-text spec, e.g.
+    "B2B sales lead, 35-50" -> {"age": (35, 50), "profession": ["sales", ...]}.
+    """
+    lowered = query.lower()
+    filters: Dict[str, Any] = {}
+
+    for match in _AGE_RANGE_PATTERN.finditer(lowered):
+        if match.group(3) in _NON_AGE_UNITS:
+            continue
+        low, high = sorted((int(match.group(1)), int(match.group(2))))
+        if 14 <= low and high <= 99:
+            filters["age"] = (low, high)
+            break
+
+    professions = [name for name, pattern in _FIELD_PATTERNS["profession"].items() if pattern.search(lowered)]
+    if professions:
+        filters["profession"] = professions
+    return filters
+
+
+class PersonaMetadata:
+    """Read side of the metadata columns. Bitmaps are unpacked per filter call."""
+
+    def __init__(self, index_dir: str, rows: int, categories: Dict[str, List[str]]):
+        self.rows = rows
+        self.categories = categories
+        self.ages = np.load(os.path.join(index_dir, AGE_FILE), mmap_mode="r")
+        self.bitmaps = {
+            field: np.load(os.path.join(index_dir, BITMAP_FILE_TEMPLATE.format(field=field)), mmap_mode="r")
+            for field in categories
+        }
+
+    def mask(self, filters: Dict[str, Any]) -> np.ndarray:
+        """Boolean [rows] mask of rows matching all filters."""
+        mask = np.ones(self.rows, dtype=bool)
+        for field, value in filters.items():
+            if field == "age":
+                low, high = value
+                mask &= (self.ages >= low) & (self.ages <= high)
+                continue
+            if field not in self.bitmaps:
+                raise ValueError(f"Unknown metadata filter '{field}'. Known: age, {', '.join(self.bitmaps)}")
+
+            names = [value] if isinstance(value, str) else list(value)
+            field_mask = np.zeros(self.rows, dtype=bool)
+            for name in names:
+                position = self.categories[field].index(name)
+                field_mask |= np.unpackbits(self.bitmaps[field][position], count=self.rows).astype(bool)
+            mask &= field_mask
+        return mask
+
+    def close(self):
+        """Drops the mappings of the columns."""
+        self.ages = None
+        self.bitmaps = {}
+
+
+def open_metadata(index_dir: str, rows: int, info: Optional[Dict[str, List[str]]]) -> Optional[PersonaMetadata]:
+    if not info:
+        return None
+    return PersonaMetadata(index_dir, rows, info)
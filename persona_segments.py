@@ -0,0 +1,328 @@
+"""
+Append-only store of enriched persona dossiers (RichPersona) and the
+embeddings of the search queries they were enriched for.
+
+    persona_segments/
+        seg-<id>/      - one segment per recruiter run, written once
+        base-<id>/     - compacted segments
+            manifest.json    - embedding setup, dims, rows
+            embeddings.npy   - float32 [rows x dims], unit length
+            dossiers.jsonl   - {"query", "context", "persona", "quality", "created"} per row
+
+A segment directory is written under a temporary name and renamed into place,
+so readers only ever list complete segments and never need a lock. Before
+enriching a spec, the recruiter looks for a stored dossier whose query is close
+enough to the spec's query and reuses it instead of calling the LLM. A dossier
+describes the persona in the light of one startup idea (company context, pains),
+so it is only reused for the idea it was enriched for: `context_key` of the idea
+is stored with it and must match.
+
+Every run adds one small segment. Once COMPACT_AFTER of them pile up, a
+background thread merges all segments into a single base segment: near-
+identical dossiers are collapsed (the higher-quality one is kept), and the
+merged segments are then deleted.
+"""
+
+import os
+import json
+import time
+import hashlib
+import shutil
+import itertools
+import threading
+import logging
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+SEGMENTS_DIR = os.environ.get("PERSONA_SEGMENTS_DIR", "persona_segments")
+# Cosine similarity between spec queries above which a stored dossier is reused (> 1 disables reuse)
+REUSE_THRESHOLD = float(os.environ.get("PERSONA_REUSE_THRESHOLD", "0.92"))
+# Dossiers with fewer filled fields are not stored
+MIN_QUALITY = 0.8
+# Small segments before a background compaction is started
+COMPACT_AFTER = int(os.environ.get("PERSONA_COMPACT_AFTER", "8"))
+# Dossiers for near-identical queries collapse into one during compaction
+DUPLICATE_THRESHOLD = 0.98
+# A compaction lock older than this is considered abandoned
+LOCK_TIMEOUT_SECONDS = 600
+
+SEGMENT_PREFIX = "seg-"
+BASE_PREFIX = "base-"
+MANIFEST_FILE = "manifest.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+DOSSIERS_FILE = "dossiers.jsonl"
+LOCK_FILE = "compact.lock"
+
+
+def dossier_quality(persona: Dict[str, Any]) -> float:
+    """Share of filled fields (non-empty strings and lists, positive numbers)."""
+    if not persona:
+        return 0.0
+    filled = 0
+    for value in persona.values():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            filled += value > 0
+        else:
+            filled += bool(value)
+    return filled / len(persona)
+
+
+def context_key(text: str) -> str:
+    """Short stable key of what a dossier was enriched for (the startup idea)."""
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()[:16]
+
+
+def provider_signature(provider) -> Dict[str, Any]:
+    """What must match for stored query embeddings to be comparable with new ones."""
+    return {
+        "embedding_backend": provider.backend,
+        "embedding_model": provider.model,
+        "embedding_params": provider.params(),
+    }
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+_sequence = itertools.count()
+
+
+def _segment_id() -> str:
+    """Sorts by creation time; pid and sequence keep ids unique across and within processes."""
+    now = time.time()
+    return (time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+            + f"-{int(now * 1000) % 1000:03d}-{os.getpid()}-{next(_sequence):05d}")
+
+
+class _Segment:
+    def __init__(self, path: str):
+        with open(os.path.join(path, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        self.embeddings = np.load(os.path.join(path, EMBEDDINGS_FILE))
+        with open(os.path.join(path, DOSSIERS_FILE), 'r', encoding='utf-8') as f:
+            self.dossiers = [json.loads(line) for line in f if line.strip()]
+
+
+class SegmentStore:
+    """Dossier segments for one embedding setup. Thread-safe; safe to share across processes."""
+
+    def __init__(self, signature: Dict[str, Any], directory: str = SEGMENTS_DIR):
+        self.signature = signature
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._loaded: Dict[str, _Segment] = {}
+        self._compacting = False
+        self.reused = 0
+
+    def _names(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            name for name in os.listdir(self.directory)
+            if name.startswith((SEGMENT_PREFIX, BASE_PREFIX)) and not name.endswith(".tmp")
+        )
+
+    def _snapshot(self) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
+        """All matching dossiers and their query embeddings, loading new segments only."""
+        for _ in range(3):
+            names = self._names()
+            try:
+                with self._lock:
+                    for name in names:
+                        if name not in self._loaded:
+                            self._loaded[name] = _Segment(os.path.join(self.directory, name))
+                    segments = [self._loaded[name] for name in names]
+                    # Forget segments removed by a compaction
+                    self._loaded = dict(zip(names, segments))
+                break
+            except FileNotFoundError:
+                # Compacted away between listing and loading; its rows are in the new base
+                continue
+        else:
+            return np.zeros((0, 0), dtype=np.float32), []
+
+        segments = [s for s in segments if s.manifest.get("embedding") == self.signature and s.dossiers]
+        if not segments:
+            return np.zeros((0, 0), dtype=np.float32), []
+        return (
+            np.concatenate([s.embeddings for s in segments]),
+            [d for s in segments for d in s.dossiers],
+        )
+
+    def lookup(
+        self,
+        query_embeddings: np.ndarray,
+        context: str,
+        threshold: float = REUSE_THRESHOLD,
+    ) -> List[Optional[Tuple[Dict[str, Any], float]]]:
+        """
+        For every query, the best stored (persona, similarity) at or above
+        `threshold` among dossiers enriched for `context` (see `context_key`),
+        or None. A dossier is handed to at most one query per call.
+        """
+        matches: List[Optional[Tuple[Dict[str, Any], float]]] = [None] * len(query_embeddings)
+        embeddings, dossiers = self._snapshot()
+        rows = [i for i, d in enumerate(dossiers) if d.get("context") == context]
+        if not rows or threshold > 1.0 or not len(query_embeddings):
+            return matches
+        embeddings, dossiers = embeddings[rows], [dossiers[i] for i in rows]
+
+        similarity = _normalize(query_embeddings) @ embeddings.T  # [queries x dossiers]
+        # Strongest matches first, each dossier and each query used once
+        used = set()
+        for flat in np.argsort(similarity, axis=None)[::-1]:
+            q, d = np.unravel_index(flat, similarity.shape)
+            if similarity[q, d] < threshold:
+                break
+            if matches[q] is None and d not in used:
+                used.add(d)
+                matches[q] = (dossiers[d]["persona"], float(similarity[q, d]))
+        self.reused += sum(m is not None for m in matches)
+        return matches
+
+    def _write_segment(self, name: str, embeddings: np.ndarray, dossiers: List[Dict[str, Any]]):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = os.path.join(self.directory, name + ".tmp")
+        os.makedirs(tmp_path)
+        np.save(os.path.join(tmp_path, EMBEDDINGS_FILE), embeddings.astype(np.float32))
+        with open(os.path.join(tmp_path, DOSSIERS_FILE), 'w', encoding='utf-8') as f:
+            for dossier in dossiers:
+                f.write(json.dumps(dossier, ensure_ascii=False) + "\n")
+        with open(os.path.join(tmp_path, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump({
+                "embedding": self.signature,
+                "dims": int(embeddings.shape[1]),
+                "rows": len(dossiers),
+                "created": time.time(),
+            }, f, indent=2)
+        os.rename(tmp_path, os.path.join(self.directory, name))
+
+    def append(
+        self,
+        query_embeddings: np.ndarray,
+        queries: Sequence[str],
+        personas: Sequence[Dict[str, Any]],
+        context: str,
+    ) -> int:
+        """
+        Stores the dossiers enriched for `queries` under `context` (see `context_key`)
+        as a new segment. Returns the rows kept.
+        """
+        rows = [
+            i for i, persona in enumerate(personas)
+            if dossier_quality(persona) >= MIN_QUALITY
+        ]
+        if not rows:
+            return 0
+        now = time.time()
+        dossiers = [
+            {"query": queries[i], "context": context, "persona": personas[i],
+             "quality": dossier_quality(personas[i]), "created": now}
+            for i in rows
+        ]
+        self._write_segment(SEGMENT_PREFIX + _segment_id(), _normalize(np.asarray(query_embeddings)[rows]), dossiers)
+        logger.info(f"[Segments] Stored {len(rows)} dossiers ({len(personas) - len(rows)} below quality).")
+        return len(rows)
+
+    def _acquire_compaction(self) -> bool:
+        path = os.path.join(self.directory, LOCK_FILE)
+        try:
+            if time.time() - os.path.getmtime(path) > LOCK_TIMEOUT_SECONDS:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            return False
+
+    def compact(self) -> Optional[str]:
+        """
+        Merges every segment of this embedding setup into one new base segment,
+        collapsing near-duplicate dossiers. Returns the new base's name, or None
+        if there was nothing to do or another process is compacting.
+        """
+        if not os.path.isdir(self.directory) or not self._acquire_compaction():
+            return None
+        try:
+            loaded = [(name, _Segment(os.path.join(self.directory, name))) for name in self._names()]
+            loaded = [(name, s) for name, s in loaded if s.manifest.get("embedding") == self.signature]
+            if len(loaded) < 2:
+                return None
+            names = [name for name, _ in loaded]
+            segments = [s for _, s in loaded]
+            embeddings = np.concatenate([s.embeddings for s in segments])
+            dossiers = [d for s in segments for d in s.dossiers]
+
+            # Best first, then drop anything nearly identical to a kept dossier of the same idea
+            order = sorted(range(len(dossiers)), key=lambda i: (-dossiers[i]["quality"], -dossiers[i]["created"]))
+            kept_by_context: Dict[Optional[str], List[int]] = {}
+            for i in order:
+                same = kept_by_context.setdefault(dossiers[i].get("context"), [])
+                if not same or float(np.max(embeddings[same] @ embeddings[i])) < DUPLICATE_THRESHOLD:
+                    same.append(i)
+            kept = sorted(i for rows in kept_by_context.values() for i in rows)
+
+            base = BASE_PREFIX + _segment_id()
+            self._write_segment(base, embeddings[kept], [dossiers[i] for i in kept])
+            # The base is visible before its inputs disappear, so readers never miss a dossier
+            for name in names:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+            logger.info(f"[Segments] Compacted {len(names)} segments into {base}: "
+                        f"{len(dossiers)} -> {len(kept)} dossiers.")
+            return base
+        finally:
+            os.remove(os.path.join(self.directory, LOCK_FILE))
+
+    def maybe_compact(self) -> bool:
+        """Starts a background compaction once enough small segments exist. Returns True if started."""
+        small = sum(name.startswith(SEGMENT_PREFIX) for name in self._names())
+        with self._lock:
+            if small < COMPACT_AFTER or self._compacting:
+                return False
+            self._compacting = True
+
+        def _run():
+            try:
+                self.compact()
+            except Exception as e:
+                logger.error(f"[Segments] Compaction failed: {e}")
+            finally:
+                with self._lock:
+                    self._compacting = False
+
+        threading.Thread(target=_run, name="segment-compaction", daemon=True).start()
+        return True
+
+
+_stores: Dict[str, SegmentStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(provider, directory: str = SEGMENTS_DIR) -> SegmentStore:
+    """The process-wide store for `provider`'s embedding setup, so loaded segments are shared."""
+    signature = provider_signature(provider)
+    key = json.dumps([os.path.abspath(directory), signature], sort_keys=True)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = SegmentStore(signature, directory)
+        return store
+
+
+if __name__ == "__main__":
+    import index_registry
+    from embeddings import provider_for_index
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    # Manual compaction (e.g. from cron), for the embedding setup of the live index
+    index = index_registry.get_index()
+    result = get_store(provider_for_index(index.manifest, index.index_dir)).compact()
+    print(f"Compacted into {result}" if result else "Nothing to compact.")
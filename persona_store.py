@@ -0,0 +1,189 @@
+"""
+Columnar persona store: every field of the source records (e.g. "input persona",
+"synthesized text") is kept as its own string column next to the index:
+
+    col_<name>.bin          - UTF-8 values concatenated back-to-back
+    col_<name>.offsets.npy  - int64 byte offsets into the blob ([rows + 1])
+
+The manifest maps field names to column names ("columns"). Columns are opened
+on first access and memory-mapped, and values are decoded only for the rows
+asked for, so a search that returns k personas touches k slices of the blobs
+and nothing else. Values are stored as strings (other JSON values are
+serialized); a field a record lacks reads back as "".
+"""
+
+import os
+import re
+import json
+import mmap
+import threading
+import logging
+import numpy as np
+from array import array
+from typing import Any, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+COLUMN_BLOB_TEMPLATE = "col_{}.bin"
+COLUMN_OFFSETS_TEMPLATE = "col_{}.offsets.npy"
+
+
+class StringColumn:
+    """Read-only sequence of strings over a blob and its offsets."""
+
+    def __init__(self, path: str, offsets: np.ndarray):
+        self._offsets = offsets
+        self._file = open(path, 'rb')
+        # mmap refuses zero-length files, an empty column simply has no blob
+        self._blob = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if offsets[-1] > 0 else b""
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, row: int) -> str:
+        return self._blob[int(self._offsets[row]):int(self._offsets[row + 1])].decode('utf-8')
+
+    def __iter__(self):
+        return (self[row] for row in range(len(self)))
+
+    def take(self, rows: Sequence[int]) -> List[str]:
+        return [self[int(r)] for r in rows]
+
+    def close(self):
+        if isinstance(self._blob, mmap.mmap):
+            self._blob.close()
+        self._file.close()
+
+
+def open_column(directory: str, name: str) -> StringColumn:
+    offsets = np.load(os.path.join(directory, COLUMN_OFFSETS_TEMPLATE.format(name)), mmap_mode="r")
+    return StringColumn(os.path.join(directory, COLUMN_BLOB_TEMPLATE.format(name)), offsets)
+
+
+class StringColumnWriter:
+    """Appends strings to `<path>.tmp`; `finish` moves the blob into place and returns the offsets."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path + ".tmp", 'wb')
+        self.offsets = array('q', [0])
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def append(self, value: str):
+        encoded = value.encode('utf-8')
+        self._file.write(encoded)
+        self.offsets.append(self.offsets[-1] + len(encoded))
+
+    def pad_to(self, rows: int):
+        """Empty values up to `rows` (for rows written before the field first appeared)."""
+        missing = rows - len(self)
+        if missing > 0:
+            self.offsets.extend([self.offsets[-1]] * missing)
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self.path + ".tmp"):
+            os.remove(self.path + ".tmp")
+
+    def finish(self) -> np.ndarray:
+        self._file.close()
+        os.replace(self.path + ".tmp", self.path)
+        return np.frombuffer(self.offsets, dtype=np.int64)
+
+
+def _column_name(field: str, taken: Sequence[str]) -> str:
+    base = re.sub(r"[^a-z0-9]+", "_", field.lower()).strip("_") or "field"
+    name, n = base, 1
+    while name in taken:
+        n += 1
+        name = f"{base}_{n}"
+    return name
+
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return ""
+    return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+
+
+class ColumnStoreWriter:
+    """Splits records into one StringColumnWriter per field, discovering fields as they appear."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.rows = 0
+        self._columns: Dict[str, str] = {}
+        self._writers: Dict[str, StringColumnWriter] = {}
+
+    def append(self, records: Sequence[Dict[str, Any]]):
+        for record in records:
+            for field, value in record.items():
+                writer = self._writers.get(field)
+                if writer is None:
+                    name = _column_name(field, list(self._columns.values()))
+                    self._columns[field] = name
+                    writer = self._writers[field] = StringColumnWriter(
+                        os.path.join(self.directory, COLUMN_BLOB_TEMPLATE.format(name))
+                    )
+                writer.pad_to(self.rows)
+                writer.append(_cell(value))
+            self.rows += 1
+
+    def skip(self, rows: int):
+        """Rows without a record (all fields empty)."""
+        self.rows += rows
+
+    def abort(self):
+        for writer in self._writers.values():
+            writer.abort()
+
+    def finish(self) -> Dict[str, str]:
+        """Writes the blobs and offsets; returns the manifest entry {field: column name}."""
+        for field, writer in self._writers.items():
+            writer.pad_to(self.rows)
+            offsets = writer.finish()
+            path = os.path.join(self.directory, COLUMN_OFFSETS_TEMPLATE.format(self._columns[field]))
+            with open(path + ".tmp", 'wb') as f:
+                np.save(f, offsets)
+            os.replace(path + ".tmp", path)
+        return dict(self._columns)
+
+
+class PersonaStore:
+    """Lazy reader for the record columns of an index directory."""
+
+    def __init__(self, directory: str, columns: Optional[Dict[str, str]], rows: int):
+        self.directory = directory
+        self.rows = rows
+        self._names = columns or {}
+        self._open: Dict[str, StringColumn] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def fields(self) -> List[str]:
+        return list(self._names)
+
+    def column(self, field: str) -> StringColumn:
+        if field not in self._names:
+            raise KeyError(f"No column '{field}' (columns: {', '.join(self._names) or 'none'})")
+        with self._lock:
+            column = self._open.get(field)
+            if column is None:
+                column = self._open[field] = open_column(self.directory, self._names[field])
+                if len(column) != self.rows:
+                    raise ValueError(f"Column '{field}' has {len(column)} rows, the index has {self.rows}.")
+        return column
+
+    def records(self, rows: Sequence[int], fields: Optional[Sequence[str]] = None) -> List[Dict[str, str]]:
+        """The given rows as {field: value} dicts, reading only `fields` (default: all)."""
+        fields = self.fields if fields is None else list(fields)
+        values = {field: self.column(field).take(rows) for field in fields}
+        return [{field: values[field][i] for field in fields} for i in range(len(rows))]
+
+    def close(self):
+        with self._lock:
+            for column in self._open.values():
+                column.close()
+            self._open = {}
@@ -0,0 +1,193 @@
+"""
+Compressed embedding codes for the persona index.
+
+Two schemes, both scored with numpy only:
+
+    int8  - per-dimension affine scalar quantization, 1 byte per dimension (4x smaller)
+    pq    - product quantization, 1 byte per sub-vector of PQ_SUBVECTOR_DIMS dims
+            (16x smaller with the default of 4 dims per sub-vector)
+
+Codes are loaded into RAM and scored first. The best candidates are then
+re-scored against the full-precision vectors, which stay memory-mapped on disk,
+so only the few re-ranked rows are ever paged in.
+
+Files written next to the embeddings in the index directory:
+
+    quant_codes.npy          - int8 [rows x dims] or uint8 [rows x m]
+    quant_scale.npy          - float32 [dims]           (int8 only)
+    quant_offset.npy         - float32 [dims]           (int8 only)
+    pq_codebooks.npy         - float32 [m x 256 x dsub] (pq only)
+"""
+
+import os
+import logging
+import numpy as np
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CODES_FILE = "quant_codes.npy"
+SCALE_FILE = "quant_scale.npy"
+OFFSET_FILE = "quant_offset.npy"
+CODEBOOKS_FILE = "pq_codebooks.npy"
+
+PQ_SUBVECTOR_DIMS = 4
+PQ_CENTROIDS = 256
+PQ_TRAIN_SAMPLE = 50000
+PQ_ITERATIONS = 15
+
+# How many code-scored candidates are re-ranked exactly per requested result
+RERANK_FACTOR = 10
+RERANK_MIN = 50
+
+SCORE_CHUNK_ROWS = 16384
+
+
+class ScalarInt8Quantizer:
+    """x ~= (code + 128) * scale + offset, per dimension."""
+
+    type = "int8"
+
+    def __init__(self, codes: np.ndarray, scale: np.ndarray, offset: np.ndarray):
+        self.codes = codes
+        self.scale = scale
+        self.offset = offset
+
+    @classmethod
+    def train_encode(cls, embeddings: np.ndarray) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+        lo = np.asarray(embeddings.min(axis=0), dtype=np.float32)
+        hi = np.asarray(embeddings.max(axis=0), dtype=np.float32)
+        scale = (hi - lo) / 255.0
+        scale[scale == 0] = 1.0
+
+        codes = np.empty(embeddings.shape, dtype=np.int8)
+        for start in range(0, len(embeddings), SCORE_CHUNK_ROWS):
+            chunk = np.asarray(embeddings[start:start + SCORE_CHUNK_ROWS], dtype=np.float32)
+            levels = np.clip(np.rint((chunk - lo) / scale), 0, 255)
+            codes[start:start + len(chunk)] = (levels - 128).astype(np.int8)
+
+        files = {CODES_FILE: codes, SCALE_FILE: scale, OFFSET_FILE: lo}
+        return files, {"type": cls.type}
+
+    @classmethod
+    def load(cls, index_dir: str) -> "ScalarInt8Quantizer":
+        return cls(
+            np.load(os.path.join(index_dir, CODES_FILE)),
+            np.load(os.path.join(index_dir, SCALE_FILE)),
+            np.load(os.path.join(index_dir, OFFSET_FILE)),
+        )
+
+    def score(self, queries: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Approximate dot products [queries x rows] computed from the codes."""
+        codes = self.codes if rows is None else self.codes[rows]
+        scaled = queries * self.scale
+        # q . x = (q * scale) . code + 128 * sum(q * scale) + q . offset
+        bias = 128.0 * scaled.sum(axis=1) + queries @ self.offset
+
+        out = np.empty((len(queries), len(codes)), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_CHUNK_ROWS):
+            chunk = codes[start:start + SCORE_CHUNK_ROWS].astype(np.float32)
+            out[:, start:start + len(chunk)] = scaled @ chunk.T
+        return out + bias[:, None]
+
+
+def _kmeans(vectors: np.ndarray, k: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    """Plain (Euclidean) Lloyd k-means used to train one PQ codebook."""
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _nearest(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        counts = np.bincount(labels, minlength=k)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    # ||v - c||^2 = ||v||^2 - 2 v.c + ||c||^2; ||v||^2 does not change the argmin
+    distances = (centroids ** 2).sum(axis=1) - 2.0 * (vectors @ centroids.T)
+    return np.argmin(distances, axis=1)
+
+
+class ProductQuantizer:
+    """Splits vectors into m sub-vectors, each encoded as one of 256 codebook entries."""
+
+    type = "pq"
+
+    def __init__(self, codes: np.ndarray, codebooks: np.ndarray):
+        self.codes = codes
+        self.codebooks = codebooks
+
+    @property
+    def m(self) -> int:
+        return self.codebooks.shape[0]
+
+    @classmethod
+    def train_encode(
+        cls,
+        embeddings: np.ndarray,
+        subvector_dims: int = PQ_SUBVECTOR_DIMS,
+        seed: int = 0,
+    ) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+        rows, dims = embeddings.shape
+        if dims % subvector_dims:
+            raise ValueError(f"{dims} dims cannot be split into sub-vectors of {subvector_dims}.")
+        m = dims // subvector_dims
+        k = min(PQ_CENTROIDS, rows)
+
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(rows, size=min(rows, PQ_TRAIN_SAMPLE), replace=False))
+        sample = np.asarray(embeddings[sample_rows], dtype=np.float32).reshape(-1, m, subvector_dims)
+
+        logger.info(f"Training PQ codebooks: {m} sub-vectors x {k} centroids...")
+        codebooks = np.stack([_kmeans(sample[:, j], k, PQ_ITERATIONS, rng) for j in range(m)]).astype(np.float32)
+
+        codes = np.empty((rows, m), dtype=np.uint8)
+        for start in range(0, rows, SCORE_CHUNK_ROWS):
+            chunk = np.asarray(embeddings[start:start + SCORE_CHUNK_ROWS], dtype=np.float32)
+            chunk = chunk.reshape(len(chunk), m, subvector_dims)
+            for j in range(m):
+                codes[start:start + len(chunk), j] = _nearest(chunk[:, j], codebooks[j])
+
+        files = {CODES_FILE: codes, CODEBOOKS_FILE: codebooks}
+        return files, {"type": cls.type, "m": int(m), "subvector_dims": int(subvector_dims)}
+
+    @classmethod
+    def load(cls, index_dir: str) -> "ProductQuantizer":
+        return cls(
+            np.load(os.path.join(index_dir, CODES_FILE)),
+            np.load(os.path.join(index_dir, CODEBOOKS_FILE)),
+        )
+
+    def score(self, queries: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Asymmetric distance computation: per-query lookup tables summed over sub-vectors."""
+        codes = self.codes if rows is None else self.codes[rows]
+        m, k, dsub = self.codebooks.shape
+        # tables[q, j, c] = query sub-vector j . codebook entry c
+        tables = np.einsum('qjd,jcd->qjc', queries.reshape(len(queries), m, dsub), self.codebooks)
+
+        out = np.empty((len(queries), len(codes)), dtype=np.float32)
+        sub_index = np.arange(m)
+        for start in range(0, len(codes), SCORE_CHUNK_ROWS):
+            chunk = codes[start:start + SCORE_CHUNK_ROWS]
+            for qi in range(len(queries)):
+                out[qi, start:start + len(chunk)] = tables[qi][sub_index, chunk].sum(axis=1)
+        return out
+
+
+QUANTIZERS = {
+    ScalarInt8Quantizer.type: ScalarInt8Quantizer,
+    ProductQuantizer.type: ProductQuantizer,
+}
+
+
+def load_quantizer(index_dir: str, info: Optional[Dict[str, Any]]):
+    """Opens the quantizer described by the manifest entry, or None."""
+    if not info:
+        return None
+    return QUANTIZERS[info["type"]].load(index_dir)
+
+
+def rerank_size(limit: int) -> int:
+    return max(limit * RERANK_FACTOR, RERANK_MIN)
@@ -0,0 +1,150 @@
+"""
+Token-bucket rate limiting for provider API calls.
+
+    TokenBucket   - refills at `rate` units per second up to `capacity`
+    RateLimiter   - requests-per-minute and tokens-per-minute buckets, plus
+                    adaptive backoff: a 429 halves the allowed rate and pauses
+                    all callers, successes restore the rate step by step
+
+All classes are thread-safe. `reserve` never blocks (it returns how long the
+caller has to wait), so the same buckets can be awaited from asyncio code.
+"""
+
+import time
+import random
+import threading
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Multiplicative decrease on a 429, additive-ish recovery per success
+BACKOFF_FACTOR = 0.5
+RECOVERY_FACTOR = 1.05
+MIN_RATE_FRACTION = 0.05
+# Pause after a 429: base * 2^(consecutive 429s - 1), capped, with jitter
+BACKOFF_BASE_SECONDS = 2.0
+BACKOFF_MAX_SECONDS = 60.0
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) used for TPM budgeting."""
+    return max(1, len(text) // 4)
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """True for HTTP 429 / quota errors of the Google and OpenAI SDKs."""
+    if getattr(error, "code", None) == 429 or getattr(error, "status_code", None) == 429:
+        return True
+    if type(error).__name__ in ("ResourceExhausted", "TooManyRequests", "RateLimitError"):
+        return True
+    return "429" in str(error)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float = 1.0) -> float:
+        """
+        Takes `amount` units and returns the seconds to wait before using them.
+        The bucket may go into debt, so later callers queue up behind this one.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # A request larger than the bucket only waits for a full bucket
+            amount = min(amount, self.capacity)
+            self._tokens -= amount
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self, amount: float = 1.0):
+        wait = self.reserve(amount)
+        if wait > 0:
+            time.sleep(wait)
+
+    def refund(self, amount: float = 1.0):
+        """Gives back a reservation that will not be used."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens + min(amount, self.capacity))
+
+    def set_rate(self, rate: float):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+
+
+class RateLimiter:
+    """Requests-per-minute plus optional tokens-per-minute limit for one provider/model."""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: Optional[float] = None, name: str = "api"):
+        self.name = name
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.fraction = 1.0
+
+        # Capacity of one second's worth avoids a burst of a whole minute at start
+        self.requests = TokenBucket(requests_per_minute / 60.0, capacity=max(1.0, requests_per_minute / 60.0))
+        self.tokens = (
+            TokenBucket(tokens_per_minute / 60.0, capacity=max(1.0, tokens_per_minute / 60.0))
+            if tokens_per_minute else None
+        )
+
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+        self._consecutive_limits = 0
+        self.rate_limited = 0
+
+    def reserve(self, tokens: int = 0) -> float:
+        """Seconds the caller must wait before sending a request of `tokens` tokens."""
+        with self._lock:
+            pause = max(0.0, self._paused_until - time.monotonic())
+        wait = self.requests.reserve(1)
+        if self.tokens is not None and tokens:
+            wait = max(wait, self.tokens.reserve(tokens))
+        return max(wait, pause)
+
+    def acquire(self, tokens: int = 0):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    def refund(self, tokens: int = 0):
+        """Returns a `reserve(tokens)` whose request was never sent (e.g. cancelled while waiting)."""
+        self.requests.refund(1)
+        if self.tokens is not None and tokens:
+            self.tokens.refund(tokens)
+
+    def _apply_fraction(self):
+        self.requests.set_rate(self.requests_per_minute / 60.0 * self.fraction)
+        if self.tokens is not None:
+            self.tokens.set_rate(self.tokens_per_minute / 60.0 * self.fraction)
+
+    def on_rate_limited(self) -> float:
+        """Records a 429: lowers the rate and pauses every caller. Returns the pause."""
+        with self._lock:
+            self.rate_limited += 1
+            self._consecutive_limits += 1
+            self.fraction = max(MIN_RATE_FRACTION, self.fraction * BACKOFF_FACTOR)
+            self._apply_fraction()
+            pause = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (self._consecutive_limits - 1))
+            pause *= random.uniform(0.8, 1.2)
+            self._paused_until = max(self._paused_until, time.monotonic() + pause)
+        logger.warning(f"[RateLimiter:{self.name}] 429 received, rate at {self.fraction:.0%}, pausing {pause:.1f}s")
+        return pause
+
+    def on_success(self):
+        with self._lock:
+            self._consecutive_limits = 0
+            if self.fraction < 1.0:
+                self.fraction = min(1.0, self.fraction * RECOVERY_FACTOR)
+                self._apply_fraction()
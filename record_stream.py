@@ -0,0 +1,263 @@
+"""
+Streaming reader/writer for persona datasets.
+
+Records are dicts, stored one JSON object per line (JSONL). A dataset path may be
+
+    data.jsonl         - a single JSONL file
+    data/              - a directory of JSONL shards (part-00000.jsonl, ...),
+                         read in name order
+    data.json          - a legacy JSON array, parsed incrementally
+
+Every stage of the ingestion pipeline reads and writes through these helpers,
+so memory stays constant in the number of records.
+"""
+
+import os
+import json
+import logging
+from collections import deque
+from concurrent.futures import Executor
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SHARD_TEMPLATE = "part-{:05d}.jsonl"
+READ_CHUNK_CHARS = 1 << 20
+# Candidate persona text fields, in order of preference
+PERSONA_FIELDS = ['persona', 'input_persona', 'synthesized_text', 'text', 'instruction']
+# Leading records inspected to pick a dataset's persona field
+FIELD_SAMPLE_SIZE = 50000
+
+
+def _iter_json_array(f) -> Iterator[Any]:
+    """Yields the elements of a top-level JSON array without loading the whole file."""
+    decoder = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+
+    def _fill() -> bool:
+        nonlocal buf, pos, eof
+        chunk = f.read(READ_CHUNK_CHARS)
+        if not chunk:
+            eof = True
+            return False
+        buf, pos = buf[pos:] + chunk, 0
+        return True
+
+    def _skip(chars: str):
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in chars:
+                pos += 1
+            if pos < len(buf) or not _fill():
+                return
+
+    _skip(" \t\r\n")
+    if pos >= len(buf) or buf[pos] != "[":
+        raise ValueError(f"{f.name}: expected a JSON array")
+    pos += 1
+
+    while True:
+        _skip(" \t\r\n,")
+        if pos >= len(buf):
+            raise ValueError(f"{f.name}: unterminated JSON array")
+        if buf[pos] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            # The element continues past the buffer (or the file is broken)
+            if eof or not _fill():
+                raise
+            continue
+        yield item
+        pos = end
+
+
+def shard_paths(path: str) -> List[str]:
+    """The files that make up a dataset path, in read order."""
+    if os.path.isdir(path):
+        return [
+            os.path.join(path, name)
+            for name in sorted(os.listdir(path))
+            if name.endswith(".jsonl") or name.endswith(".json")
+        ]
+    return [path]
+
+
+def read_records(path: str, limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Yields records from a JSONL file, a directory of shards or a legacy JSON array."""
+    def _records():
+        for shard in shard_paths(path):
+            with open(shard, 'r', encoding='utf-8') as f:
+                if shard.endswith(".json"):
+                    yield from _iter_json_array(f)
+                    continue
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+    return islice(_records(), limit) if limit else _records()
+
+
+def read_lines(path: str, limit: Optional[int] = None) -> Iterator[str]:
+    """
+    Yields each record as its JSON text, without parsing JSONL input. Lets
+    worker processes do the parsing (legacy JSON arrays are re-serialized).
+    """
+    def _lines():
+        for shard in shard_paths(path):
+            with open(shard, 'r', encoding='utf-8') as f:
+                if shard.endswith(".json"):
+                    for item in _iter_json_array(f):
+                        yield json.dumps(item, ensure_ascii=False)
+                    continue
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        yield line
+
+    return islice(_lines(), limit) if limit else _lines()
+
+
+def detect_persona_field(records: Iterable[Dict[str, Any]]) -> Optional[str]:
+    """Try to identify the persona field."""
+    records = list(records)
+    for field in PERSONA_FIELDS:
+        if any(field in record for record in records):
+            return field
+    return None
+
+
+def dataset_persona_field(path: str, sample: int = FIELD_SAMPLE_SIZE) -> Optional[str]:
+    """
+    The persona field of a whole dataset, decided once from its first `sample`
+    records, so every stage reads the same field for every row.
+    """
+    return detect_persona_field(read_records(path, sample))
+
+
+def batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Groups an iterable into lists of `size` (the last one may be shorter)."""
+    items = iter(items)
+    while True:
+        batch = list(islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+def run_ordered(
+    jobs: Iterable[Any],
+    work: Callable[[Any], Any],
+    on_result: Callable[[Any, Any], None],
+    pool: Executor,
+    max_pending: int,
+):
+    """
+    Runs `work(job)` on `pool` (threads or processes) with at most `max_pending`
+    jobs read ahead, and calls `on_result(job, result)` on the calling thread in
+    input order. On the first failure no new jobs start, the running ones
+    finish (their side effects, e.g. checkpoints, are kept) and the error is raised.
+    """
+    jobs = iter(jobs)
+    in_flight = deque()
+
+    def _submit_next() -> bool:
+        for job in jobs:
+            in_flight.append((job, pool.submit(work, job)))
+            return True
+        return False
+
+    while len(in_flight) < max_pending and _submit_next():
+        pass
+
+    while in_flight:
+        job, future = in_flight.popleft()
+        try:
+            result = future.result()
+        except Exception:
+            for _, pending in in_flight:
+                pending.cancel()
+            raise
+        on_result(job, result)
+        _submit_next()
+
+
+class RecordWriter:
+    """
+    Writes records as JSONL. With `shard_size`, `path` is a directory and a new
+    shard starts every `shard_size` records. Each file is written under a
+    temporary name and renamed when complete, so readers never see a partial shard.
+    """
+
+    def __init__(self, path: str, shard_size: Optional[int] = None):
+        self.path = path
+        self.shard_size = shard_size
+        self.count = 0
+        self.bytes_written = 0
+        self._file = None
+        self._file_path = None
+        self._shard = 0
+        if shard_size:
+            os.makedirs(path, exist_ok=True)
+        elif os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def _open(self):
+        if self.shard_size:
+            self._file_path = os.path.join(self.path, SHARD_TEMPLATE.format(self._shard))
+            self._shard += 1
+        else:
+            self._file_path = self.path
+        self._file = open(self._file_path + ".tmp", 'w', encoding='utf-8')
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            os.replace(self._file_path + ".tmp", self._file_path)
+            self._file = None
+
+    def write(self, record: Dict[str, Any]):
+        self.write_line(json.dumps(record, ensure_ascii=False))
+
+    def write_line(self, line: str):
+        """Writes one record that is already serialized as a single line of JSON."""
+        if self._file is None:
+            self._open()
+        self._file.write(line + "\n")
+        self.bytes_written += len(line.encode('utf-8')) + 1
+        self.count += 1
+        if self.shard_size and self.count % self.shard_size == 0:
+            self._close_file()
+
+    def write_many(self, records: Iterable[Dict[str, Any]]) -> int:
+        for record in records:
+            self.write(record)
+        return self.count
+
+    def close(self):
+        if self._file is None and self.count == 0 and not self.shard_size:
+            # An empty dataset is still a (empty) file
+            self._open()
+        self._close_file()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self._file is not None:
+            # Leave no half-written shard behind
+            self._file.close()
+            os.remove(self._file_path + ".tmp")
+            self._file = None
+            return False
+        self.close()
+        return False
+
+
+def write_records(path: str, records: Iterable[Dict[str, Any]], shard_size: Optional[int] = None) -> RecordWriter:
+    """Writes all records and returns the closed writer (for its counters)."""
+    with RecordWriter(path, shard_size) as writer:
+        writer.write_many(records)
+    return writer
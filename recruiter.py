@@ -7,6 +7,8 @@ from google.api_core import retry
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel, Field
 
+from record_stream import read_records
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -63,13 +65,10 @@ class Recruiter:
         if not os.path.exists(self.personas_file):
             raise FileNotFoundError(f"Personas file not found: {self.personas_file}")
 
-        with open(self.personas_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-
-        # Assuming data is a list of dicts. 
+        # Records are streamed, the dataset is never held in memory as a whole.
         # We format each record to be descriptive for semantic search.
         with open(jsonl_file, "w", encoding="utf-8") as f:
-            for entry in data:
+            for entry in read_records(self.personas_file):
                 # Construct a single text block for the document
                 # Adjust fields based on actual structure of personas.json
                 # User said fields are: `input persona`, `synthesized text`
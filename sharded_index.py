@@ -0,0 +1,292 @@
+"""
+Sharded persona index: N ordinary index directories behind one manifest.
+
+    manifest.json      - {"shards": N, "shard_dirs": [...], rows, dims, embedding setup}
+    shard-000/ ...     - complete PersonaIndex directories (see persona_index.py)
+    hashing_idf.npy    - embedding provider state, shared by all shards
+
+Rows are dealt round-robin: global row r lives in shard r % N at local row
+r // N. Shards stay balanced without knowing the corpus size up front, and
+row ids map in both directions without a lookup table.
+
+Searches scatter to every shard on a thread pool (the matrix products and
+argpartitions run in numpy with the GIL released) and the per-shard top-k
+lists are merged with a heap. Each shard is memory-mapped on its own, so the
+corpus only has to fit on disk, not in RAM.
+
+Filters and hybrid search behave as on one index over all rows: whether the
+filters are too narrow (and ignored) is decided from the match count over all
+shards, BM25 is scored with document frequencies and lengths summed over the
+shards, and the merged vector and BM25 rankings are fused once.
+"""
+
+import os
+import json
+import heapq
+import shutil
+import logging
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from persona_index import (
+    PersonaIndex, IndexWriter, read_manifest, index_checksum, fuse_rankings, _replace_into, _save_npy,
+    FORMAT_VERSION, MANIFEST_FILE, HYBRID_DEPTH,
+)
+from lexical_index import combine_stats
+from index_versions import resolve_index_dir
+
+logger = logging.getLogger(__name__)
+
+SHARD_DIR_TEMPLATE = "shard-{:03d}"
+SEARCH_WORKERS = int(os.environ.get("SHARD_SEARCH_WORKERS", "0")) or (os.cpu_count() or 1)
+
+
+def is_sharded(manifest: Dict[str, Any]) -> bool:
+    return bool(manifest.get("shards"))
+
+
+class ShardedIndexWriter:
+    """
+    `IndexWriter` counterpart that deals appended rows across `shards` writers.
+    Takes the same options; provider state (`extra_files`) is written once, at the top.
+    """
+
+    def __init__(self, index_dir: str, shards: int, embedding_model: str, extra_files: Optional[Dict[str, np.ndarray]] = None,
+                 **options):
+        if shards < 1:
+            raise ValueError(f"Expected at least one shard, got {shards}.")
+        self.index_dir = index_dir
+        self.embedding_model = embedding_model
+        self.extra_files = extra_files or {}
+        self.options = options
+        self.rows = 0
+        self.shard_dirs = [SHARD_DIR_TEMPLATE.format(i) for i in range(shards)]
+        os.makedirs(index_dir, exist_ok=True)
+        self._writers = [
+            IndexWriter(os.path.join(index_dir, name), embedding_model, **options) for name in self.shard_dirs
+        ]
+
+    def append(
+        self,
+        embeddings: Sequence[Sequence[float]],
+        texts: Sequence[str],
+        records: Optional[Sequence[Dict[str, Any]]] = None,
+    ):
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        n = len(self._writers)
+        for offset in range(min(n, len(texts))):
+            # Batch position `offset` holds global row self.rows + offset, and every n-th after it
+            writer = self._writers[(self.rows + offset) % n]
+            writer.append(
+                matrix[offset::n],
+                texts[offset::n],
+                records[offset::n] if records is not None else None,
+            )
+        self.rows += len(texts)
+
+    def abort(self):
+        for writer in self._writers:
+            writer.abort()
+
+    def finish(self) -> Dict[str, Any]:
+        """Finishes every shard, then writes the top-level manifest (last, as for single indexes)."""
+        dims = next((w.dims for w in self._writers if w.dims is not None), None)
+        if dims is None:
+            self.abort()
+            raise ValueError("Cannot write an index without rows or known dimensions.")
+        shard_manifests = []
+        for writer in self._writers:
+            # Shards that received no rows still need their dimensions
+            writer.dims = writer.dims or dims
+            shard_manifests.append(writer.finish())
+
+        for name, extra in self.extra_files.items():
+            _replace_into(self.index_dir, name, _save_npy(extra))
+
+        # Shards of an earlier build with more shards are no longer referenced
+        for name in sorted(os.listdir(self.index_dir)):
+            if name.startswith("shard-") and name not in self.shard_dirs:
+                shutil.rmtree(os.path.join(self.index_dir, name), ignore_errors=True)
+
+        first = shard_manifests[0]
+        manifest = {
+            "format_version": FORMAT_VERSION,
+            "embedding_backend": first["embedding_backend"],
+            "embedding_model": self.embedding_model,
+            "embedding_params": first["embedding_params"],
+            "dims": int(dims),
+            "rows": int(self.rows),
+            "dtype": "float32",
+            "shards": len(self._writers),
+            "shard_dirs": self.shard_dirs,
+            "shard_rows": [m["rows"] for m in shard_manifests],
+            "checksum": index_checksum(self.index_dir),
+        }
+
+        def _write_manifest(path):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2)
+
+        _replace_into(self.index_dir, MANIFEST_FILE, _write_manifest)
+
+        logger.info(f"Wrote {self.rows} personas in {len(self._writers)} shards to {self.index_dir}")
+        return manifest
+
+
+class _ShardedVectors:
+    """`embeddings[rows]` over the shards (gathers the rows, keeps their order)."""
+
+    def __init__(self, index: "ShardedPersonaIndex"):
+        self._index = index
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return (len(self._index), self._index.dims)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __getitem__(self, rows) -> np.ndarray:
+        rows = np.asarray(rows, dtype=np.int64)
+        if rows.ndim == 0:
+            shard, local = self._index.locate(int(rows))
+            return self._index.shards[shard].embeddings[local]
+        out = np.empty((len(rows), self._index.dims), dtype=np.float32)
+        n = len(self._index.shards)
+        for shard in range(n):
+            positions = np.flatnonzero(rows % n == shard)
+            if len(positions):
+                out[positions] = self._index.shards[shard].embeddings[rows[positions] // n]
+        return out
+
+
+class ShardedPersonaIndex:
+    """Read-only view over the shards of a sharded index, with the PersonaIndex search API."""
+
+    def __init__(self, index_dir: str, workers: int = SEARCH_WORKERS):
+        self.index_dir = index_dir
+        self.manifest = read_manifest(index_dir)
+        self.shards = [PersonaIndex(os.path.join(index_dir, name)) for name in self.manifest["shard_dirs"]]
+        rows = sum(len(s) for s in self.shards)
+        if rows != self.manifest["rows"]:
+            raise ValueError(f"Index '{index_dir}' is inconsistent: shards hold {rows} rows, manifest says {self.manifest['rows']}.")
+        self.embeddings = _ShardedVectors(self)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, min(workers, len(self.shards))),
+                                        thread_name_prefix="shard-search")
+
+    def __len__(self) -> int:
+        return self.manifest["rows"]
+
+    @property
+    def dims(self) -> int:
+        return self.manifest["dims"]
+
+    @property
+    def embedding_model(self) -> str:
+        return self.manifest["embedding_model"]
+
+    def locate(self, row: int) -> Tuple[int, int]:
+        """(shard, local row) of a global row."""
+        return row % len(self.shards), row // len(self.shards)
+
+    def _global(self, shard: int, local: int) -> int:
+        return local * len(self.shards) + shard
+
+    def text(self, row: int) -> str:
+        shard, local = self.locate(int(row))
+        return self.shards[shard].text(local)
+
+    def texts(self, rows: Sequence[int]) -> List[str]:
+        return [self.text(r) for r in rows]
+
+    def records(self, rows: Sequence[int], fields: Optional[Sequence[str]] = None) -> List[Dict[str, str]]:
+        result = []
+        for row in rows:
+            shard, local = self.locate(int(row))
+            result.extend(self.shards[shard].records([local], fields))
+        return result
+
+    def search(
+        self,
+        query_embedding: np.ndarray,
+        limit: int,
+        nprobe: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> List[Tuple[int, float]]:
+        return self.search_batch(np.asarray(query_embedding)[None, :], limit, nprobe=nprobe, filters=filters)[0]
+
+    def search_batch(
+        self,
+        query_embeddings: np.ndarray,
+        limit: int,
+        nprobe: Optional[int] = None,
+        query_texts: Optional[Sequence[str]] = None,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> List[List[Tuple[int, float]]]:
+        """Top `limit` rows per query over all shards. See PersonaIndex.search_batch."""
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        masks = self._filter_masks(filters, limit) if filters else [None] * len(self.shards)
+        hybrid = query_texts is not None and all(
+            s.lexical is not None and s.lexical.supports_global_stats for s in self.shards
+        )
+        if query_texts is not None and not hybrid:
+            logger.warning(f"Index '{self.index_dir}' has shards without BM25 term statistics, searching by vectors only.")
+
+        if not hybrid:
+            futures = [
+                self._pool.submit(shard.search_vectors, queries, limit, nprobe, mask)
+                for shard, mask in zip(self.shards, masks)
+            ]
+            return self._merge([f.result() for f in futures], limit)
+
+        depth = max(limit, HYBRID_DEPTH)
+        stats = combine_stats([shard.lexical.stats(query_texts) for shard in self.shards])
+        futures = [
+            self._pool.submit(shard.hybrid_candidates, queries, query_texts, depth, nprobe, mask, stats)
+            for shard, mask in zip(self.shards, masks)
+        ]
+        candidates = [f.result() for f in futures]
+        vector_hits = self._merge([c[0] for c in candidates], depth)
+        lexical_hits = self._merge([c[1] for c in candidates], depth)
+        return [fuse_rankings(v, l, limit) for v, l in zip(vector_hits, lexical_hits)]
+
+    def _filter_masks(self, filters: Dict[str, Any], limit: int) -> List[Optional[np.ndarray]]:
+        """Per-shard row masks for `filters`, all None when the search should run unfiltered."""
+        masks = [shard.raw_filter_mask(filters) for shard in self.shards]
+        if any(mask is None for mask in masks):
+            return [None] * len(self.shards)
+        matched = sum(int(mask.sum()) for mask in masks)
+        if matched < limit:
+            logger.info(f"Filters {filters} match {matched} rows (< {limit}), searching unfiltered.")
+            return [None] * len(self.shards)
+        return masks
+
+    def _merge(self, per_shard: List[List[List[Tuple[int, float]]]], limit: int) -> List[List[Tuple[int, float]]]:
+        """Per query, the shards' hit lists as global rows, merged by descending score."""
+        results = []
+        for q in range(len(per_shard[0]) if per_shard else 0):
+            # Each shard's list is sorted by descending score already
+            ranked = (
+                [(self._global(shard, local), score) for local, score in hits[q]]
+                for shard, hits in enumerate(per_shard)
+            )
+            results.append(list(islice(heapq.merge(*ranked, key=lambda hit: -hit[1]), limit)))
+        return results
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        for shard in self.shards:
+            shard.close()
+
+
+def open_index(index_dir: str):
+    """
+    Opens `index_dir` as a PersonaIndex, or as a ShardedPersonaIndex if its
+    manifest lists shards. A versioned root opens its current version.
+    """
+    index_dir = resolve_index_dir(index_dir)
+    if is_sharded(read_manifest(index_dir)):
+        return ShardedPersonaIndex(index_dir)
+    return PersonaIndex(index_dir)
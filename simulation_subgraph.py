@@ -2,7 +2,8 @@ import os
 from typing import TypedDict, List, Literal
 from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, AIMessage
 from langgraph.graph import StateGraph, END, START
-from config import llm_generator, llm_critic
+from config import get_llm, profile_for
+from llm_cache import cached
 
 # --- 1. State Definition ---
 
@@ -53,6 +54,10 @@ USER_INSTRUCTION = """
 
 # --- 3. Nodes ---
 
+def _llm(role: str):
+    """Client for `role`, through the cache and the scheduler like the main graph's simulation."""
+    return cached(get_llm(profile_for(role)), "simulation")
+
 def researcher_node(state: InterviewState) -> InterviewState:
     print(f"   [Researcher] Thinking... (Step {state['step_count']})")
     
@@ -67,7 +72,7 @@ def researcher_node(state: InterviewState) -> InterviewState:
     
     prompt = [system_msg] + messages
     
-    response = llm_generator.invoke(prompt)
+    response = _llm("interviewer").invoke(prompt)
     
     return {
         "messages": [response],
@@ -88,7 +93,7 @@ def user_node(state: InterviewState) -> InterviewState:
     
     prompt = [system_msg] + messages
     
-    response = llm_critic.invoke(prompt)
+    response = _llm("persona").invoke(prompt)
     
     return {
         "messages": [response]
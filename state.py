@@ -1,4 +1,4 @@
-from typing import TypedDict, List, Optional, Literal, Annotated
+from typing import TypedDict, Dict, List, Optional, Literal, Annotated
 import operator
 from langchain_core.messages import BaseMessage
 from models import BusinessIdea, InterviewGuide, InterviewResult, ResearchReport, CritiqueFeedback
@@ -28,6 +28,7 @@ class GraphState(TypedDict):
     enable_simulation: bool
     enable_critic: bool
     use_fast_model: bool # Debug mode flag
+    model_profiles: Optional[Dict[str, str]] # Per-run role -> profile choice (see config.MODEL_PROFILES)
     num_personas: int # Number of interviews to run (1-3)
     interview_iterations: int # How many interview cycles before going to critic (default 1)
     current_interview_cycle: int # Current cycle counter (starts at 0, incremented by analyst)
@@ -0,0 +1,47 @@
+import json
+
+from dedup_personas import dedup_personas
+
+BASE = "retired accountant from Ohio who volunteers at the animal shelter and plays chess every weekend with friends"
+
+
+def _write(path, texts):
+    with open(path, 'w', encoding='utf-8') as f:
+        for text in texts:
+            f.write(json.dumps({"persona": text} if text is not None else {"other": 1}) + "\n")
+
+
+def _read(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_near_duplicates_collapse(tmp_path):
+    source, target = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    _write(source, [BASE, BASE + ".", "young nurse in Berlin who trains for marathons and paints watercolors"])
+    stats = dedup_personas(str(source), str(target))
+    assert stats["output"] == 2
+    assert [r["persona"] for r in _read(target)] == [BASE, "young nurse in Berlin who trains for marathons and paints watercolors"]
+
+
+def test_rows_without_text_are_kept(tmp_path):
+    source, target = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    _write(source, ["", None, "", "!!!", BASE])
+    stats = dedup_personas(str(source), str(target))
+    assert stats["output"] == 5
+    assert stats["clusters"] == 0
+
+
+def test_field_is_detected_once_per_dataset(tmp_path):
+    # The same field filter_personas.py keeps rows on, even where another candidate is present
+    source, target = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    records = [
+        {"persona": BASE, "input persona": "young nurse in Berlin who trains for marathons"},
+        {"persona": BASE + ".", "input persona": "night-shift baker in Lyon who restores old motorbikes"},
+        {"text": BASE},
+    ]
+    with open(source, 'w', encoding='utf-8') as f:
+        f.writelines(json.dumps(r) + "\n" for r in records)
+    stats = dedup_personas(str(source), str(target))
+    assert stats["output"] == 2
+    assert _read(target) == [records[0], records[2]]
@@ -0,0 +1,36 @@
+import os
+
+import numpy as np
+
+import index_registry
+from index_versions import list_versions, new_version_dir, prune, publish
+from persona_index import write_index
+
+
+def _publish_version(root: str, rows: int = 8) -> str:
+    path = new_version_dir(root)
+    rng = np.random.default_rng(rows)
+    write_index(path, rng.normal(size=(rows, 4)), [f"persona {i}" for i in range(rows)], "m", ann="none")
+    version = os.path.basename(path)
+    publish(root, version)
+    return version
+
+
+def test_prune_keeps_leased_versions(tmp_path):
+    root = str(tmp_path / "index")
+    first = _publish_version(root)
+
+    index = index_registry.acquire(root)
+    try:
+        second = _publish_version(root)
+        prune(root, keep=1)
+        # Still leased: its files stay readable
+        assert list_versions(root) == [first, second]
+        assert index.text(0) == "persona 0"
+        # The next lookup swaps to the new version, the old one closes with the lease
+        assert index_registry.get_index(root).index_dir.endswith(second)
+    finally:
+        index_registry.release(index)
+
+    prune(root, keep=1)
+    assert list_versions(root) == [second]
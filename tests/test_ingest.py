@@ -0,0 +1,16 @@
+import index_registry
+from ingest import Fingerprints
+from test_index_versions import _publish_version
+
+
+def test_leasing_the_index_keeps_its_fingerprint(tmp_path):
+    root = str(tmp_path / "index")
+    _publish_version(root)
+    fingerprints = Fingerprints({})
+    before = fingerprints.path(root)
+
+    with index_registry.lease(root):
+        assert fingerprints.path(root) == before
+
+    _publish_version(root, rows=12)
+    assert fingerprints.path(root) != before
@@ -0,0 +1,31 @@
+import pytest
+
+from persona_metadata import extract_age, filters_from_query
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("B2B sales lead, 35-50", (35, 50)),
+    ("veterinarian aged 35-50 who likes gardening", (35, 50)),
+    ("teachers 25 to 40 living in Berlin", (25, 40)),
+    ("nurses 30-45 years old", (30, 45)),
+    ("parents 28–42 with young kids", (28, 42)),
+])
+def test_age_range_with_trailing_prose(query, expected):
+    assert filters_from_query(query)["age"] == expected
+
+
+@pytest.mark.parametrize("query", [
+    "companies with 20-50 employees",
+    "discount of 30-40% on subscriptions",
+    "spends $10-20 a month on apps",
+    "budget 50-80k for tooling",
+    "runs 10-15 km every weekend",
+])
+def test_non_age_ranges_are_ignored(query):
+    assert "age" not in filters_from_query(query)
+
+
+def test_extract_age():
+    assert extract_age("A 34-year-old accountant") == 34
+    assert extract_age("Retired teacher in her late 60s") == 65
+    assert extract_age("Student") == 0
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from persona_index import PersonaIndex, write_index
+from sharded_index import ShardedIndexWriter, ShardedPersonaIndex
+
+WORDS = ["accountant", "veterinarian", "teacher", "nurse", "farmer", "gardening", "chess", "running", "retired", "student"]
+
+
+def _corpus(rows: int = 120, dims: int = 16):
+    rng = np.random.default_rng(7)
+    texts = []
+    for row in range(rows):
+        # Distinct lengths and word mixes keep BM25 scores free of ties
+        words = rng.choice(WORDS, size=3 + row % 11)
+        texts.append(f"aged {20 + row % 50} " + " ".join(words) + f" persona{row}" + " filler" * row)
+    embeddings = rng.normal(size=(rows, dims)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    records = [{"persona": t} for t in texts]
+    return embeddings, texts, records
+
+
+def assert_same_hits(actual, expected):
+    assert [[row for row, _ in hits] for hits in actual] == [[row for row, _ in hits] for hits in expected]
+    for got, want in zip(actual, expected):
+        assert [score for _, score in got] == pytest.approx([score for _, score in want], rel=1e-5)
+
+
+@pytest.fixture
+def indexes(tmp_path):
+    embeddings, texts, records = _corpus()
+    write_index(str(tmp_path / "flat"), embeddings, texts, "m", ann="none", records=records)
+    writer = ShardedIndexWriter(str(tmp_path / "sharded"), 3, "m", ann="none")
+    writer.append(embeddings, texts, records)
+    writer.finish()
+    flat, sharded = PersonaIndex(str(tmp_path / "flat")), ShardedPersonaIndex(str(tmp_path / "sharded"))
+    yield flat, sharded, embeddings
+    flat.close()
+    sharded.close()
+
+
+def test_hybrid_results_match_unsharded(indexes):
+    flat, sharded, embeddings = indexes
+    queries = embeddings[[3, 40, 77]] + 0.05
+    texts = ["veterinarian who likes gardening", "retired accountant", "chess student"]
+    assert_same_hits(sharded.search_batch(queries, 10, query_texts=texts), flat.search_batch(queries, 10, query_texts=texts))
+
+
+def test_vector_results_match_unsharded(indexes):
+    flat, sharded, embeddings = indexes
+    queries = embeddings[[5, 60]]
+    assert_same_hits(sharded.search_batch(queries, 10), flat.search_batch(queries, 10))
+
+
+def test_filter_fallback_is_decided_over_all_shards(indexes):
+    flat, sharded, embeddings = indexes
+    # Nine rows match overall, only three per shard: still enough for a filtered top 4
+    filters = {"age": (20, 22)}
+    hits = sharded.search_batch(embeddings[[10]], 4, filters=filters)
+    assert_same_hits(hits, flat.search_batch(embeddings[[10]], 4, filters=filters))
+    assert all((row % 50) <= 2 for row, _ in hits[0])
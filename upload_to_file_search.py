@@ -9,6 +9,8 @@ import time
 import logging
 from dotenv import load_dotenv
 
+from record_stream import read_records
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -21,7 +23,7 @@ def convert_to_jsonl(input_file: str, output_file: str) -> str:
     Each line contains: "input persona: ... synthesized text: ..."
     
     Args:
-        input_file: Path to input personas.json
+        input_file: Path to input personas.json (or JSONL / shard directory)
         output_file: Path to output JSONL file
     
     Returns:
@@ -29,18 +31,14 @@ def convert_to_jsonl(input_file: str, output_file: str) -> str:
     """
     logger.info(f"Converting {input_file} to JSONL format...")
     
-    with open(input_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    logger.info(f"Loaded {len(data)} personas")
-    
     # Create JSONL with descriptive text for semantic search
+    # Records are streamed (JSON array, JSONL or shard directory), one line out per record
+    count = 0
     with open(output_file, 'w', encoding='utf-8') as f:
-        for idx, entry in enumerate(data):
+        for entry in read_records(input_file):
             # Extract fields
             input_persona = entry.get("input persona", "")
             synthesized_text = entry.get("synthesized text", "")
-            description = entry.get("description", "")
             
             # Create a descriptive text block for semantic search
             # Format: Storing all info on one line for easy retrieval
@@ -48,10 +46,12 @@ def convert_to_jsonl(input_file: str, output_file: str) -> str:
             
             # Write as plain text (one persona per line)
             f.write(text_content + "\n")
+            count += 1
             
-            if (idx + 1) % 1000 == 0:
-                logger.info(f"Processed {idx + 1}/{len(data)} personas")
+            if count % 1000 == 0:
+                logger.info(f"Processed {count} personas")
     
+    logger.info(f"Converted {count} personas")
     logger.info(f"Created JSONL file: {output_file}")
     return output_file
 
@@ -1,4 +1,6 @@
 import re
+import asyncio
+import threading
 
 def extract_json_from_text(text: str):
     """
@@ -48,3 +50,27 @@ def save_artifact(folder_name: str, filename: str, content: str) -> str:
         print(f"   -> [Error Saving Artifact] {e}")
         return ""
 
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def run_sync(coro):
+    """
+    Runs a coroutine to completion from synchronous code (CLI, sync graph runs).
+    All such calls share one background event loop, so async LLM clients,
+    which bind their connections to a loop, keep working between calls.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="run-sync-loop", daemon=True).start()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is _loop:
+        coro.close()
+        raise RuntimeError("run_sync() called from its own event loop; await the coroutine instead.")
+    return asyncio.run_coroutine_threadsafe(coro, _loop).result()